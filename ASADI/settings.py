@@ -38,6 +38,7 @@ import os
 from pathlib import Path
 from decouple import config
 from django.contrib.messages import constants as messages
+from django.core.exceptions import ImproperlyConfigured
 import sys
 
 
@@ -204,10 +205,131 @@ from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 CHROMA_DB_DIR = BASE_DIR / "chroma_db"
+# ChromaDB : "persistent" (base embarquée dans CHROMA_DB_DIR) ou "server" (serveur Chroma
+# lancé par la commande chroma_server).
+# Limite du mode "server" : seules les collections sont servies par Chroma. La version de
+# l'index, le manifeste (et les pointeurs de génération), l'index BM25, les matrices de
+# recherche exacte, les caches persistants et le marqueur de l'index de documents restent
+# des fichiers locaux de CHROMA_DB_DIR. Tous les processus (ingestion, service de recherche,
+# vues) doivent donc partager ce dossier : même machine, ou même système de fichiers avec
+# verrous fcntl fonctionnels. Un serveur Chroma sur une autre machine n'est pas supporté.
+CHROMA_MODE = config("CHROMA_MODE", default="persistent")
+CHROMA_SERVER_HOST = config("CHROMA_SERVER_HOST", default="127.0.0.1")
+CHROMA_SERVER_PORT = config("CHROMA_SERVER_PORT", default=8001, cast=int)
+CHROMA_HTTP_POOL_SIZE = config("CHROMA_HTTP_POOL_SIZE", default=16, cast=int)  # connexions HTTP par processus
+CHROMA_COLLECTION_NAME = "asadi_collection"
+CHROMA_SOURCES_COLLECTION_NAME = "asadi_sources"  # centroïdes des documents (recherche hiérarchique)
+# Présent une fois l'index de documents construit en entier (commande index_documents ou démarrage du worker)
+DOCUMENT_INDEX_MARKER_PATH = CHROMA_DB_DIR / "index_documents_complet"
+# Manifeste des sources ingérées (empreintes et configuration) pour l'ingestion incrémentale
+INGESTION_MANIFEST_PATH = CHROMA_DB_DIR / "ingestion_manifest.json"
+# Cache persistant des embeddings de chunks (clé : modèle + empreinte du texte), borné en entrées
+EMBEDDING_CACHE_PATH = CHROMA_DB_DIR / "embedding_cache.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = 200_000
+# Index inversé BM25 persistant (recherche par mots-clés), mis à jour à chaque ingestion
+BM25_INDEX_PATH = CHROMA_DB_DIR / "bm25_index.sqlite3"
+# Version de l'index, incrémentée à chaque écriture dans la collection (invalide les caches de recherche)
+INDEX_VERSION_PATH = CHROMA_DB_DIR / "index_version"
+# Caches en mémoire des recherches répétées : embeddings des requêtes et résultats de hybrid_retrieve
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = 4096
+RETRIEVAL_CACHE_MAX_ENTRIES = 1024
+RETRIEVAL_CACHE_TTL = config("RETRIEVAL_CACHE_TTL", default=600, cast=int)  # secondes, 0 pour désactiver
+# Recherche : nombre de chunks transmis au LLM et constante de la fusion RRF (reciprocal rank fusion)
+RETRIEVAL_TOP_K = 4
+RRF_K = 60
+# Profils de recherche : étapes exécutées et budget de latence par requête (les étapes
+# optionnelles sont sautées lorsque leur coût moyen ne tient plus dans le budget restant)
+RETRIEVAL_PROFILES = {
+    "fast": {"branches": ["vector"], "rerank": False, "budget_ms": 500},
+    "balanced": {"branches": ["vector", "bm25"], "rerank": False, "budget_ms": 1000},
+    "accurate": {"branches": ["vector", "bm25"], "rerank": True, "budget_ms": 4000},
+}
+RETRIEVAL_DEFAULT_PROFILE = config("RETRIEVAL_DEFAULT_PROFILE", default="accurate")
+if RETRIEVAL_DEFAULT_PROFILE not in RETRIEVAL_PROFILES:
+    raise ImproperlyConfigured(
+        f"RETRIEVAL_DEFAULT_PROFILE={RETRIEVAL_DEFAULT_PROFILE!r} ; profils disponibles : {', '.join(RETRIEVAL_PROFILES)}"
+    )
+# Demi-vie (secondes) du coût estimé d'une étape qui n'est plus mesurée parce qu'elle est sautée
+RETRIEVAL_COST_HALF_LIFE = 30
+# Branches de recherche exécutées en parallèle : délai maximal de chaque branche, compté depuis
+# le début de son exécution (une branche trop lente est abandonnée sans faire échouer la requête)
+RETRIEVAL_BRANCH_TIMEOUTS_MS = {"vector": 3000, "bm25": 1500}
+# Threads du pool des branches : au moins 2 par requête simultanée (threads du service de recherche
+# ou du serveur Django), pour que les branches n'attendent pas dans la file du pool
+RETRIEVAL_BRANCH_WORKERS = config("RETRIEVAL_BRANCH_WORKERS", default=32, cast=int)
+# Recherche hiérarchique : recherche d'abord les documents les plus proches (centroïdes),
+# puis les chunks de ces seuls documents ; recherche à plat si l'index de documents est vide
+RETRIEVAL_HIERARCHICAL = config("RETRIEVAL_HIERARCHICAL", default=False, cast=bool)
+HIERARCHICAL_TOP_DOCUMENTS = 10
+# Routage des questions sans workspace : recherche limitée aux WORKSPACE_ROUTING_TOP workspaces
+# dont le centroïde est le plus proche (et à moins de WORKSPACE_ROUTING_MARGIN du meilleur).
+# Désactivé par défaut : il suppose l'index de documents construit (commande index_documents)
+# et peut écarter le workspace d'un document pertinent
+WORKSPACE_ROUTING = config("WORKSPACE_ROUTING", default=False, cast=bool)
+WORKSPACE_ROUTING_TOP = 3
+WORKSPACE_ROUTING_MARGIN = 0.15
+# Recherche vectorielle exacte (matrices .npy projetées en mémoire, partagées par les workers)
+# pour les workspaces d'au plus EXACT_SEARCH_MAX_CHUNKS chunks ; HNSW au-delà
+EXACT_SEARCH = config("EXACT_SEARCH", default=True, cast=bool)
+EXACT_SEARCH_DIR = CHROMA_DB_DIR / "exact_index"
+EXACT_SEARCH_MAX_CHUNKS = config("EXACT_SEARCH_MAX_CHUNKS", default=20000, cast=int)
+# "float32" ou "float16" (deux fois moins de mémoire, précision suffisante pour le classement)
+EXACT_SEARCH_DTYPE = config("EXACT_SEARCH_DTYPE", default="float32")
+# Reranking : candidats reclassés au maximum, écart de similarité cosinus (requête / chunk)
+# entre le moins proche des RETRIEVAL_TOP_K premiers candidats et le plus proche des suivants
+# au-delà duquel le cross-encoder est sauté (0 : toujours reclasser), cache persistant des scores.
+# Les scores RRF, trop resserrés, ne permettent pas ce test.
+RERANK_MAX_CANDIDATES = config("RERANK_MAX_CANDIDATES", default=20, cast=int)
+RERANK_SKIP_MARGIN = config("RERANK_SKIP_MARGIN", default=0.15, cast=float)
+RERANK_CACHE_PATH = CHROMA_DB_DIR / "rerank_cache.sqlite3"
+RERANK_CACHE_MAX_ENTRIES = 500_000
+
+# Modèles partagés (chargés à la demande par src.modeles)
+EMBEDDING_MODEL_NAME = "all-mpnet-base-v2"
+RERANKER_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Backend d'inférence des modèles : "torch" (PyTorch) ou "onnx" (ONNX Runtime, CPU)
+INFERENCE_BACKEND = config("INFERENCE_BACKEND", default="torch")
+ONNX_QUANTIZE = config("ONNX_QUANTIZE", default=True, cast=bool)  # quantification dynamique int8
+ONNX_THREADS = config("ONNX_THREADS", default=0, cast=int)  # 0 : choix automatique d'ONNX Runtime
+ONNX_MODELS_DIR = BASE_DIR / "onnx_models"
+# Micro-batching : regroupe les encodages/rerankings concurrents d'un processus en une passe.
+# Le regroupement se fait par processus : il n'est utile que si un processus sert plusieurs
+# requêtes à la fois (gunicorn --threads / workers gthread). Avec des workers synchrones, il
+# n'ajoute que la fenêtre d'attente. Le service de recherche (multi-thread) l'active toujours.
+MICRO_BATCHING = config("MICRO_BATCHING", default=False, cast=bool)
+MICRO_BATCH_WINDOW_MS = 5  # attente maximale pour compléter un lot
+MICRO_BATCH_MAX_ITEMS = 256  # éléments (textes ou couples) maximum par lot
+# Charger les modèles au démarrage du serveur WSGI (utile avec gunicorn --preload)
+WARMUP_MODELS = config("WARMUP_MODELS", default=False, cast=bool)
+# Service de recherche autonome (commande service_recherche) : "http://127.0.0.1:8765" ou
+# "unix:///chemin/recherche.sock". Vide : la recherche est exécutée dans le processus Django.
+RETRIEVAL_SERVICE_URL = config("RETRIEVAL_SERVICE_URL", default="")
+RETRIEVAL_SERVICE_TIMEOUT = config("RETRIEVAL_SERVICE_TIMEOUT", default=30, cast=float)  # secondes
+# Si le service est injoignable, exécuter la recherche localement plutôt que d'échouer
+RETRIEVAL_SERVICE_FALLBACK = config("RETRIEVAL_SERVICE_FALLBACK", default=True, cast=bool)
 
 # Niveau maximum global
 MAX_NIVEAU = 20
 
+# Ingestion : nombre de chunks encodés et insérés dans ChromaDB par lot
+INGESTION_BATCH_SIZE = 64
+# Ingestion multi-fichiers : processus d'extraction/segmentation (un par cœur par défaut ; à réduire
+# si la mémoire manque, chaque processus chargeant ses propres bibliothèques d'extraction/OCR)
+# et taille de la file vers l'embedding
+INGESTION_WORKERS = config("INGESTION_WORKERS", default=os.cpu_count() or 1, cast=int)
+# Démarrage des processus d'extraction : "spawn" (sûr) ou "forkserver" ; "fork" peut se bloquer
+# lorsque PyTorch/OpenMP ont déjà démarré leurs threads dans le processus parent
+INGESTION_START_METHOD = config("INGESTION_START_METHOD", default="spawn")
+INGESTION_QUEUE_SIZE = 8
+# Tâches d'ingestion : signe de vie du worker, délai au-delà duquel une tâche « en cours »
+# est considérée abandonnée (remise en attente) et nombre maximum de tentatives
+INGESTION_HEARTBEAT_SECONDS = 30
+INGESTION_LEASE_SECONDS = 300
+INGESTION_MAX_ATTEMPTS = 3
+# Étage de résumé : appels LLM simultanés et nombre maximum de tentatives par document
+SUMMARY_MAX_CONCURRENT = 4
+SUMMARY_MAX_ATTEMPTS = 3
+
 # Augmenter la limite de taille de fichier à 50 MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50 MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50 MB
\ No newline at end of file
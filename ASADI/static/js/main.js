@@ -88,6 +88,7 @@ document.addEventListener('DOMContentLoaded', () => {
       if (!response.ok) throw new Error(`Statut ${response.status}`);
       return response.json();
     })
+    .then(json => json.status_url ? pollIngestionJob(json.status_url) : json)
     .then(json => {
       hideLoadingOverlay();
       if (json.success) {
@@ -112,6 +113,31 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   });
 
+  // ————— Suivi de l’ingestion en arrière-plan —————
+  function pollIngestionJob(url) {
+    const progress = document.getElementById('loading-progress');
+    return new Promise((resolve, reject) => {
+      const tick = () => {
+        fetch(url)
+          .then(response => {
+            if (!response.ok) throw new Error(`Statut ${response.status}`);
+            return response.json();
+          })
+          .then(job => {
+            if (progress) progress.textContent = `${job.percent} %`;
+            if (job.finished) {
+              if (progress) progress.textContent = '';
+              resolve(job);
+            } else {
+              setTimeout(tick, 1500);
+            }
+          })
+          .catch(reject);
+      };
+      tick();
+    });
+  }
+
   // ————— Fonctions modal & workspace —————
   window.openWorkspaceForm = function(docId, currentWorkspaceName) {
     const modal = document.getElementById('workspace-form-wrapper');
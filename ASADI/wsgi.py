@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ASADI.settings")
 
 application = get_wsgi_application()
+
+# Préchargement optionnel des modèles partagés (embedding, reranker) avant de servir
+from django.conf import settings
+
+if settings.WARMUP_MODELS:
+    from src.modeles import warm_up
+    warm_up()
@@ -0,0 +1,49 @@
+import shutil
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+"""
+Commande de gestion `chroma_server`.
+
+Lance un serveur Chroma sur la base settings.CHROMA_DB_DIR. Avec CHROMA_MODE=server,
+l'ingestion, le service de recherche et les vues passent tous par ce serveur pour lire et
+écrire les collections. Les autres fichiers de CHROMA_DB_DIR (version de l'index, manifeste,
+index BM25, ...) restent écrits directement par ces processus, qui doivent tourner sur la
+même machine que le serveur.
+
+Usage :
+    python manage.py chroma_server [--host 127.0.0.1] [--port 8001] [--path chroma_db]
+"""
+
+
+class Command(BaseCommand):
+    help = "Lance le serveur ChromaDB utilisé en mode CHROMA_MODE=server."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=settings.CHROMA_SERVER_HOST,
+                            help="Adresse d'écoute. Par défaut : settings.CHROMA_SERVER_HOST.")
+        parser.add_argument('--port', type=int, default=settings.CHROMA_SERVER_PORT,
+                            help="Port d'écoute. Par défaut : settings.CHROMA_SERVER_PORT.")
+        parser.add_argument('--path', default=str(settings.CHROMA_DB_DIR),
+                            help="Dossier de la base. Par défaut : settings.CHROMA_DB_DIR.")
+
+    def handle(self, *args, **options):
+        chroma = shutil.which("chroma")
+        if chroma is None:
+            raise CommandError("La commande `chroma` est introuvable (paquet chromadb non installé ?).")
+        if settings.CHROMA_MODE != "server":
+            self.stdout.write(self.style.WARNING(
+                "CHROMA_MODE n'est pas « server » : le site continuera d'ouvrir la base en mode embarqué."
+            ))
+        self.stdout.write(f"Serveur Chroma sur {options['host']}:{options['port']} ({options['path']})")
+        try:
+            subprocess.run(
+                [chroma, "run", "--path", options['path'], "--host", options['host'], "--port", str(options['port'])],
+                check=True,
+            )
+        except KeyboardInterrupt:
+            self.stdout.write("Serveur Chroma arrêté.")
+        except subprocess.CalledProcessError as e:
+            raise CommandError(f"Le serveur Chroma s'est arrêté avec le code {e.returncode}.")
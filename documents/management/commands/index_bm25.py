@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from src.baseVectorielle import bump_index_version, collection
+from src.ingererDonnee import index_bm25
+
+"""
+Commande de gestion `index_bm25`.
+
+Reconstruit l'index BM25 (recherche par mots-clés) à partir des chunks de ChromaDB et le
+marque complet. À lancer après la mise en place de l'index ou un changement de son schéma ;
+le worker d'ingestion le fait aussi à son démarrage si l'index n'est pas complet.
+
+Usage :
+    python manage.py index_bm25
+"""
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index BM25 à partir des chunks de ChromaDB."
+
+    def handle(self, *args, **options):
+        self.stdout.write("Reconstruction de l'index BM25...")
+        n = index_bm25.rebuild(collection)
+        bump_index_version()
+        self.stdout.write(f"✅ Index BM25 reconstruit : {n} chunk(s).")
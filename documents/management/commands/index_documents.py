@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from src import indexDocuments
+from src.baseVectorielle import bump_index_version
+
+"""
+Commande de gestion `index_documents`.
+
+Reconstruit l'index de documents (un centroïde par source, utilisé par la recherche
+hiérarchique et le routage des workspaces) à partir des chunks de ChromaDB. Les recherches
+ne le construisent jamais elles-mêmes ; le worker d'ingestion le fait à son démarrage
+s'il ne l'a jamais été.
+
+Usage :
+    python manage.py index_documents
+"""
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de documents (centroïdes des sources) à partir des chunks."
+
+    def handle(self, *args, **options):
+        self.stdout.write("Reconstruction de l'index de documents...")
+        n = indexDocuments.rebuild()
+        bump_index_version()
+        self.stdout.write(f"✅ Index de documents reconstruit : {n} source(s).")
@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from django.conf import settings
+
+from documents.models import IngestionJob, SummaryTask
+from documents.utils import run_ingestion_job, run_summary_tasks
+from src import indexDocuments
+from src.baseVectorielle import bump_index_version, collection
+from src.ingererDonnee import index_bm25
+
+"""
+Commande de gestion `ingestion_worker`.
+
+Traite en arrière-plan les tâches d'ingestion placées en file d'attente dans la base
+de données par la page des documents, puis les résumés différés des documents ingérés.
+Plusieurs workers peuvent tourner en parallèle : chaque tâche est réservée par un verrou
+de ligne (SELECT ... FOR UPDATE SKIP LOCKED).
+
+Pendant l'exécution d'une tâche, le worker met à jour son `heartbeat` toutes les
+INGESTION_HEARTBEAT_SECONDS secondes. Une tâche « en cours » sans signe de vie depuis
+INGESTION_LEASE_SECONDS (worker arrêté ou planté) est remise en attente, au démarrage et
+chaque fois que la file est vide, ou passée en échec après INGESTION_MAX_ATTEMPTS tentatives.
+
+Au démarrage, le worker remplit l'index BM25 et l'index de documents à partir de ChromaDB
+s'ils ne l'ont jamais été en entier (voir les commandes `index_bm25` et `index_documents`) :
+ce travail n'est jamais fait pendant une recherche.
+
+Usage :
+    python manage.py ingestion_worker [--once] [--interval 2] [--retry-summaries]
+"""
+
+
+class Command(BaseCommand):
+    help = "Traite les tâches d'ingestion de documents en attente."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Traite les tâches en attente puis s'arrête.")
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help="Délai (en secondes) entre deux interrogations de la file.")
+        parser.add_argument('--retry-summaries', action='store_true',
+                            help="Remet en attente les résumés en échec avant de démarrer.")
+
+    def requeue_stale(self):
+        """
+        Remet en attente les tâches « en cours » dont le worker ne donne plus signe de vie.
+        
+        Returns:
+            int: Nombre de tâches remises en attente ou passées en échec.
+        """
+        limite = timezone.now() - timedelta(seconds=settings.INGESTION_LEASE_SECONDS)
+        n = 0
+        with transaction.atomic():
+            jobs = (
+                IngestionJob.objects
+                .select_for_update(skip_locked=True)
+                .filter(statut=IngestionJob.EN_COURS)
+                # Tâches antérieures au heartbeat : date de dernière mise à jour
+                .filter(Q(heartbeat__lt=limite) | Q(heartbeat__isnull=True, date_maj__lt=limite))
+            )
+            for job in jobs:
+                if job.tentatives >= settings.INGESTION_MAX_ATTEMPTS:
+                    job.statut = IngestionJob.ECHEC
+                    job.erreur = f"Worker interrompu ({job.tentatives} tentative(s))"
+                else:
+                    job.statut = IngestionJob.EN_ATTENTE
+                job.save(update_fields=['statut', 'erreur', 'date_maj'])
+                self.stdout.write(f"♻️ {job} : worker sans signe de vie depuis {job.heartbeat}")
+                n += 1
+        n += (
+            SummaryTask.objects
+            .filter(statut=IngestionJob.EN_COURS, date_maj__lt=limite)
+            .update(statut=IngestionJob.EN_ATTENTE, date_maj=timezone.now())
+        )
+        return n
+
+    def build_indexes(self):
+        """
+        Remplit l'index BM25 et l'index de documents à partir de ChromaDB s'ils ne l'ont jamais été en entier.
+        """
+        if not index_bm25.is_complete():
+            self.stdout.write("Construction de l'index BM25...")
+            n = index_bm25.rebuild(collection)
+            bump_index_version()
+            self.stdout.write(f"✅ Index BM25 construit : {n} chunk(s).")
+        if not os.path.exists(settings.DOCUMENT_INDEX_MARKER_PATH):
+            self.stdout.write("Construction de l'index de documents...")
+            n = indexDocuments.rebuild()
+            bump_index_version()
+            self.stdout.write(f"✅ Index de documents construit : {n} source(s).")
+
+    def heartbeat(self, job, stop):
+        """
+        Met à jour le signe de vie de la tâche jusqu'à ce que `stop` soit levé (thread dédié).
+        """
+        try:
+            while not stop.wait(settings.INGESTION_HEARTBEAT_SECONDS):
+                IngestionJob.objects.filter(pk=job.pk).update(heartbeat=timezone.now())
+        finally:
+            connection.close()
+
+    def claim_job(self):
+        """
+        Réserve la plus ancienne tâche en attente et la marque « en cours ».
+        
+        Returns:
+            IngestionJob: La tâche réservée, ou None si la file est vide.
+        """
+        with transaction.atomic():
+            job = (
+                IngestionJob.objects
+                .select_for_update(skip_locked=True)
+                .filter(statut=IngestionJob.EN_ATTENTE)
+                .order_by('id')
+                .first()
+            )
+            if job:
+                job.statut = IngestionJob.EN_COURS
+                job.tentatives += 1
+                job.heartbeat = timezone.now()
+                job.save(update_fields=['statut', 'tentatives', 'heartbeat', 'date_maj'])
+        return job
+
+    def claim_summary_tasks(self):
+        """
+        Réserve un lot de tâches de résumé en attente et les marque « en cours ».
+        
+        Returns:
+            list: Les tâches réservées (au plus SUMMARY_MAX_CONCURRENT).
+        """
+        with transaction.atomic():
+            tasks = list(
+                SummaryTask.objects
+                .select_for_update(skip_locked=True)
+                .filter(statut=IngestionJob.EN_ATTENTE)
+                .order_by('date_maj')[:settings.SUMMARY_MAX_CONCURRENT]
+            )
+            # update() ne met pas à jour date_maj (auto_now), qui sert de bail aux résumés
+            SummaryTask.objects.filter(pk__in=[t.pk for t in tasks]).update(
+                statut=IngestionJob.EN_COURS, date_maj=timezone.now()
+            )
+        return tasks
+
+    def handle(self, *args, **options):
+        if options['retry_summaries']:
+            n = SummaryTask.objects.filter(statut=IngestionJob.ECHEC).update(statut=IngestionJob.EN_ATTENTE, tentatives=0)
+            self.stdout.write(f"{n} résumé(s) remis en attente.")
+        self.stdout.write("Worker d'ingestion démarré.")
+        self.build_indexes()
+        self.requeue_stale()
+        while True:
+            job = self.claim_job()
+            if job is None and self.requeue_stale():
+                continue
+            if job is None:
+                # Les ingestions sont prioritaires : les résumés passent ensuite
+                tasks = self.claim_summary_tasks()
+                if tasks:
+                    run_summary_tasks(tasks)
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            self.stdout.write(f"▶️ {job} : {len(job.fichiers)} fichier(s)")
+            stop = threading.Event()
+            thread = threading.Thread(target=self.heartbeat, args=(job, stop), daemon=True)
+            thread.start()
+            try:
+                run_ingestion_job(job)
+            finally:
+                stop.set()
+                thread.join()
+            self.stdout.write(f"✅ {job}")
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from src.onnxBackend import export_embedding_model, export_reranker, marquer_parite, verifier_parite
+
+"""
+Commande de gestion `onnx_export`.
+
+Exporte le modèle d'embedding et le reranker au format ONNX (avec quantification int8
+optionnelle) puis vérifie la parité de leurs sorties avec les modèles PyTorch. Les modèles
+ne sont servis (settings.INFERENCE_BACKEND = "onnx") que si cette vérification réussit.
+
+Usage :
+    python manage.py onnx_export [--no-quantize] [--min-cosinus 0.99] [--max-ecart 0.05]
+"""
+
+TEXTES_TEST = [
+    "Comment poser un congé annuel ?",
+    "Les demandes de mutation doivent être déposées avant le 31 mars auprès du service des ressources humaines.",
+    "Le congé pour recherches ou conversions thématiques est accordé par le président de l'université.",
+    "Modalités de remboursement des frais de déplacement des personnels.",
+]
+
+
+class Command(BaseCommand):
+    help = "Exporte les modèles en ONNX et vérifie leur parité avec PyTorch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-quantize', action='store_true',
+                            help="N'utilise pas la quantification dynamique int8.")
+        parser.add_argument('--min-cosinus', type=float, default=0.99,
+                            help="Similarité cosinus minimale acceptée pour les embeddings.")
+        parser.add_argument('--max-ecart', type=float, default=0.05,
+                            help="Écart absolu maximal accepté sur les scores de reranking.")
+
+    def handle(self, *args, **options):
+        quantize = not options['no_quantize']
+        try:
+            self.stdout.write(f"Export de {settings.EMBEDDING_MODEL_NAME}...")
+            self.stdout.write(export_embedding_model(settings.EMBEDDING_MODEL_NAME, quantize))
+            self.stdout.write(f"Export de {settings.RERANKER_MODEL_NAME}...")
+            self.stdout.write(export_reranker(settings.RERANKER_MODEL_NAME, quantize))
+        except ImportError as e:
+            # torch.onnx.export et quantize_dynamic ont besoin du paquet onnx en plus d'onnxruntime
+            raise CommandError(
+                f"❌ Module {e.name or e} manquant pour l'export ONNX : "
+                "installez torch, onnx et onnxruntime (pip install -r requirements.txt)."
+            ) from e
+
+        paires = [[TEXTES_TEST[0], texte] for texte in TEXTES_TEST[1:]]
+        parite = verifier_parite(TEXTES_TEST, paires, quantize)
+        for cle, valeur in parite.items():
+            self.stdout.write(f"{cle} : {valeur}")
+
+        if parite["embedding_cosinus_min"] < options['min_cosinus']:
+            raise CommandError("❌ Parité insuffisante entre ONNX et PyTorch (embeddings).")
+        marquer_parite(settings.EMBEDDING_MODEL_NAME, quantize)
+        if parite["rerank_ecart_max"] > options['max_ecart'] or not parite["rerank_meme_ordre"]:
+            raise CommandError("❌ Parité insuffisante entre ONNX et PyTorch (reranking).")
+        marquer_parite(settings.RERANKER_MODEL_NAME, quantize)
+        self.stdout.write("✅ Parité ONNX / PyTorch vérifiée.")
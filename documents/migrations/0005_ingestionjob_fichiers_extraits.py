@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("documents", "0004_ingestionjob_heartbeat"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingestionjob",
+            name="fichiers_extraits",
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from workspace.models import Workspace
 
 """
@@ -62,4 +63,128 @@ class Document(models.Model):
         Returns:
             str: Le nom du document ou le nom du fichier si le nom n'est pas défini.
         """
-        return self.nom or self.fichier.name
\ No newline at end of file
+        return self.nom or self.fichier.name
+
+class IngestionJob(models.Model):
+    """
+    Tâche d'ingestion exécutée en arrière-plan par la commande `ingestion_worker`.
+    
+    Les fichiers uploadés sont enregistrés sur disque puis la tâche est placée en file
+    d'attente dans la base de données ; le worker la traite et met à jour sa progression
+    que la page des documents interroge régulièrement.
+    
+    Attributes:
+        fichiers (JSONField): Chemins absolus des fichiers (ou archives ZIP) à ingérer.
+        fichiers_extraits (JSONField): Chemins des membres d'archives déjà extraits par la tâche ;
+            si la tâche est reprise après l'arrêt de son worker, ils sont retirés avant la réextraction.
+        workspace (ForeignKey): Espace de travail cible (optionnel).
+        statut (CharField): État de la tâche (en attente, en cours, terminée, échec).
+        done (PositiveIntegerField): Nombre d'éléments déjà traités.
+        total (PositiveIntegerField): Nombre total d'éléments à traiter.
+        failed_files (JSONField): Noms des fichiers dont l'ingestion a échoué.
+        erreur (TextField): Message d'erreur en cas d'échec de la tâche.
+        tentatives (PositiveIntegerField): Nombre de fois où la tâche a été réservée par un worker.
+        heartbeat (DateTimeField): Dernier signe de vie du worker qui exécute la tâche ; une tâche
+            « en cours » sans signe de vie récent est remise en file (worker arrêté en cours de route).
+        date_creation (DateTimeField): Date et heure de création de la tâche.
+        date_maj (DateTimeField): Date et heure de la dernière mise à jour.
+    """
+    EN_ATTENTE = 'en_attente'
+    EN_COURS = 'en_cours'
+    TERMINE = 'termine'
+    ECHEC = 'echec'
+    STATUTS = [
+        (EN_ATTENTE, 'En attente'),
+        (EN_COURS, 'En cours'),
+        (TERMINE, 'Terminé'),
+        (ECHEC, 'Échec'),
+    ]
+
+    fichiers = models.JSONField(default=list)
+    fichiers_extraits = models.JSONField(default=list)
+    workspace = models.ForeignKey(Workspace, null=True, blank=True, on_delete=models.SET_NULL, related_name='ingestion_jobs')
+    statut = models.CharField(max_length=20, choices=STATUTS, default=EN_ATTENTE)
+    done = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    failed_files = models.JSONField(default=list)
+    erreur = models.TextField(blank=True)
+    tentatives = models.PositiveIntegerField(default=0)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    def set_progress(self, done, total):
+        """
+        Met à jour la progression de la tâche (interface `record_progress` de l'ingestion).
+        
+        Args:
+            done (int): Nombre d'éléments traités.
+            total (int): Nombre total d'éléments.
+        """
+        self.done, self.total = done, total
+        IngestionJob.objects.filter(pk=self.pk).update(done=done, total=total, heartbeat=timezone.now())
+
+    def add_extracted(self, path):
+        """
+        Enregistre un fichier créé par l'extraction d'une archive, avant sa copie.
+        
+        Args:
+            path (str): Chemin absolu du fichier extrait.
+        """
+        self.fichiers_extraits.append(path)
+        IngestionJob.objects.filter(pk=self.pk).update(fichiers_extraits=self.fichiers_extraits)
+
+    @property
+    def percent(self):
+        """
+        Pourcentage d'avancement de la tâche.
+        
+        Returns:
+            int: Avancement entre 0 et 100.
+        """
+        if self.statut == self.TERMINE:
+            return 100
+        if not self.total:
+            return 0
+        return min(100, self.done * 100 // self.total)
+
+    def __str__(self):
+        """
+        Retourne une représentation sous forme de chaîne de la tâche.
+        
+        Returns:
+            str: Identifiant et statut de la tâche.
+        """
+        return f"Ingestion #{self.pk} ({self.get_statut_display()})"
+
+
+class SummaryTask(models.Model):
+    """
+    Génération différée du chunk de résumé d'un document déjà ingéré.
+    
+    Traitée par la commande `ingestion_worker` avec un nombre borné d'appels LLM
+    simultanés ; une tâche en échec peut être relancée sans réingérer le document.
+    
+    Attributes:
+        source (CharField): Source du document dans ChromaDB (chemin relatif à MEDIA_ROOT).
+        statut (CharField): État de la tâche (en attente, en cours, terminée, échec).
+        tentatives (PositiveIntegerField): Nombre de tentatives déjà effectuées.
+        erreur (TextField): Dernier message d'erreur.
+        date_creation (DateTimeField): Date et heure de création de la tâche.
+        date_maj (DateTimeField): Date et heure de la dernière mise à jour.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    statut = models.CharField(max_length=20, choices=IngestionJob.STATUTS, default=IngestionJob.EN_ATTENTE)
+    tentatives = models.PositiveIntegerField(default=0)
+    erreur = models.TextField(blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """
+        Retourne une représentation sous forme de chaîne de la tâche.
+        
+        Returns:
+            str: Source et statut de la tâche.
+        """
+        return f"Résumé {self.source} ({self.get_statut_display()})"
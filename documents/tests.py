@@ -1,3 +1,799 @@
-from django.test import TestCase
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from langchain.schema import Document
+
+from documents import utils
+from documents.management.commands import ingestion_worker, onnx_export
+from documents.management.commands.ingestion_worker import Command as IngestionWorker
+from documents.models import Document as Doc, IngestionJob, SummaryTask
+from utilisateurs.models import Utilisateur
+from src import api, indexBM25, indexDocuments, ingererDonnee, manifeste, moteurIngestion, recherche, resumes
+from src.cachePersistant import CachePersistant, cle_hash
+from src.indexBM25 import IndexBM25
+from src.ingererDonnee import live_generation_only
+
+"""
+Tests de l'ingestion et de l'indexation : moteur d'ingestion parallèle, index BM25,
+filtre des générations et export ONNX des modèles.
+"""
+
+_TORCH_ONNX = all(importlib.util.find_spec(m) for m in ("torch", "onnx", "onnxruntime", "transformers"))
+
+
+def _ecrire(dossier, nom, texte):
+    chemin = os.path.join(dossier, nom)
+    with open(chemin, "w", encoding="utf-8") as f:
+        f.write(texte)
+    return chemin
+
+
+def _stockage_factice(test):
+    """
+    Remplace ChromaDB, l'index BM25, l'index de documents et le manifeste de src.ingererDonnee
+    par des mocks, le temps d'un test.
+    """
+    mocks = {nom: mock.MagicMock() for nom in
+             ("collection", "index_bm25", "bump_index_version", "indexDocuments", "manifeste")}
+    mocks["collection"].get.return_value = {"ids": [], "metadatas": []}
+    for nom, valeur in mocks.items():
+        patcher = mock.patch.object(ingererDonnee, nom, valeur)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    return mocks
+
+
+@override_settings(MEDIA_ROOT="/media", INGESTION_BATCH_SIZE=2)
+class IndexChunksTests(SimpleTestCase):
+    """
+    Indexation d'un fichier : embeddings et insertion dans ChromaDB par lots.
+    """
+
+    def setUp(self):
+        self.stockage = _stockage_factice(self)
+        self.collection = self.stockage["collection"]
+        self.encode = mock.Mock(side_effect=lambda textes, batch_size: [[1.0, 0.0]] * len(textes))
+        patcher = mock.patch.object(ingererDonnee, "encode_chunks", self.encode)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_insertion_par_lots(self):
+        chunks = [Document(page_content=f"texte {i}", metadata={"source": "x"}) for i in range(5)]
+        self.assertEqual(ingererDonnee.index_chunks("/media/documents/rh/a.txt", chunks, "rh"), 5)
+        self.assertEqual([len(c.args[0]) for c in self.encode.call_args_list], [2, 2, 1])
+        appels = self.collection.upsert.call_args_list
+        self.assertEqual([len(c.kwargs["ids"]) for c in appels], [2, 2, 1])
+        self.assertEqual([c.kwargs["documents"] for c in appels][2], ["texte 4"])
+        meta = appels[0].kwargs["metadatas"][1]
+        self.assertEqual((meta["source"], meta["workspace"], meta["chunk_index"]), ("documents/rh/a.txt", "rh", 1))
+
+    def test_progression(self):
+        progression = mock.Mock()
+        chunks = [Document(page_content=f"texte {i}", metadata={}) for i in range(3)]
+        self.assertEqual(ingererDonnee.index_chunks("/media/a.txt", chunks, None, progression, 10, 13), 13)
+        progression.set_progress.assert_called_with(13, 13)
+        self.assertEqual(self.collection.upsert.call_args_list[0].kwargs["metadatas"][0]["workspace"], "")
+
+    def test_bascule_apres_dernier_lot(self):
+        ordre = []
+        self.collection.upsert.side_effect = lambda **kwargs: ordre.append("lot")
+        self.stockage["manifeste"].record.side_effect = lambda *args, **kwargs: ordre.append("bascule")
+        chunks = [Document(page_content=f"texte {i}", metadata={}) for i in range(5)]
+        ingererDonnee.index_chunks("/media/a.txt", chunks)
+        self.assertEqual(ordre, ["lot", "lot", "lot", "bascule"])
+        generation = self.stockage["manifeste"].record.call_args.kwargs["generation"]
+        self.assertEqual(self.collection.upsert.call_args.kwargs["metadatas"][0]["generation"], generation)
+        self.stockage["bump_index_version"].assert_called_once()
+
+    def test_echec_bascule_retire_la_nouvelle_generation(self):
+        self.stockage["manifeste"].record.side_effect = OSError("disque plein")
+        chunks = [Document(page_content=f"texte {i}", metadata={}) for i in range(3)]
+        with self.assertRaises(OSError):
+            ingererDonnee.index_chunks("/media/a.txt", chunks)
+        ids = [i for c in self.collection.upsert.call_args_list for i in c.kwargs["ids"]]
+        self.collection.delete.assert_called_once_with(ids=ids)
+        self.stockage["index_bm25"].delete.assert_called_once_with(ids)
+
+
+class MoveSourceTests(SimpleTestCase):
+    """
+    Déplacement d'un document : réécriture des métadonnées, sans réingestion.
+    """
+
+    def setUp(self):
+        self.stockage = _stockage_factice(self)
+        self.collection = self.stockage["collection"]
+
+    def test_source_non_indexee(self):
+        self.assertEqual(ingererDonnee.move_source("documents/a.pdf", "documents/rh/a.pdf", "rh"), 0)
+        self.collection.upsert.assert_not_called()
+
+    def test_deplacement(self):
+        self.collection.get.return_value = {
+            "ids": ["documents/a.pdf_g1_chunk_0", "documents/a.pdf_summary"],
+            "documents": ["texte", "résumé"],
+            "metadatas": [{"source": "documents/a.pdf", "workspace": "", "generation": 1},
+                          {"source": "documents/a.pdf", "workspace": "", "is_summary": True}],
+            "embeddings": [[1.0, 0.0], [0.0, 1.0]],
+        }
+        self.assertEqual(ingererDonnee.move_source("documents/a.pdf", "documents/rh/a.pdf", "rh"), 2)
+
+        upsert = self.collection.upsert.call_args.kwargs
+        self.assertEqual(upsert["ids"], ["documents/rh/a.pdf_g1_chunk_0", "documents/rh/a.pdf_summary"])
+        self.assertEqual(upsert["embeddings"], [[1.0, 0.0], [0.0, 1.0]])
+        self.assertEqual({(m["source"], m["workspace"]) for m in upsert["metadatas"]}, {("documents/rh/a.pdf", "rh")})
+        self.assertEqual(upsert["metadatas"][0]["generation"], 1)
+        self.collection.delete.assert_called_once_with(ids=["documents/a.pdf_g1_chunk_0", "documents/a.pdf_summary"])
+        self.stockage["index_bm25"].delete.assert_called_once()
+        self.stockage["indexDocuments"].move_source.assert_called_once_with("documents/a.pdf", "documents/rh/a.pdf", "rh")
+        self.stockage["manifeste"].rename.assert_called_once_with("documents/a.pdf", "documents/rh/a.pdf", "rh")
+
+
+class CacheEmbeddingsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dossier, True)
+        self.cache = CachePersistant(os.path.join(self.dossier, "cache.sqlite3"), max_entries=10)
+
+    def test_lecture_ecriture(self):
+        self.cache.set_many([("a", b"1"), ("b", b"2")])
+        self.assertEqual(self.cache.get_many(["a", "c", "a"]), {"a": b"1"})
+
+    def test_eviction_des_moins_recemment_utilisees(self):
+        self.cache.set_many([(str(i), b"x") for i in range(10)])
+        self.cache.get_many(["0"])
+        self.cache.set_many([("10", b"x")])
+        restantes = self.cache.get_many(str(i) for i in range(11))
+        self.assertEqual(len(restantes), 9)
+        self.assertIn("0", restantes)
+        self.assertIn("10", restantes)
+
+    def test_seuls_les_textes_absents_sont_encodes(self):
+        modele = mock.Mock()
+        modele.encode.side_effect = lambda textes, batch_size: np.array([[len(t), 1.0] for t in textes])
+        with mock.patch.object(ingererDonnee, "embedding_cache", self.cache), \
+                mock.patch.object(ingererDonnee, "embedding_model_id", return_value="modele"), \
+                mock.patch.object(ingererDonnee, "get_embedding_model", return_value=modele):
+            premiers = ingererDonnee.encode_chunks(["congé", "mutation"])
+            seconds = ingererDonnee.encode_chunks(["mutation", "télétravail"])
+        self.assertEqual(premiers, [[5.0, 1.0], [8.0, 1.0]])
+        self.assertEqual(seconds, [[8.0, 1.0], [11.0, 1.0]])
+        self.assertEqual([c.args[0] for c in modele.encode.call_args_list], [["congé", "mutation"], ["télétravail"]])
+        # La clé dépend du modèle : un autre modèle ne relit pas ces embeddings
+        self.assertEqual(self.cache.get_many([cle_hash("autre", "congé")]), {})
+
+
+class ManifesteTests(SimpleTestCase):
+    """
+    Ingestion incrémentale : seuls les fichiers nouveaux ou modifiés sont réingérés.
+    """
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, True)
+        reglages = override_settings(MEDIA_ROOT=self.media,
+                                     INGESTION_MANIFEST_PATH=os.path.join(self.media, "manifeste.json"))
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.base = os.path.join(self.media, "documents")
+        os.makedirs(os.path.join(self.base, "rh"))
+        self.fichier = _ecrire(os.path.join(self.base, "rh"), "a.txt", "Congé annuel")
+
+    def _synchroniser(self):
+        with mock.patch.object(moteurIngestion, "ingest_parallel", return_value={}) as ingest_parallel, \
+                mock.patch.object(resumes, "summarize_sources"), \
+                mock.patch.object(ingererDonnee, "delete_chunks") as delete_chunks:
+            ingererDonnee.ingest_all_documents(self.base)
+        return ingest_parallel, delete_chunks
+
+    def test_fichier_inchange_ignore(self):
+        ingest_parallel, _ = self._synchroniser()
+        ingest_parallel.assert_called_once_with([(self.fichier, "rh")])
+        manifeste.record("documents/rh/a.txt", self.fichier, ingererDonnee.config_ingestion(), "rh")
+        ingest_parallel, _ = self._synchroniser()
+        ingest_parallel.assert_not_called()
+
+    def test_fichier_modifie_ou_deplace(self):
+        manifeste.record("documents/rh/a.txt", self.fichier, ingererDonnee.config_ingestion(), "rh")
+        _ecrire(os.path.join(self.base, "rh"), "a.txt", "Congé annuel et RTT")
+        ingest_parallel, _ = self._synchroniser()
+        ingest_parallel.assert_called_once()
+        entree = manifeste.load()["documents/rh/a.txt"]
+        self.assertFalse(manifeste.is_up_to_date(entree, entree["hash"], ingererDonnee.config_ingestion(), "dsi"))
+        self.assertFalse(manifeste.is_up_to_date(entree, entree["hash"], {"chunking": "autre"}, "rh"))
+
+    def test_source_supprimee_purgee(self):
+        manifeste.record("documents/rh/a.txt", self.fichier, ingererDonnee.config_ingestion(), "rh")
+        manifeste.record("documents/rh/ancien.txt", self.fichier, ingererDonnee.config_ingestion(), "rh")
+        _, delete_chunks = self._synchroniser()
+        delete_chunks.assert_called_once_with({"source": "documents/rh/ancien.txt"})
+        self.assertEqual(list(manifeste.load()), ["documents/rh/a.txt"])
+
+
+class IngestParallelTests(SimpleTestCase):
+    """
+    Moteur d'ingestion : extraction dans des processus (lancés par "spawn") et indexation
+    par le thread d'embedding, ici remplacée par un enregistreur.
+    """
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        self.a = _ecrire(self.dossier, "a.txt", "Congé annuel des agents.\n\nLes demandes sont faites en ligne.")
+        self.b = _ecrire(self.dossier, "b.txt", "Remboursement des frais de déplacement.")
+        self.c = _ecrire(self.dossier, "c.xyz", "format non supporté")
+
+    def tearDown(self):
+        shutil.rmtree(self.dossier, ignore_errors=True)
+
+    def test_extraction_et_indexation(self):
+        indexes = []
+        progression = mock.Mock()
+        with mock.patch.object(moteurIngestion, "index_chunks",
+                               side_effect=lambda fp, chunks, ws: indexes.append((fp, ws))):
+            results = moteurIngestion.ingest_parallel(
+                [(self.a, "rh"), (self.b, "rh"), (self.c, "rh")], workers=2, record_progress=progression,
+            )
+        self.assertEqual(sorted(indexes), [(self.a, "rh"), (self.b, "rh")])
+        self.assertIn("Congé annuel", results[self.a][0][0].page_content)
+        self.assertEqual(results[self.c], ([], ["c.xyz"]))
+        progression.set_progress.assert_called_with(3, 3)
+
+    def test_erreur_indexation(self):
+        def index_chunks(fp, chunks, ws):
+            if fp == self.b:
+                raise RuntimeError("ChromaDB indisponible")
+
+        with mock.patch.object(moteurIngestion, "index_chunks", side_effect=index_chunks):
+            results = moteurIngestion.ingest_parallel(iter([(self.a, None), (self.b, None)]), workers=1)
+        self.assertTrue(results[self.a][0])
+        self.assertEqual(results[self.b], ([], ["b.txt"]))
+
+
+class IngestFilesTests(SimpleTestCase):
+
+    @override_settings(MEDIA_ROOT="/media")
+    def test_interruption_du_generateur(self):
+        def fichiers():
+            yield "/media/documents/rh/a.pdf"
+            raise OSError("archive tronquée")
+
+        def ingest_parallel(items, **kwargs):
+            # Le premier fichier est indexé avant que l'archive ne s'interrompe
+            for _ in items:
+                pass
+
+        with mock.patch.object(utils, "ingest_parallel", side_effect=ingest_parallel), \
+                mock.patch.object(utils, "delete_chunks") as delete_chunks, \
+                mock.patch.object(utils.manifeste, "forget") as forget:
+            status = utils.ingest_files(fichiers())
+        self.assertEqual(status, {"/media/documents/rh/a.pdf": False})
+        delete_chunks.assert_called_once_with({"source": "documents/rh/a.pdf"})
+        forget.assert_called_once_with("documents/rh/a.pdf")
+
+
+class IngestionJobTests(TestCase):
+    """
+    Tâches d'ingestion : réservation, bail (heartbeat), reprise et suivi de progression.
+    """
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, True)
+        reglages = override_settings(MEDIA_ROOT=self.media)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.worker = IngestionWorker(stdout=io.StringIO())
+
+    def _archive(self):
+        chemin = os.path.join(self.media, "upload.zip")
+        with zipfile.ZipFile(chemin, "w") as archive:
+            archive.writestr("a.txt", "Congé annuel")
+        return chemin
+
+    def test_reservation(self):
+        job = IngestionJob.objects.create(fichiers=["a.pdf"])
+        self.assertEqual(self.worker.claim_job().pk, job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.statut, job.tentatives), (IngestionJob.EN_COURS, 1))
+        self.assertIsNotNone(job.heartbeat)
+        self.assertIsNone(self.worker.claim_job())
+
+    def test_remise_en_attente(self):
+        ancien = timezone.now() - timedelta(seconds=settings.INGESTION_LEASE_SECONDS + 60)
+        abandonnee = IngestionJob.objects.create(statut=IngestionJob.EN_COURS, tentatives=1)
+        epuisee = IngestionJob.objects.create(statut=IngestionJob.EN_COURS, tentatives=settings.INGESTION_MAX_ATTEMPTS)
+        sans_heartbeat = IngestionJob.objects.create(statut=IngestionJob.EN_COURS, tentatives=1)
+        vivante = IngestionJob.objects.create(statut=IngestionJob.EN_COURS, tentatives=1, heartbeat=timezone.now())
+        IngestionJob.objects.filter(pk__in=[abandonnee.pk, epuisee.pk]).update(heartbeat=ancien)
+        IngestionJob.objects.filter(pk=sans_heartbeat.pk).update(date_maj=ancien)
+
+        self.assertEqual(self.worker.requeue_stale(), 3)
+        statuts = dict(IngestionJob.objects.values_list("pk", "statut"))
+        self.assertEqual(statuts[abandonnee.pk], IngestionJob.EN_ATTENTE)
+        self.assertEqual(statuts[epuisee.pk], IngestionJob.ECHEC)
+        self.assertEqual(statuts[sans_heartbeat.pk], IngestionJob.EN_ATTENTE)
+        self.assertEqual(statuts[vivante.pk], IngestionJob.EN_COURS)
+
+    def test_reprise_sans_doublon(self):
+        job = IngestionJob.objects.create(fichiers=[self._archive()], statut=IngestionJob.EN_COURS)
+
+        def interrompre(fichiers, *args, **kwargs):
+            list(fichiers)
+            raise KeyboardInterrupt  # worker arrêté pendant l'ingestion
+
+        with mock.patch.object(utils, "ingest_files", side_effect=interrompre), \
+                self.assertRaises(KeyboardInterrupt):
+            utils.run_ingestion_job(job)
+
+        job.refresh_from_db()
+        extrait = os.path.join(self.media, "documents", "a.txt")
+        self.assertEqual(job.fichiers_extraits, [extrait])
+        with mock.patch.object(utils, "ingest_files", side_effect=lambda fichiers, *a, **k: {fp: True for fp in fichiers}), \
+                mock.patch.object(utils, "delete_chunks") as delete_chunks, \
+                mock.patch.object(utils.manifeste, "forget"):
+            utils.run_ingestion_job(job)
+
+        delete_chunks.assert_called_once_with({"source": "documents/a.txt"})
+        self.assertEqual(os.listdir(os.path.join(self.media, "documents")), ["a.txt"])
+        self.assertEqual(list(Doc.objects.values_list("fichier", flat=True)), ["documents/a.txt"])
+        self.assertEqual(job.statut, IngestionJob.TERMINE)
+        self.assertFalse(os.path.exists(job.fichiers[0]))
+
+    def test_progression(self):
+        admin = Utilisateur.objects.create_user("admin@asadi.fr", "motdepasse", username="admin")
+        admin.groups.add(Group.objects.create(name="administrateurs"))
+        job = IngestionJob.objects.create(fichiers=["a.pdf", "b.pdf"], statut=IngestionJob.EN_COURS)
+        job.set_progress(1, 4)
+        url = reverse("ingestion_job_status", args=[job.pk])
+        self.client.force_login(admin)
+        etat = self.client.get(url).json()
+        self.assertEqual((etat["done"], etat["total"], etat["percent"], etat["finished"]), (1, 4, 25, False))
+        IngestionJob.objects.filter(pk=job.pk).update(statut=IngestionJob.TERMINE, failed_files=["b.pdf"])
+        etat = self.client.get(url).json()
+        self.assertEqual((etat["percent"], etat["finished"], etat["success"]), (100, True, False))
+
+
+class ResumesTests(SimpleTestCase):
+    """
+    Étage de résumé : texte reconstitué depuis les chunks indexés, chunk de résumé indexé à part.
+    """
+
+    def setUp(self):
+        self.collection = mock.MagicMock()
+        self.collection.get.return_value = {
+            "documents": ["Résumé précédent", "ABCDEF", "DEFGHI", "XYZ"],
+            "metadatas": [{"is_summary": True}, {"start_index": 0, "chunk_index": 0, "workspace": "rh"},
+                          {"start_index": 3, "chunk_index": 1, "workspace": "rh"},
+                          {"start_index": 9, "chunk_index": 2, "workspace": "rh"}],
+        }
+        self.llm = mock.Mock(return_value="Un résumé")
+        for nom, valeur in [("collection", self.collection), ("resumeDocumentLong", self.llm),
+                            ("encode_chunks", mock.Mock(return_value=[[1.0, 0.0]])),
+                            ("index_bm25", mock.Mock()), ("bump_index_version", mock.Mock())]:
+            patcher = mock.patch.object(resumes, nom, valeur)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_texte_sans_chevauchement(self):
+        self.assertEqual(resumes.texte_source("documents/rh/a.pdf"), ("ABCDEF\nGHI\nXYZ", "rh"))
+
+    def test_chunk_de_resume(self):
+        resumes.summarize_source("documents/rh/a.pdf")
+        self.llm.assert_called_once_with("ABCDEF\nGHI\nXYZ")
+        upsert = self.collection.upsert.call_args.kwargs
+        self.assertEqual(upsert["ids"], ["documents/rh/a.pdf_summary"])
+        self.assertEqual(upsert["metadatas"][0],
+                         {"source": "documents/rh/a.pdf", "workspace": "rh", "chunk_index": -1, "is_summary": True})
+
+    def test_erreurs_par_source(self):
+        self.llm.side_effect = lambda texte: None
+        erreurs = resumes.summarize_sources(["a.pdf", "b.pdf"], max_workers=2)
+        self.assertEqual(erreurs, {"a.pdf": "Résumé indisponible pour a.pdf", "b.pdf": "Résumé indisponible pour b.pdf"})
+        self.collection.get.return_value = {"documents": [], "metadatas": []}
+        self.assertEqual(resumes.summarize_sources(["c.pdf"]), {"c.pdf": "Aucun chunk indexé pour c.pdf"})
+
+
+class ResumeLongTests(SimpleTestCase):
+    """
+    Résumé map-reduce : chaque requête tient dans le budget, avec un nombre borné d'appels simultanés.
+    """
+
+    def setUp(self):
+        self.requetes = []
+        self.en_cours = self.max_en_cours = 0
+        self.verrou = threading.Lock()
+        self.echec = None
+        patcher = mock.patch.object(api, "_requetePleiade", side_effect=self._llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _llm(self, system_prompt, contenu):
+        with self.verrou:
+            self.requetes.append(contenu)
+            self.en_cours += 1
+            self.max_en_cours = max(self.max_en_cours, self.en_cours)
+        time.sleep(0.01)
+        with self.verrou:
+            self.en_cours -= 1
+        return None if self.echec and self.echec in contenu else "résumé " * 5
+
+    def test_document_court(self):
+        self.assertEqual(api.resumeDocumentLong("Congé annuel.", budget=1000), "résumé " * 5)
+        self.assertEqual(len(self.requetes), 1)
+
+    def test_map_reduce(self):
+        document = "\n\n".join(f"Paragraphe {i} " + "mot " * 40 for i in range(40))
+        self.assertEqual(api.resumeDocumentLong(document, budget=500), "résumé " * 5)
+        sections = [r for r in self.requetes if r.startswith("Extrait")]
+        self.assertGreater(len(sections), 8)
+        self.assertTrue(all(len(r) <= 500 + len("Extrait : ") for r in sections))
+        self.assertTrue(self.requetes[-1].startswith("Résumés des parties"))
+        self.assertLessEqual(self.max_en_cours, api.LLM_MAX_CONCURRENT)
+
+    def test_section_en_erreur(self):
+        self.echec = "Paragraphe 7 "
+        document = "\n\n".join(f"Paragraphe {i} " + "mot " * 40 for i in range(20))
+        self.assertIsNone(api.resumeDocumentLong(document, budget=500))
+        self.assertFalse(any(r.startswith("Résumés des parties") for r in self.requetes))
+
+
+@mock.patch.dict(os.environ, {"API_KEY": "test"})
+class RequetePleiadeTests(SimpleTestCase):
+
+    def test_reponse(self):
+        reponse = mock.Mock(status_code=200)
+        reponse.json.return_value = {"choices": [{"message": {"content": "Bonjour"}}]}
+        with mock.patch.object(api.requests, "post", return_value=reponse) as post:
+            self.assertEqual(api._requetePleiade("consigne", "question"), "Bonjour")
+        messages = post.call_args.kwargs["json"]["messages"]
+        self.assertEqual(messages, [{"role": "system", "content": "consigne"}, {"role": "user", "content": "question"}])
+
+    def test_erreurs(self):
+        with mock.patch.object(api.requests, "post", return_value=mock.Mock(status_code=502, text="Bad gateway")):
+            self.assertIsNone(api._requetePleiade("consigne", "question"))
+        with mock.patch.object(api.requests, "post", side_effect=api.RequestException("délai dépassé")):
+            self.assertIsNone(api._requetePleiade("consigne", "question"))
+
+
+class SummaryTaskTests(TestCase):
+
+    def test_nouvelle_tentative_puis_echec(self):
+        task = SummaryTask.objects.create(source="documents/a.pdf", statut=IngestionJob.EN_COURS)
+        with mock.patch.object(utils, "summarize_sources", return_value={"documents/a.pdf": "LLM indisponible"}):
+            for _ in range(settings.SUMMARY_MAX_ATTEMPTS - 1):
+                utils.run_summary_tasks([task])
+                self.assertEqual(task.statut, IngestionJob.EN_ATTENTE)
+            utils.run_summary_tasks([task])
+        task.refresh_from_db()
+        self.assertEqual((task.statut, task.tentatives, task.erreur),
+                         (IngestionJob.ECHEC, settings.SUMMARY_MAX_ATTEMPTS, "LLM indisponible"))
+
+    def test_succes_et_replanification(self):
+        task = SummaryTask.objects.create(source="documents/a.pdf", statut=IngestionJob.EN_COURS)
+        with mock.patch.object(utils, "summarize_sources", return_value={"documents/a.pdf": None}):
+            utils.run_summary_tasks([task])
+        self.assertEqual(SummaryTask.objects.get().statut, IngestionJob.TERMINE)
+        # Réingestion du document : le résumé est replanifié
+        utils.schedule_summary("documents/a.pdf")
+        task = SummaryTask.objects.get()
+        self.assertEqual((task.statut, task.tentatives), (IngestionJob.EN_ATTENTE, 0))
+
+
+class StreamZipTests(SimpleTestCase):
+    """
+    Extraction des archives membre par membre, directement dans le dossier du workspace.
+    """
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, True)
+        reglages = override_settings(MEDIA_ROOT=self.media)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.dossier = os.path.join(self.media, "documents", "rh")
+        os.makedirs(self.dossier)
+        self.existant = _ecrire(self.dossier, "a.txt", "document déjà présent")
+        self.archive = os.path.join(self.media, "upload.zip")
+        with zipfile.ZipFile(self.archive, "w") as archive:
+            archive.writestr("a.txt", "premier")
+            archive.writestr("sous-dossier/a.txt", "second")
+            archive.writestr("sous-dossier/", "")
+            archive.writestr(".DS_Store", "caché")
+            archive.writestr("__MACOSX/._a.txt", "métadonnées")
+
+    def test_extraction_sans_ecrasement(self):
+        enregistres = []
+        workspace = mock.Mock()
+        workspace.name = "rh"
+        chemins = list(utils.stream_zip(self.archive, workspace, record_path=enregistres.append))
+
+        self.assertEqual(len(chemins), 2)
+        self.assertEqual(enregistres, chemins)
+        self.assertNotIn(self.existant, chemins)
+        self.assertEqual({os.path.dirname(c) for c in chemins}, {self.dossier})
+        contenus = []
+        for chemin in chemins:
+            with open(chemin, encoding="utf-8") as f:
+                contenus.append(f.read())
+        self.assertEqual(contenus, ["premier", "second"])
+        with open(self.existant, encoding="utf-8") as f:
+            self.assertEqual(f.read(), "document déjà présent")
+
+    def test_extraction_au_fil_de_l_eau(self):
+        membres = utils.stream_zip(self.archive)
+        self.assertEqual(next(membres), os.path.join(self.media, "documents", "a.txt"))
+        # Le membre suivant n'est extrait qu'à la demande
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media, "documents"))), ["a.txt", "rh"])
+        membres.close()
+
+    def test_archive_invalide(self):
+        with self.assertRaises(zipfile.BadZipFile):
+            list(utils.stream_zip(self.existant))
+
+
+class IndexBM25Tests(SimpleTestCase):
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        self.index = IndexBM25(os.path.join(self.dossier, "bm25.sqlite3"))
+        self.index.add(
+            ["a", "b", "c"],
+            ["Congé annuel des agents titulaires", "Mutation des personnels administratifs",
+             "Remboursement des frais de déplacement"],
+            [{"workspace": "rh", "source": "conges.pdf"}, {"workspace": "rh", "source": "mutations.pdf"},
+             {"workspace": "finances", "source": "frais.pdf"}],
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.dossier, ignore_errors=True)
+
+    def test_recherche(self):
+        self.assertEqual([cid for cid, _ in self.index.search("congés annuels", 5)], ["a"])
+
+    def test_partition_workspace(self):
+        self.assertEqual(self.index.search("déplacement", 5, workspace="rh"), [])
+        self.assertEqual([cid for cid, _ in self.index.search("déplacement", 5, workspace="finances")], ["c"])
+
+    def test_filtre_sources(self):
+        self.assertEqual(self.index.search("agents personnels", 5, workspace="rh", sources=["mutations.pdf"])[0][0], "b")
+
+    def test_suppression(self):
+        self.index.search("congé", 5, workspace="rh")
+        self.assertEqual(self.index.delete(["a"]), 1)
+        # Partition rechargée depuis la base (et non plus la matrice en mémoire)
+        self.assertEqual(self.index._charger_partition("rh").ids, ["b"])
+        self.assertEqual(self.index.version_workspace("rh")[1], 1)
+
+    def test_remplacement(self):
+        self.index.add(["a"], ["Télétravail des agents"], [{"workspace": "rh", "source": "conges.pdf"}])
+        self.assertEqual(self.index.version_workspace("rh")[1], 2)
+        self.assertEqual([cid for cid, _ in IndexBM25(self.index.path).search("télétravail", 5)], ["a"])
+
+    def test_version_workspace_independante(self):
+        version_rh = self.index.version_workspace("rh")[0]
+        self.index.add(["d"], ["Bourses sur critères sociaux"], [{"workspace": "finances", "source": "bourses.pdf"}])
+        self.assertEqual(self.index.version_workspace("rh")[0], version_rh)
+
+    def test_partition_perimee(self):
+        self.index.search("congé", 5, workspace="rh")
+        self.assertTrue(self.index.is_fresh(["rh"]))
+        self.index.add(["d"], ["Télétravail"], [{"workspace": "rh", "source": "teletravail.pdf"}])
+        self.assertFalse(self.index.is_fresh(["rh"]))
+        # Partition jamais chargée : elle le sera à jour par la recherche
+        self.assertTrue(self.index.is_fresh(["finances"]))
+
+    def test_marque_complet_par_rebuild(self):
+        # Alimenté par des ingestions mais jamais rempli depuis ChromaDB
+        self.assertFalse(self.index.is_complete())
+        collection = mock.Mock()
+        collection.get.side_effect = [
+            {"ids": ["a", "x"], "documents": ["Congé annuel", "Ancien chunk télétravail"],
+             "metadatas": [{"workspace": "rh", "source": "conges.pdf"}, {"workspace": "rh", "source": "ancien.pdf"}]},
+            {"ids": [], "documents": [], "metadatas": []},
+        ]
+        self.assertEqual(self.index.rebuild(collection), 2)
+        self.assertTrue(self.index.is_complete())
+        self.assertEqual([cid for cid, _ in self.index.search("télétravail", 5)], ["x"])
+        self.assertTrue(IndexBM25(self.index.path).is_complete())
+        # Un changement de schéma vide l'index et son marqueur
+        with mock.patch.object(indexBM25, "INDEX_VERSION", "autre"):
+            self.assertFalse(IndexBM25(self.index.path).is_complete())
+
+    def test_jamais_reconstruit_pendant_une_recherche(self):
+        index = mock.Mock()
+        index.is_complete.return_value = False
+        with mock.patch.object(recherche, "index_bm25", index), \
+                mock.patch.object(recherche, "_etat_index_bm25", None):
+            recherche._index_bm25_pret()
+            recherche._index_bm25_pret()
+        index.is_complete.assert_called_once()
+        index.rebuild.assert_not_called()
+
+    def test_construit_au_demarrage_du_worker(self):
+        index = mock.Mock()
+        with mock.patch.object(ingestion_worker, "index_bm25", index), \
+                mock.patch.object(ingestion_worker, "indexDocuments"), \
+                mock.patch.object(ingestion_worker, "bump_index_version"), \
+                override_settings(DOCUMENT_INDEX_MARKER_PATH=__file__):
+            index.is_complete.return_value = True
+            IngestionWorker(stdout=io.StringIO()).build_indexes()
+            index.rebuild.assert_not_called()
+            index.is_complete.return_value = False
+            IngestionWorker(stdout=io.StringIO()).build_indexes()
+        index.rebuild.assert_called_once_with(ingestion_worker.collection)
+
+
+class IndexDocumentsTests(SimpleTestCase):
+    """
+    Index de documents : un centroïde par source, construit hors des requêtes.
+    """
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dossier, True)
+        reglages = override_settings(DOCUMENT_INDEX_MARKER_PATH=os.path.join(self.dossier, "complet"))
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        self.sources = mock.MagicMock()
+        self.sources.get.return_value = {"ids": ["a.pdf", "ancien.pdf"]}
+        self.collection = mock.Mock()
+        self.collection.get.side_effect = [
+            {"ids": ["a_g1_chunk_0", "a_g2_chunk_0", "a_summary", "b_g1_chunk_0"],
+             "embeddings": [[1.0, 0.0], [0.0, 2.0], [5.0, 5.0], [3.0, 0.0]],
+             "metadatas": [{"source": "a.pdf", "generation": 1, "workspace": "rh"},
+                           {"source": "a.pdf", "generation": 2, "workspace": "rh"},
+                           {"source": "a.pdf", "is_summary": True},
+                           {"source": "b.pdf", "generation": 1, "workspace": "dsi"}]},
+            {"ids": [], "embeddings": [], "metadatas": []},
+        ]
+        for nom, valeur in (("collection_sources", self.sources), ("collection", self.collection)):
+            patcher = mock.patch.object(indexDocuments, nom, valeur)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_rebuild_sans_vider_l_index(self):
+        with mock.patch.object(manifeste, "generations", return_value={"a.pdf": 1}):
+            self.assertEqual(indexDocuments.rebuild(), 2)
+        ecrits = {c.kwargs["ids"][0]: c.kwargs for c in self.sources.upsert.call_args_list}
+        # Génération pointée par le manifeste, résumé ignoré
+        self.assertEqual(ecrits["a.pdf"]["embeddings"], [[1.0, 0.0]])
+        self.assertEqual(ecrits["b.pdf"]["metadatas"][0]["workspace"], "dsi")
+        # Seul le centroïde de la source disparue est retiré, après les mises à jour
+        self.sources.delete.assert_called_once_with(ids=["ancien.pdf"])
+        self.assertEqual(self.sources.method_calls[-1], mock.call.delete(ids=["ancien.pdf"]))
+        self.assertTrue(os.path.exists(settings.DOCUMENT_INDEX_MARKER_PATH))
+
+    def test_jamais_construit_pendant_une_recherche(self):
+        with mock.patch.object(indexDocuments, "rebuild") as rebuild, \
+                mock.patch.object(indexDocuments, "_etat_index", None):
+            self.sources.query.return_value = {"ids": [["b.pdf"]], "metadatas": [[{"source": "b.pdf"}]]}
+            self.assertEqual(indexDocuments.top_sources([1.0, 0.0], 1), ["b.pdf"])
+        rebuild.assert_not_called()
+
+
+class LiveGenerationOnlyTests(SimpleTestCase):
+    """
+    Les lecteurs suivent le pointeur de génération du manifeste, pas la génération la plus récente.
+    """
+
+    chunks = [
+        ("v1", {"source": "a.pdf", "generation": 1}),
+        ("v2", {"source": "a.pdf", "generation": 2}),
+        ("b", {"source": "b.pdf", "generation": 1}),
+        ("resume", {"source": "a.pdf", "is_summary": True}),
+    ]
+
+    def test_generation_pointee(self):
+        # La génération 2 est en cours d'insertion : le pointeur désigne encore la 1
+        with mock.patch.object(manifeste, "generations", return_value={"a.pdf": 1, "b.pdf": 1}):
+            self.assertEqual([doc for doc, _ in live_generation_only(self.chunks)], ["v1", "b", "resume"])
+        with mock.patch.object(manifeste, "generations", return_value={"a.pdf": 2, "b.pdf": 1}):
+            self.assertEqual([doc for doc, _ in live_generation_only(self.chunks)], ["v2", "b", "resume"])
+
+    def test_source_sans_pointeur(self):
+        with mock.patch.object(manifeste, "generations", return_value={}):
+            self.assertEqual([doc for doc, _ in live_generation_only(self.chunks)], ["v2", "b", "resume"])
+
+    def test_pointeur_relu_apres_bascule(self):
+        dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dossier, True)
+        with override_settings(INGESTION_MANIFEST_PATH=os.path.join(dossier, "manifeste.json")):
+            self.assertEqual(manifeste.generations(), {})
+            manifeste.record("a.pdf", __file__, {}, digest="x", generation=1)
+            self.assertEqual(manifeste.generations(), {"a.pdf": 1})
+            manifeste.record("a.pdf", __file__, {}, digest="x", generation=2)
+            self.assertEqual(manifeste.generations(), {"a.pdf": 2})
+
+
+@unittest.skipUnless(_TORCH_ONNX, "torch, onnx, onnxruntime et transformers sont nécessaires")
+class ExportOnnxTests(SimpleTestCase):
+    """
+    Export d'un petit BERT aléatoire : les entrées du graphe ONNX doivent être liées aux
+    bons arguments de `forward` (token_type_ids et attention_mask ne doivent pas être inversés).
+    """
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dossier, ignore_errors=True)
+
+    def test_parite_reranker(self):
+        import onnxruntime as ort
+        import torch
+        from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+
+        from src.onnxBackend import _exporter
+
+        vocab = os.path.join(self.dossier, "vocab.txt")
+        with open(vocab, "w", encoding="utf-8") as f:
+            f.write("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "congé", "annuel", "agents", "mutation"]))
+        tokenizer = BertTokenizerFast(vocab)
+        torch.manual_seed(0)
+        modele = BertForSequenceClassification(BertConfig(
+            vocab_size=9, hidden_size=16, num_hidden_layers=1, num_attention_heads=2,
+            intermediate_size=32, num_labels=1,
+        )).eval()
+
+        entrees = tokenizer(["congé", "mutation annuel"], ["agents annuel congé", "agents"],
+                            padding=True, return_tensors="pt")
+        # Référence calculée avant l'export : le traçage peut modifier l'état global de transformers
+        with torch.no_grad():
+            attendu = modele(**entrees).logits.numpy()
+
+        _exporter(modele, lambda s: s.logits, tokenizer, self.dossier, {}, paire=True)
+        session = ort.InferenceSession(os.path.join(self.dossier, "model.onnx"), providers=["CPUExecutionProvider"])
+        obtenu = session.run(None, {n: entrees[n].numpy().astype(np.int64) for n in entrees})[0]
+        np.testing.assert_allclose(obtenu, attendu, atol=1e-4)
+
+
+class CommandeOnnxExportTests(SimpleTestCase):
+
+    def test_module_manquant(self):
+        erreur = ModuleNotFoundError("No module named 'onnx'", name="onnx")
+        with mock.patch.object(onnx_export, "export_embedding_model", side_effect=erreur), \
+                self.assertRaisesMessage(CommandError, "Module onnx manquant"):
+            call_command("onnx_export", stdout=io.StringIO())
+
+
+@unittest.skipUnless(_TORCH_ONNX and os.environ.get("ONNX_PARITY_TESTS"),
+                     "ONNX_PARITY_TESTS=1 (téléchargement des modèles configurés)")
+class PariteOnnxTests(SimpleTestCase):
+    """
+    Parité ONNX / PyTorch des modèles configurés (embedding et reranker), comme `onnx_export`.
+    """
+
+    def test_parite_modeles(self):
+        from django.test import override_settings
+
+        from src.onnxBackend import export_embedding_model, export_reranker, verifier_parite
+
+        dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dossier, True)
+        textes = ["Comment poser un congé annuel ?", "Remboursement des frais de déplacement des personnels."]
+        paires = [[textes[0], "Les congés annuels sont posés auprès du service RH."], [textes[0], textes[1]]]
+        with override_settings(ONNX_MODELS_DIR=dossier):
+            export_embedding_model(settings.EMBEDDING_MODEL_NAME, quantize=False)
+            export_reranker(settings.RERANKER_MODEL_NAME, quantize=False)
+            parite = verifier_parite(textes, paires, quantize=False)
+        self.assertGreater(parite["embedding_cosinus_min"], 0.999)
+        self.assertLess(parite["rerank_ecart_max"], 1e-3)
+        self.assertTrue(parite["rerank_meme_ordre"])
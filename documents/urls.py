@@ -5,4 +5,5 @@ urlpatterns = [
     path('', views.documents, name='documents'),
     path('delete/<int:doc_id>/', views.delete_document, name='delete_document'),
     path('delete-workspace/', views.delete_workspace, name='delete_workspace'),
+    path('jobs/<int:job_id>/', views.ingestion_job_status, name='ingestion_job_status'),
 ]
\ No newline at end of file
@@ -1,12 +1,15 @@
 import os
 import shutil
-import tempfile
 import zipfile
 
 from django.conf import settings
-from .models import Document
+from django.core.files.storage import FileSystemStorage
+from .models import Document, IngestionJob, SummaryTask
 from workspace.models import Workspace
-from src.ingererDonnee import ingest_documents
+from src.ingererDonnee import delete_chunks
+from src import manifeste
+from src.moteurIngestion import ingest_parallel
+from src.resumes import summarize_sources
 
 """
 Module d'utilitaires pour l'application documents.
@@ -43,77 +46,138 @@ def save_uploaded_file(fichier, workspace=None):
 
     return file_path, doc_path
 
-def extract_zip(zip_path):
-    """Extrait un fichier ZIP et retourne la liste des fichiers extraits.
+def ingest_files(file_paths, workspace=None, record_progress=None, total=None):
+    """
+    Ingère plusieurs fichiers en parallèle dans la base de données vectorielle.
+    
+    Les chemins peuvent être fournis par un générateur : chaque fichier est transmis
+    au moteur d'ingestion dès qu'il est produit.
+    
+    Les fichiers en échec (y compris tous ceux déjà produits lorsque le générateur ou le
+    moteur d'ingestion s'interrompt) sont retirés de l'index : leurs chunks éventuellement
+    déjà insérés sont supprimés de ChromaDB et de l'index BM25, et oubliés du manifeste.
     
     Args:
-        zip_path (str): Chemin vers le fichier ZIP à extraire
+        file_paths (Iterable[str]): Chemins vers les fichiers à ingérer.
+        workspace (Workspace, optional): L'espace de travail associé aux fichiers. Defaults to None.
+        record_progress: Objet de suivi de progression (méthode set_progress). Defaults to None.
+        total (int, optional): Nombre de fichiers attendus, pour la progression. Defaults to None.
         
     Returns:
-        tuple: (liste des fichiers extraits, répertoire d'extraction)
-        
-    Raises:
-        zipfile.BadZipFile: Si le fichier ZIP est corrompu
-        Exception: Pour toute autre erreur d'extraction
+        dict: Pour chaque chemin, True si l'ingestion a réussi, False sinon.
     """
+    ws_name = workspace.name if workspace else None
+    vus = []
+
+    def items():
+        for fp in file_paths:
+            vus.append(fp)
+            yield fp, ws_name
+
     try:
-        # Vérifier que le fichier existe
-        if not os.path.exists(zip_path):
-            raise FileNotFoundError(f"Le fichier ZIP {zip_path} n'existe pas")
-            
-        # Vérifier que c'est bien un fichier ZIP
-        if not zipfile.is_zipfile(zip_path):
-            raise zipfile.BadZipFile(f"Le fichier {zip_path} n'est pas un fichier ZIP valide")
-        
-        # Créer un répertoire temporaire pour l'extraction
-        extract_dir = tempfile.mkdtemp()
-        
-        # Extraire le fichier ZIP
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
-        
-        # Récupérer la liste des fichiers extraits
-        extracted_files = []
-        for root, _, files in os.walk(extract_dir):
-            for file in files:
-                # Ignorer les fichiers cachés et les fichiers système
-                if not file.startswith('.') and not file.startswith('__MACOSX'):
-                    extracted_files.append(os.path.join(root, file))
-        
-        if not extracted_files:
-            print(f"Attention: Aucun fichier trouvé dans {zip_path}")
-            
-        return extracted_files, extract_dir
-        
-    except zipfile.BadZipFile as e:
-        print(f"Erreur: Le fichier ZIP est corrompu - {e}")
-        raise
+        results = ingest_parallel(items(), record_progress=record_progress, total=total)
     except Exception as e:
-        print(f"Erreur lors de l'extraction du fichier ZIP: {e}")
-        # Nettoyer le répertoire temporaire si une erreur se produit
-        if 'extract_dir' in locals() and os.path.exists(extract_dir):
-            shutil.rmtree(extract_dir)
-        raise
+        print(f"⚠️ Erreur ingestion parallèle : {e}")
+        results = {}
+    status = {}
+    for fp in vus:
+        chunks, ignored_files = results.get(fp, (None, []))
+        status[fp] = not (ignored_files or chunks is None or len(chunks) == 0)
+        if not status[fp]:
+            source = os.path.relpath(fp, settings.MEDIA_ROOT).replace(os.sep, '/')
+            try:
+                delete_chunks({"source": source})
+                manifeste.forget(source)
+            except Exception as e:
+                print(f"⚠️ Erreur nettoyage de l'index pour {source}: {e}")
+    return status
 
-def ingest_file(file_path, workspace=None):
+def zip_members(zip_path):
     """
-    Ingère un fichier dans la base de données vectorielle.
+    Liste les membres d'une archive ZIP à ingérer (fichiers visibles, hors métadonnées macOS).
     
     Args:
-        file_path (str): Chemin vers le fichier à ingérer.
-        workspace (Workspace, optional): L'espace de travail associé au fichier. Defaults to None.
+        zip_path (str): Chemin vers le fichier ZIP.
         
     Returns:
-        tuple: Un tuple contenant (liste des chunks ingérés, liste des fichiers ignorés).
+        list: Les entrées `ZipInfo` à extraire.
     """
-    try:
-        chunks, ignored_files = ingest_documents([file_path], workspace=workspace.name if workspace else None)
-        if ignored_files or chunks is None or len(chunks) == 0:
-            return False
-        return True
-    except Exception as e:
-        print(f"⚠️ Erreur ingestion fichier {file_path}: {e}")
-        return False
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        return [
+            info for info in zip_ref.infolist()
+            if not info.is_dir()
+            and not os.path.basename(info.filename).startswith('.')
+            and '__MACOSX' not in info.filename
+        ]
+
+def open_available(dest_dir, file_name):
+    """
+    Crée un nouveau fichier dans `dest_dir`, sans jamais écraser un fichier existant.
+    
+    Si le nom est déjà pris, un suffixe aléatoire est ajouté (comme pour les fichiers
+    enregistrés par Django, `Storage.get_available_name`).
+    
+    Args:
+        dest_dir (str): Répertoire de destination.
+        file_name (str): Nom de fichier souhaité.
+        
+    Returns:
+        tuple: (chemin absolu du fichier créé, fichier ouvert en écriture binaire).
+    """
+    storage = FileSystemStorage(location=dest_dir)
+    while True:
+        dest_path = storage.path(storage.get_available_name(file_name))
+        try:
+            # Création exclusive : un autre membre peut prendre le même nom entre-temps
+            return dest_path, open(dest_path, 'xb')
+        except FileExistsError:
+            continue
+
+def stream_zip(zip_path, workspace=None, failed_files=None, record_path=None):
+    """
+    Extrait les membres d'une archive ZIP un par un, directement à leur emplacement final.
+    
+    Chaque membre est recopié par blocs depuis l'archive vers le répertoire média du
+    workspace (sans répertoire temporaire) puis produit aussitôt, ce qui permet de
+    l'ingérer pendant l'extraction des suivants. Un membre ne remplace jamais un fichier
+    existant (document déjà présent ou membre de même nom) : il reçoit un nom libre.
+    
+    Args:
+        zip_path (str): Chemin vers le fichier ZIP.
+        workspace (Workspace, optional): L'espace de travail de destination. Defaults to None.
+        failed_files (set, optional): Ensemble complété avec les membres impossibles à extraire. Defaults to None.
+        record_path (callable, optional): Appelé avec le chemin de chaque fichier créé, avant sa copie. Defaults to None.
+        
+    Yields:
+        str: Chemin absolu de chaque fichier extrait.
+        
+    Raises:
+        zipfile.BadZipFile: Si le fichier ZIP est corrompu.
+    """
+    if not zipfile.is_zipfile(zip_path):
+        raise zipfile.BadZipFile(f"Le fichier {zip_path} n'est pas un fichier ZIP valide")
+
+    if workspace:
+        dest_dir = os.path.join(settings.MEDIA_ROOT, 'documents', workspace.name)
+    else:
+        dest_dir = os.path.join(settings.MEDIA_ROOT, 'documents')
+    os.makedirs(dest_dir, exist_ok=True)
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for info in zip_members(zip_path):
+            dest_path, dest = open_available(dest_dir, os.path.basename(info.filename))
+            try:
+                if record_path:
+                    record_path(dest_path)
+                with zip_ref.open(info) as src, dest:
+                    shutil.copyfileobj(src, dest, 1024 * 1024)
+            except Exception as e:
+                print(f"⚠️ Erreur extraction de {info.filename}: {e}")
+                clean_file(dest_path)
+                if failed_files is not None:
+                    failed_files.add(os.path.basename(info.filename))
+                continue
+            yield dest_path
 
 def clean_file(path):
     """
@@ -180,3 +244,131 @@ def attach_document_to_workspace(file_path, workspace=None):
         workspace.document.add(doc)
         
     return True
+
+
+def run_ingestion_job(job):
+    """
+    Exécute une tâche d'ingestion : extraction des ZIP, ingestion, rattachement aux workspaces.
+    
+    Les membres des archives ZIP sont extraits un par un à leur emplacement définitif
+    et ingérés au fur et à mesure de l'extraction.
+    
+    Les fichiers dont l'ingestion échoue sont supprimés du disque et listés dans
+    `job.failed_files`. La progression est enregistrée sur la tâche au fil de l'ingestion.
+    
+    Les membres extraits sont enregistrés sur la tâche : si elle est reprise après l'arrêt
+    de son worker, ceux de la tentative précédente sont d'abord retirés (voir `clean_extracted`)
+    pour que la réextraction ne produise pas de doublons.
+    
+    Args:
+        job (IngestionJob): La tâche à exécuter (déjà marquée « en cours »).
+    """
+    if job.fichiers_extraits:
+        clean_extracted(job)
+    workspace = job.workspace
+    failed_files = set()
+    archives = []
+    total = 0
+
+    for path in job.fichiers:
+        if path.lower().endswith('.zip'):
+            try:
+                total += len(zip_members(path))
+            except Exception:
+                failed_files.add(os.path.basename(path))
+                clean_file(path)
+                continue
+            archives.append(path)
+        else:
+            total += 1
+
+    def fichiers():
+        for path in job.fichiers:
+            if path.lower().endswith('.zip'):
+                if path in archives:
+                    yield from stream_zip(path, workspace, failed_files, record_path=job.add_extracted)
+            else:
+                yield path
+
+    try:
+        job.set_progress(0, total)
+        ingested = ingest_files(fichiers(), workspace, record_progress=job, total=total)
+        for file_path, ok in ingested.items():
+            if ok:
+                attach_document_to_workspace(file_path, workspace)
+                schedule_summary(os.path.relpath(file_path, settings.MEDIA_ROOT).replace(os.sep, '/'))
+            else:
+                clean_file(file_path)
+                failed_files.add(os.path.basename(file_path))
+
+        job.statut = IngestionJob.TERMINE
+    except Exception as e:
+        print(f"⚠️ Erreur tâche d'ingestion #{job.pk}: {e}")
+        job.statut = IngestionJob.ECHEC
+        job.erreur = str(e)
+    # Pas de `finally` : si le worker est arrêté en cours de route, les archives sont
+    # conservées pour la reprise de la tâche
+    for path in archives:
+        clean_file(path)
+
+    job.failed_files = sorted(failed_files)
+    job.save()
+
+
+def clean_extracted(job):
+    """
+    Retire les fichiers extraits par une tentative précédente d'une tâche d'ingestion.
+    
+    Pour chaque fichier : chunks (ChromaDB, BM25, index de documents), entrée du manifeste,
+    document et résumé éventuellement créés, puis le fichier lui-même.
+    
+    Args:
+        job (IngestionJob): La tâche reprise.
+    """
+    for path in job.fichiers_extraits:
+        source = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        try:
+            delete_chunks({"source": source})
+            manifeste.forget(source)
+        except Exception as e:
+            print(f"⚠️ Erreur nettoyage de l'index pour {source}: {e}")
+        Document.objects.filter(fichier=source).delete()
+        SummaryTask.objects.filter(source=source).delete()
+        clean_file(path)
+    print(f"♻️ Tâche d'ingestion #{job.pk} reprise : {len(job.fichiers_extraits)} fichier(s) extrait(s) retiré(s)")
+    job.fichiers_extraits = []
+    IngestionJob.objects.filter(pk=job.pk).update(fichiers_extraits=[])
+
+
+def schedule_summary(source):
+    """
+    Place (ou replace) en file d'attente la génération du résumé d'une source.
+    
+    Args:
+        source (str): Source du document dans ChromaDB.
+    """
+    SummaryTask.objects.update_or_create(
+        source=source,
+        defaults={'statut': IngestionJob.EN_ATTENTE, 'tentatives': 0, 'erreur': ''},
+    )
+
+def run_summary_tasks(tasks):
+    """
+    Génère les résumés d'un lot de tâches avec un nombre borné d'appels LLM simultanés.
+    
+    Une tâche en échec est remise en attente tant que `SUMMARY_MAX_ATTEMPTS` n'est pas atteint.
+    
+    Args:
+        tasks (list): Tâches de résumé à traiter (déjà marquées « en cours »).
+    """
+    erreurs = summarize_sources([task.source for task in tasks])
+    for task in tasks:
+        erreur = erreurs.get(task.source)
+        task.tentatives += 1
+        if erreur is None:
+            task.statut, task.erreur = IngestionJob.TERMINE, ''
+        else:
+            task.erreur = erreur
+            task.statut = (IngestionJob.EN_ATTENTE if task.tentatives < settings.SUMMARY_MAX_ATTEMPTS
+                           else IngestionJob.ECHEC)
+        task.save()
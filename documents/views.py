@@ -7,13 +7,15 @@ from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
 from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.db.models import Q
 
-from src.ingererDonnee import ingest_documents, collection
-from .models import Document
+from src.ingererDonnee import ingest_documents, move_source, delete_chunks
+from src import manifeste
+from .models import Document, IngestionJob, SummaryTask
 from workspace.models import Workspace
 from ASADI.views import est_admin
-from .utils import save_uploaded_file, extract_zip, ingest_file, clean_file, attach_document_to_workspace
+from .utils import save_uploaded_file, schedule_summary
 
 """
 Module de vues pour l'application documents.
@@ -22,6 +24,36 @@ Ce module contient les vues pour la gestion des documents et des espaces de trav
 notamment l'upload, la suppression, la recherche et l'organisation des documents.
 """
 
+def move_chunks(old_source, new_source, new_path, workspace_name=None):
+    """
+    Met à jour ChromaDB après le déplacement physique d'un document.
+    
+    Les chunks existants sont déplacés par simple réécriture de leurs métadonnées ;
+    le document n'est réingéré que s'il n'était pas encore indexé.
+    
+    Args:
+        old_source (str): Ancien chemin relatif du document (source des chunks).
+        new_source (str): Nouveau chemin relatif du document.
+        new_path (str): Nouveau chemin absolu du fichier.
+        workspace_name (str, optional): Nom du nouvel espace de travail. Defaults to None.
+    """
+    try:
+        if move_source(old_source, new_source, workspace_name):
+            SummaryTask.objects.filter(source=old_source).update(source=new_source)
+            return
+    except Exception as e:
+        print(f"⚠️ Erreur déplacement des chunks de {old_source}: {e}")
+        try:
+            delete_chunks({"source": old_source})
+        except Exception as e:
+            print(f"⚠️ Erreur suppression anciens chunks: {e}")
+    SummaryTask.objects.filter(source=old_source).delete()
+    try:
+        ingest_documents([new_path], workspace=workspace_name, avec_resume=False)
+        schedule_summary(new_source)
+    except Exception as e:
+        print(f"⚠️ Erreur ré-ingestion du document {new_source}: {e}")
+
 @user_passes_test(est_admin)
 def documents(request):
     """
@@ -54,6 +86,7 @@ def documents(request):
         if new_ws_id:
             new_ws = Workspace.objects.get(id=new_ws_id)
             new_ws.document.add(doc)
+            old_source = doc.fichier.name
             old = os.path.join(settings.MEDIA_ROOT, str(doc.fichier))
             new_dir = os.path.join(settings.MEDIA_ROOT, 'documents', new_ws.name)
             os.makedirs(new_dir, exist_ok=True)
@@ -62,12 +95,8 @@ def documents(request):
                 os.rename(old, new_path)
                 doc.fichier.name = f'documents/{new_ws.name}/{os.path.basename(doc.fichier.name)}'
                 doc.save()
-                # Mettre à jour ChromaDB : suppression anciens chunks et réingestion
-                try:
-                    collection.delete(where={"source": doc.fichier.name})
-                except Exception as e:
-                    print(f"⚠️ Erreur suppression anciens chunks: {e}")
-                ingest_documents([new_path], workspace=new_ws.name)
+                # Mettre à jour ChromaDB : réécriture des métadonnées des chunks existants
+                move_chunks(old_source, doc.fichier.name, new_path, new_ws.name)
         else:
             # passe en dossier « documents/ »
             if doc.fichier:
@@ -80,12 +109,8 @@ def documents(request):
                     os.rename(old, new_path)
                     doc.fichier.name = f'documents/{os.path.basename(doc.fichier.name)}'
                     doc.save()
-                    # Mettre à jour ChromaDB : suppression anciens chunks et réingestion
-                    try:
-                        collection.delete(where={"source": old_source})
-                    except Exception as e:
-                        print(f"⚠️ Erreur suppression anciens chunks: {e}")
-                    ingest_documents([new_path], workspace=None)
+                    # Mettre à jour ChromaDB : réécriture des métadonnées des chunks existants
+                    move_chunks(old_source, doc.fichier.name, new_path, None)
 
         return redirect('documents')
 
@@ -100,35 +125,21 @@ def documents(request):
         elif workspace_id:
             workspace = Workspace.objects.filter(id=workspace_id).first()
 
-        failed_files = set()
-
+        # Les fichiers sont enregistrés puis ingérés en arrière-plan par `ingestion_worker`
+        paths = []
         for f in fichiers:
             if f.name.lower().endswith('.zip'):
-                temp_zip_path, _ = save_uploaded_file(f)
-                extracted_files, extract_dir = extract_zip(temp_zip_path)
-
-                for file_path in extracted_files:
-                    if ingest_file(file_path, workspace):
-                        attach_document_to_workspace(file_path, workspace)
-                    else:
-                        clean_file(file_path)
-                        failed_files.add(os.path.basename(file_path))
-
-                clean_file(temp_zip_path)
-                clean_file(extract_dir)
-
+                file_path, _ = save_uploaded_file(f)
             else:
                 file_path, _ = save_uploaded_file(f, workspace)
-                if ingest_file(file_path, workspace):
-                    attach_document_to_workspace(file_path, workspace)
-                else:
-                    clean_file(file_path)
-                    failed_files.add(f.name)
+            paths.append(file_path)
 
-        if failed_files:
-            return JsonResponse({'success': False, 'failed_files': list(failed_files)})
-        else:
-            return JsonResponse({'success': True})
+        job = IngestionJob.objects.create(fichiers=paths, workspace=workspace, total=len(paths))
+        return JsonResponse({
+            'success': True,
+            'job_id': job.id,
+            'status_url': reverse('ingestion_job_status', args=[job.id]),
+        })
 
     # ───── Suppression document ─────
     if request.method == 'POST' and 'delete_doc_id' in request.POST:
@@ -159,6 +170,33 @@ def documents(request):
         "workspaces": workspaces,
     })
 
+@user_passes_test(est_admin)
+def ingestion_job_status(request, job_id):
+    """
+    Renvoie l'état d'une tâche d'ingestion en arrière-plan.
+    
+    Interrogée régulièrement par la page des documents après un upload.
+    
+    Args:
+        request: La requête HTTP.
+        job_id (int): L'identifiant de la tâche d'ingestion.
+        
+    Returns:
+        JsonResponse: Statut, progression et fichiers en échec de la tâche.
+    """
+    job = get_object_or_404(IngestionJob, id=job_id)
+    return JsonResponse({
+        'job_id': job.id,
+        'status': job.statut,
+        'done': job.done,
+        'total': job.total,
+        'percent': job.percent,
+        'finished': job.statut in (IngestionJob.TERMINE, IngestionJob.ECHEC),
+        'success': job.statut == IngestionJob.TERMINE and not job.failed_files,
+        'failed_files': job.failed_files,
+        'error': job.erreur,
+    })
+
 @user_passes_test(est_admin)
 def delete_document(request, doc_id):
     """
@@ -184,10 +222,10 @@ def delete_document(request, doc_id):
     #    On supprime tous les chunks dont la métadonnée "source" correspond au chemin relatif
     #    tel que tu l'as stocké dans `document.fichier.name`
     try:
-        # ta collection importée depuis src.ingererDonnee
-        from src.ingererDonnee import collection
-        # on supprime par filtre
-        collection.delete(where={"source": document.fichier.name})
+        # on supprime par filtre (ChromaDB et index BM25)
+        delete_chunks({"source": document.fichier.name})
+        manifeste.forget(document.fichier.name)
+        SummaryTask.objects.filter(source=document.fichier.name).delete()
     except Exception as e:
         # tu peux logger ou ignorer si la suppr. échoue
         print(f"⚠️ Erreur lors de la suppression dans ChromaDB : {e}")
@@ -219,13 +257,9 @@ def delete_workspace(request):
             documents = ws.document.all()
 
             if mode == 'keep':
-                # Supprimer les chunks existants du workspace dans ChromaDB
-                try:
-                    collection.delete(where={"workspace": ws.name})
-                except Exception as e:
-                    print(f"⚠️ Erreur suppression chunks du workspace {ws.name}: {e}")
                 for doc in documents:
                     ws.document.remove(doc)
+                    old_source = doc.fichier.name
                     old_path = os.path.join(settings.MEDIA_ROOT, str(doc.fichier))
                     new_dir = os.path.join(settings.MEDIA_ROOT, 'documents')
                     new_path = os.path.join(new_dir, os.path.basename(doc.fichier.name))
@@ -234,23 +268,27 @@ def delete_workspace(request):
                         os.rename(old_path, new_path)
                         doc.fichier.name = f'documents/{os.path.basename(doc.fichier.name)}'
                         doc.save()
-                        # Ré-ingérer les chunks dans ChromaDB avec workspace None
-                        try:
-                            ingest_documents([new_path], workspace=None)
-                        except Exception as e:
-                            print(f"⚠️ Erreur ré-ingestion du document {doc.nom}: {e}")
+                        # Déplacer les chunks dans ChromaDB vers la racine (workspace None)
+                        move_chunks(old_source, doc.fichier.name, new_path, None)
+                # Supprimer les chunks restants du workspace (documents absents du disque)
+                try:
+                    delete_chunks({"workspace": ws.name})
+                except Exception as e:
+                    print(f"⚠️ Erreur suppression chunks du workspace {ws.name}: {e}")
                 ws.delete()
 
             elif mode == 'delete':
                 # Supprimer tous les chunks associés au workspace dans ChromaDB
                 try:
-                    collection.delete(where={"workspace": ws.name})
+                    delete_chunks({"workspace": ws.name})
+                    manifeste.forget_workspace(ws.name)
                 except Exception as e:
                     print(f"⚠️ Erreur suppression chunks du workspace {ws.name}: {e}")
                 for doc in documents:
                     fichier_path = os.path.join(settings.MEDIA_ROOT, str(doc.fichier))
                     if os.path.isfile(fichier_path):
                         os.remove(fichier_path)
+                    SummaryTask.objects.filter(source=doc.fichier.name).delete()
                     doc.delete()
                 ws.delete()
 
@@ -9,13 +9,11 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ASADI.settings')
 django.setup()
 
-from django.conf import settings
-import chromadb
+from src.baseVectorielle import get_collection
 
 
 def main():
-    client = chromadb.PersistentClient(path=str(settings.CHROMA_DB_DIR))
-    collection = client.get_or_create_collection("asadi_collection")
+    collection = get_collection()
 
     # Récupérer uniquement les métadatas et grouper par source
     data = collection.get(include=["metadatas"])
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from src.modeles import activer_micro_batching, warm_up
+from src.serviceRecherche import serve
+
+"""
+Commande de gestion `service_recherche`.
+
+Démarre le service de recherche autonome : un processus unique qui charge les modèles
+et le client ChromaDB, et répond aux requêtes de recherche des workers Django
+(voir src.serviceRecherche et settings.RETRIEVAL_SERVICE_URL). Les requêtes y sont
+traitées en parallèle par des threads : le micro-batching y est toujours actif.
+
+Usage :
+    python manage.py service_recherche [--bind unix:///tmp/asadi_recherche.sock]
+"""
+
+
+class Command(BaseCommand):
+    help = "Démarre le service de recherche partagé par les workers Django."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default=None,
+                            help="Adresse d'écoute (http://hôte:port ou unix:///chemin). "
+                                 "Par défaut : settings.RETRIEVAL_SERVICE_URL.")
+
+    def handle(self, *args, **options):
+        url = options['bind'] or settings.RETRIEVAL_SERVICE_URL
+        if not url:
+            raise CommandError("Aucune adresse : utilisez --bind ou définissez RETRIEVAL_SERVICE_URL.")
+        self.stdout.write("Chargement des modèles...")
+        warm_up()
+        activer_micro_batching()
+        self.stdout.write(f"Service de recherche à l'écoute sur {url}")
+        try:
+            serve(url)
+        except KeyboardInterrupt:
+            self.stdout.write("Service de recherche arrêté.")
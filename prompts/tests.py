@@ -1,3 +1,419 @@
-from django.test import TestCase
+import http.client
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from prompts import views
+from src import baseVectorielle, indexExact, modeles, recherche, reranking, routageWorkspaces
+from src.baseVectorielle import filtre_metadonnees
+from src.cacheMemoire import CacheTTL, normaliser_requete
+from src.cachePersistant import CachePersistant
+from src.microBatch import MicroBatcher
+from src.profilsRecherche import BRANCHE_MOTS_CLES, BRANCHE_VECTORIELLE, Budget
+from src.recherche import fusion_rrf
+
+"""
+Tests du pipeline de recherche : registre des modèles, micro-batching, service de recherche,
+client ChromaDB, branches de recherche, fusion RRF, reranking, cache en mémoire, filtres ChromaDB, routage des
+workspaces et recherche exacte. Aucun ne nécessite ChromaDB ni les modèles.
+"""
+
+
+def _meta(source, generation=0, **autres):
+    return {"source": source, "generation": generation, **autres}
+
+
+class RegistreModelesTests(SimpleTestCase):
+    """
+    Les modèles sont chargés à la première utilisation, une seule fois par processus.
+    """
+
+    def setUp(self):
+        patcher = mock.patch.dict(modeles._modeles, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_chargement_unique_entre_threads(self):
+        charger = mock.Mock(side_effect=lambda: time.sleep(0.05) or object())
+        resultats = []
+        threads = [threading.Thread(target=lambda: resultats.append(modeles._get("test", charger)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        charger.assert_called_once()
+        self.assertEqual(len({id(modele) for modele in resultats}), 1)
+
+    @override_settings(INFERENCE_BACKEND="onnx", ONNX_QUANTIZE=True, EMBEDDING_MODEL_NAME="modele")
+    def test_backend_onnx(self):
+        backend = mock.Mock()
+        with mock.patch.dict(sys.modules, {"src.onnxBackend": backend}):
+            self.assertIs(modeles.get_embedding_model(), backend.OnnxEmbedder.return_value)
+            modeles.get_embedding_model()
+        backend.OnnxEmbedder.assert_called_once_with("modele", True)
+        self.assertEqual(modeles.embedding_model_id(), "modele@onnx-int8")
+        with override_settings(INFERENCE_BACKEND="torch"):
+            self.assertEqual(modeles.embedding_model_id(), "modele")
+
+
+class MicroBatcherTests(SimpleTestCase):
+
+    def _soumettre_en_parallele(self, batcher, demandes):
+        resultats = {}
+        threads = [threading.Thread(target=lambda d=d: resultats.__setitem__(d[0], batcher.submit(d)))
+                   for d in demandes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return resultats
+
+    def test_appels_concurrents_regroupes(self):
+        fonction = mock.Mock(side_effect=lambda elements: [e * 10 for e in elements])
+        batcher = MicroBatcher(fonction, max_items=64, fenetre_ms=200)
+        resultats = self._soumettre_en_parallele(batcher, [[1, 2], [3], [4, 5, 6]])
+        self.assertEqual(resultats, {1: [10, 20], 3: [30], 4: [40, 50, 60]})
+        fonction.assert_called_once()
+
+    def test_taille_maximale_de_lot(self):
+        fonction = mock.Mock(side_effect=lambda elements: elements)
+        batcher = MicroBatcher(fonction, max_items=2, fenetre_ms=200)
+        self._soumettre_en_parallele(batcher, [[1, 2], [3, 4]])
+        self.assertEqual([len(c.args[0]) for c in fonction.call_args_list], [2, 2])
+
+    def test_erreur_transmise_aux_appelants(self):
+        batcher = MicroBatcher(mock.Mock(side_effect=RuntimeError("modèle indisponible")), fenetre_ms=1)
+        with self.assertRaisesMessage(RuntimeError, "modèle indisponible"):
+            batcher.submit(["a"])
+
+    @override_settings(MICRO_BATCHING=False)
+    def test_active_par_le_service(self):
+        with mock.patch.object(modeles, "_micro_batching_force", False):
+            self.assertFalse(modeles.micro_batching_actif())
+            with mock.patch.object(modeles, "_rerank_lot", return_value=[0.5]) as direct:
+                self.assertEqual(modeles.rerank([["q", "d"]]), [0.5])
+            direct.assert_called_once()
+            modeles.activer_micro_batching()
+            self.assertTrue(modeles.micro_batching_actif())
+
+
+@override_settings(RETRIEVAL_SERVICE_URL="unix:///tmp/recherche.sock")
+class ServiceRechercheTests(SimpleTestCase):
+    """
+    Repli sur la recherche locale quand le service de recherche échoue.
+    """
+
+    def _rechercher(self, erreur):
+        with mock.patch.object(views, "remote_retrieve", side_effect=erreur), \
+                mock.patch.object(recherche, "hybrid_retrieve", return_value=[("doc", {})]) as locale:
+            return views.hybrid_retrieve("congés"), locale
+
+    def test_connexion_coupee_ou_reponse_tronquee(self):
+        for erreur in (http.client.RemoteDisconnected("fermé"), http.client.IncompleteRead(b"{"),
+                       ConnectionRefusedError(), RuntimeError("HTTP 500")):
+            with self.subTest(erreur=type(erreur).__name__):
+                resultats, locale = self._rechercher(erreur)
+                self.assertEqual(resultats, [("doc", {})])
+                locale.assert_called_once()
+
+    @override_settings(RETRIEVAL_SERVICE_FALLBACK=False)
+    def test_sans_repli(self):
+        resultats, locale = self._rechercher(http.client.IncompleteRead(b"{"))
+        self.assertEqual(resultats, [])
+        locale.assert_not_called()
+
+
+@override_settings(RETRIEVAL_BRANCH_TIMEOUTS_MS={BRANCHE_VECTORIELLE: 100, BRANCHE_MOTS_CLES: 100})
+class ExecuterBranchesTests(SimpleTestCase):
+    """
+    Exécution parallèle des branches, chacune bornée par son propre délai.
+    """
+
+    def setUp(self):
+        self.budget = Budget(1000)
+        self.budget.mesurer = mock.Mock()
+        self._utiliser_pool(1)
+
+    def _utiliser_pool(self, workers):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.addCleanup(self.pool.shutdown)
+        patcher = mock.patch.object(recherche, "_pool", return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _branche(resultat, duree=0.0):
+        def fonction(query, n_results, workspaces, sources):
+            time.sleep(duree)
+            return [resultat]
+        return mock.Mock(side_effect=fonction)
+
+    def _executer(self, fonctions):
+        return recherche.executer_branches(fonctions, "q", 8, None, self.budget)
+
+    def test_budget_epuise(self):
+        self.budget = Budget(0)
+        self.budget.mesurer = mock.Mock()
+        fonctions = {BRANCHE_VECTORIELLE: self._branche("v"), BRANCHE_MOTS_CLES: self._branche("b")}
+        # Les branches attendent dans la file du pool quand la requête commence
+        self.pool.submit(time.sleep, 0.03)
+        self.assertEqual(self._executer(fonctions), [["v"], ["b"]])
+        self.assertFalse(self.budget.degradee)
+
+    def test_branche_trop_lente_abandonnee(self):
+        fonctions = {BRANCHE_VECTORIELLE: self._branche("v"), BRANCHE_MOTS_CLES: self._branche("b", 0.3)}
+        self._utiliser_pool(2)
+        self.assertEqual(self._executer(fonctions), [["v"]])
+        self.assertTrue(self.budget.degradee)
+        time.sleep(0.4)
+        # La durée de la branche abandonnée n'entre pas dans les coûts
+        self.assertEqual([c.args[0] for c in self.budget.mesurer.call_args_list], [BRANCHE_VECTORIELLE])
+
+    def test_attente_dans_la_file_bornee_par_le_delai_de_la_branche(self):
+        self.pool.submit(time.sleep, 0.3)
+        branche = self._branche("b")
+        self.assertEqual(self._executer({BRANCHE_MOTS_CLES: branche}), [])
+        self.assertTrue(self.budget.degradee)
+        time.sleep(0.3)
+        branche.assert_not_called()
+
+    def test_branche_vectorielle_jamais_abandonnee_avant_demarrage(self):
+        self.pool.submit(time.sleep, 0.3)
+        self.assertEqual(self._executer({BRANCHE_VECTORIELLE: self._branche("v")}), [["v"]])
+        self.assertFalse(self.budget.degradee)
+
+
+@override_settings(RETRIEVAL_CACHE_TTL=60, RETRIEVAL_HIERARCHICAL=False)
+class CacheResultatsTests(SimpleTestCase):
+    """
+    Mise en cache des résultats de hybrid_retrieve.
+    """
+
+    def setUp(self):
+        self.executer = mock.Mock(return_value=[[("a", "texte a", _meta("s1"))]])
+        self.index_bm25 = mock.Mock()
+        profil = {"nom": "test", "branches": [BRANCHE_VECTORIELLE, BRANCHE_MOTS_CLES],
+                  "rerank": False, "budget_ms": 60000}
+        for nom, valeur in (("executer_branches", self.executer), ("index_bm25", self.index_bm25),
+                            ("_cache_resultats", CacheTTL(10, ttl=60)), ("index_version", lambda: 1),
+                            ("workspaces_cibles", lambda query, workspace: [workspace]),
+                            ("get_profil", lambda nom: profil)):
+            patcher = mock.patch.object(recherche, nom, valeur)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_resultat_a_jour_mis_en_cache(self):
+        self.index_bm25.is_fresh.return_value = True
+        self.assertEqual(recherche.hybrid_retrieve("congés", workspace="rh"), [("texte a", _meta("s1"))])
+        recherche.hybrid_retrieve("congés", workspace="rh")
+        self.executer.assert_called_once()
+
+    def test_partition_bm25_perimee_non_mise_en_cache(self):
+        self.index_bm25.is_fresh.return_value = False
+        recherche.hybrid_retrieve("congés", workspace="rh")
+        recherche.hybrid_retrieve("congés", workspace="rh")
+        self.assertEqual(self.executer.call_count, 2)
+        self.index_bm25.is_fresh.assert_called_with(["rh"])
+
+
+class FusionRRFTests(SimpleTestCase):
+
+    def test_chunk_present_dans_les_deux_branches_passe_devant(self):
+        vectorielle = [("a", "texte a", _meta("s1")), ("b", "texte b", _meta("s2"))]
+        mots_cles = [("b", "texte b", _meta("s2")), ("c", "texte c", _meta("s3"))]
+        candidats = fusion_rrf([vectorielle, mots_cles], k=60)
+        self.assertEqual([c[0] for c in candidats], ["b", "a", "c"])
+        self.assertAlmostEqual(candidats[0][3], 1 / 61 + 1 / 62)
+
+    def test_ancienne_generation_ecartee(self):
+        branche = [("old", "ancien", _meta("s1", 1)), ("new", "nouveau", _meta("s1", 2))]
+        self.assertEqual([c[0] for c in fusion_rrf([branche], k=60)], ["new"])
+
+    def test_textes_identiques_comptes_une_fois(self):
+        branche = [("a", "même texte", _meta("s1")), ("b", "même texte", _meta("s2"))]
+        candidats = fusion_rrf([branche, [("b", "même texte", _meta("s2"))]], k=60)
+        self.assertEqual(len(candidats), 1)
+        self.assertEqual(candidats[0][0], "a")
+
+
+class RerankingTests(SimpleTestCase):
+
+    def setUp(self):
+        dossier = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dossier, True)
+        self.rerank = mock.Mock(side_effect=lambda paires: [float(len(doc)) for _, doc in paires])
+        for nom, valeur in (("rerank", self.rerank),
+                            ("rerank_cache", CachePersistant(os.path.join(dossier, "rerank.sqlite3"), 100))):
+            patcher = mock.patch.object(reranking, nom, valeur)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.candidats = [(f"c{i}", "x" * i, _meta(f"s{i}"), 1 / (61 + i)) for i in range(1, 5)]
+
+    def test_separation_nette(self):
+        self.assertTrue(reranking.separation_nette([0.8, 0.75, 0.5, 0.45], 2, 0.15))
+        self.assertFalse(reranking.separation_nette([0.8, 0.6, 0.5, 0.45], 2, 0.15))
+        # Scores RRF : toujours trop proches pour sauter le reranking
+        self.assertFalse(reranking.separation_nette([1 / 61, 1 / 62, 1 / 63], 2, 0.15))
+        self.assertFalse(reranking.separation_nette([0.9, 0.1, 0.1], 2, 0))
+
+    def test_pas_de_saut_avec_top_k_candidats_ou_moins(self):
+        self.assertFalse(reranking.separation_nette([0.9, 0.1], 2, 0.15))
+        with mock.patch.object(reranking, "_similarites") as similarites:
+            resultats = reranking.rerank_candidats("q", self.candidats[:2], top_k=2, marge=0.15)
+        similarites.assert_not_called()
+        self.assertEqual([c[0] for c in resultats], ["c2", "c1"])
+
+    def test_saut_si_selection_nette(self):
+        with mock.patch.object(reranking, "_similarites", return_value=[0.8, 0.75, 0.4, 0.3]):
+            resultats = reranking.rerank_candidats("q", self.candidats, top_k=2, marge=0.15)
+        self.assertEqual([c[0] for c in resultats], ["c1", "c2"])
+        self.rerank.assert_not_called()
+
+    def test_scores_en_cache(self):
+        with mock.patch.object(reranking, "_similarites", return_value=[0.8, 0.7, 0.7, 0.6]):
+            premiers = reranking.rerank_candidats("Congés ?", self.candidats, top_k=2, marge=0.15)
+            # Même requête normalisée : aucun nouvel appel au cross-encoder
+            seconds = reranking.rerank_candidats("congés ?", self.candidats, top_k=2, marge=0.15)
+        self.assertEqual([c[0] for c in premiers], ["c4", "c3"])
+        self.assertEqual(seconds, premiers)
+        self.rerank.assert_called_once()
+        self.assertEqual(len(self.rerank.call_args.args[0]), 4)
+
+    def test_similarites(self):
+        collection = mock.Mock()
+        collection.get.return_value = {"ids": ["c2", "c1"], "embeddings": [[0.0, 2.0], [1.0, 0.0]]}
+        with mock.patch.object(reranking, "collection", collection), \
+                mock.patch.object(reranking, "encode_queries", return_value=[[3.0, 0.0]]):
+            similarites = reranking._similarites("q", self.candidats[:3])
+        np.testing.assert_allclose(similarites, [1.0, 0.0, -1.0])
+
+
+class CacheTTLTests(SimpleTestCase):
+
+    def test_expiration(self):
+        cache = CacheTTL(10, ttl=0.05)
+        cache.set("cle", 1)
+        self.assertEqual(cache.get("cle"), 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("cle"))
+
+    def test_eviction_lru(self):
+        cache = CacheTTL(2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+
+    def test_normaliser_requete(self):
+        self.assertEqual(normaliser_requete("  Congé   ANNUEL "), "congé annuel")
+
+
+class ClientChromaTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(baseVectorielle._clients, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_mode_serveur(self):
+        with mock.patch.object(baseVectorielle.chromadb, "HttpClient") as http_client:
+            client = baseVectorielle.creer_client("server", host="chroma", port=8001, pool_size=4)
+        self.assertIs(client, http_client.return_value)
+        self.assertEqual(http_client.call_args.kwargs["host"], "chroma")
+        self.assertEqual(http_client.call_args.kwargs["port"], 8001)
+        self.assertFalse(http_client.call_args.kwargs["settings"].anonymized_telemetry)
+
+    def test_mode_inconnu(self):
+        with self.assertRaises(ValueError):
+            baseVectorielle.creer_client("memoire")
+
+    @override_settings(CHROMA_MODE="server")
+    def test_client_rouvert_apres_fork(self):
+        with mock.patch.object(baseVectorielle, "creer_client", side_effect=lambda *a, **k: object()) as creer, \
+                mock.patch.object(baseVectorielle.os, "getpid", return_value=1) as getpid:
+            premier = baseVectorielle.get_client()
+            self.assertIs(baseVectorielle.get_client(), premier)
+            getpid.return_value = 2
+            self.assertIsNot(baseVectorielle.get_client(), premier)
+        self.assertEqual(creer.call_count, 2)
+        self.assertEqual(creer.call_args.args[0], "server")
+
+
+class FiltreMetadonneesTests(SimpleTestCase):
+
+    def test_sans_restriction(self):
+        self.assertIsNone(filtre_metadonnees())
+
+    def test_un_workspace(self):
+        self.assertEqual(filtre_metadonnees(["rh"]), {"workspace": "rh"})
+
+    def test_workspace_vide_conserve(self):
+        self.assertEqual(filtre_metadonnees([""]), {"workspace": ""})
+
+    def test_workspaces_et_sources(self):
+        self.assertEqual(
+            filtre_metadonnees(["rh", "dsi"], ["a.pdf"]),
+            {"$and": [{"workspace": {"$in": ["rh", "dsi"]}}, {"source": "a.pdf"}]},
+        )
+
+
+@override_settings(WORKSPACE_ROUTING_TOP=2, WORKSPACE_ROUTING_MARGIN=0.5)
+class RoutageWorkspacesTests(SimpleTestCase):
+
+    def _centroides(self, noms, matrice):
+        return mock.patch.object(routageWorkspaces, "centroides_workspaces", return_value=(noms, matrice))
+
+    def test_pas_de_routage_avec_peu_de_workspaces(self):
+        with self._centroides(["rh", "dsi"], np.eye(2, dtype=np.float32)):
+            self.assertIsNone(routageWorkspaces.route([1.0, 0.0]))
+
+    def test_workspaces_les_plus_proches(self):
+        with self._centroides(["rh", "dsi", "scol"], np.eye(3, dtype=np.float32)):
+            self.assertEqual(routageWorkspaces.route([1.0, 0.8, 0.0]), ["rh", "dsi"])
+
+    def test_marge(self):
+        with self._centroides(["rh", "dsi", "scol"], np.eye(3, dtype=np.float32)):
+            self.assertEqual(routageWorkspaces.route([1.0, 0.1, 0.0]), ["rh"])
+
+    def test_index_vide(self):
+        with self._centroides([], None):
+            self.assertIsNone(routageWorkspaces.route([1.0, 0.0]))
+
+
+class IndexExactTests(SimpleTestCase):
+
+    def _matrice(self, embeddings, ids, sources, dtype=np.float32):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return indexExact.Matrice("ws", "v1", indexExact.MODE_EXACT, embeddings.astype(dtype),
+                                  np.array(ids), np.array(sources))
+
+    def test_plus_proches_voisins(self):
+        matrice = self._matrice([[1, 0], [0, 1], [1, 1]], ["a", "b", "c"], ["s1", "s2", "s3"])
+        resultats = indexExact.search([1.0, 0.1], 2, [matrice])
+        self.assertEqual([cid for cid, _ in resultats], ["a", "c"])
+        self.assertGreater(resultats[0][1], resultats[1][1])
+
+    def test_float16(self):
+        matrice = self._matrice([[1, 0], [0, 1]], ["a", "b"], ["s1", "s2"], dtype=np.float16)
+        self.assertEqual(indexExact.search([0.0, 1.0], 1, [matrice])[0][0], "b")
+
+    def test_filtre_sources(self):
+        matrice = self._matrice([[1, 0], [0, 1]], ["a", "b"], ["s1", "s2"])
+        self.assertEqual([cid for cid, _ in indexExact.search([1.0, 0.0], 5, [matrice], ["s2"])], ["b"])
+
+    def test_plusieurs_workspaces(self):
+        m1 = self._matrice([[1, 0]], ["a"], ["s1"])
+        m2 = self._matrice([[0.9, 0.1]], ["b"], ["s2"])
+        self.assertEqual([cid for cid, _ in indexExact.search([1.0, 0.0], 2, [m2, m1])], ["a", "b"])
@@ -1,3 +1,4 @@
+import http.client
 import os
 import re
 from urllib.parse import urlencode
@@ -22,9 +23,7 @@ from scenario.models import Scenario, ScenarioLance
 from utilisateurs.models import Utilisateur
 from workspace.models import Workspace
 from .models import Prompt, Question, Reponse
-from sentence_transformers import CrossEncoder
-from rank_bm25 import BM25Okapi
-from src.outils import preprocess
+from src.serviceRecherche import remote_retrieve
 from src.api import generate_prompt_title, reponseAssistant
 
 """
@@ -38,50 +37,10 @@ la recherche de documents, et diverses fonctionnalités liées aux utilisateurs
 comme la génération d'avatars et le changement de mot de passe.
 """
 
-# ─── Initialisation ChromaDB + Embeddings ─────────────────────────────────────────────────
-"""
-Initialisation de ChromaDB et des embeddings pour la recherche vectorielle.
-
-Ce bloc configure le client ChromaDB, la fonction d'embedding et la collection
-qui seront utilisés pour la recherche sémantique de documents.
-"""
-import chromadb
-from chromadb.utils import embedding_functions
-
-# 1) Client persistant (PersistentClient gère la persistence sans persist())
-chroma_client = chromadb.PersistentClient(path=str(settings.CHROMA_DB_DIR))
-
-# 2) EmbeddingFunction conforme à l'interface ChromaDB
-embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="all-mpnet-base-v2"
-)
-
-
-
-# 3) Création / récupération de la collection
-collection = chroma_client.get_or_create_collection(
-    name="asadi_collection",
-    embedding_function=embedding_fn
-)
-
-
-# Partie pour gérer le retriever et le reranker
-"""
-Initialisation du modèle de reranking.
-
-Ce modèle est utilisé pour réordonner les résultats de recherche en fonction
-de leur pertinence par rapport à la requête de l'utilisateur.
-"""
-reranker = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
-
-
-
-
-
-
-
-
-
+# ─── Recherche ─────────────────────────────────────────────────────────────
+# Le pipeline de recherche (ChromaDB, embeddings, reranker) vit dans src.recherche.
+# Si settings.RETRIEVAL_SERVICE_URL est défini, il est exécuté par le service de
+# recherche autonome et les workers Django n'en chargent rien.
 
 
 # ────────────────────────────────────────────────────────────────────────────
@@ -152,69 +111,38 @@ def linkify_documents(text: str) -> str:
     # Étape 4: Retourner le HTML sécurisé
     return mark_safe(html)
 
-def hybrid_retrieve(query, n_results=8, workspace=None):
+def hybrid_retrieve(query, n_results=8, workspace=None, profil=None):
     """
     Effectue une recherche hybride (vectorielle et par mots-clés) sur les documents indexés.
     
-    Cette fonction combine une recherche vectorielle (sémantique) et une recherche par mots-clés (BM25)
-    pour trouver les documents les plus pertinents par rapport à la requête. Les résultats sont
-    ensuite réordonnés par un modèle de reranking pour améliorer la pertinence.
+    La recherche est déléguée au service de recherche autonome si settings.RETRIEVAL_SERVICE_URL
+    est défini ; sinon (ou si le service est injoignable et que settings.RETRIEVAL_SERVICE_FALLBACK
+    est actif), elle est exécutée dans le processus courant par src.recherche.hybrid_retrieve.
     
     Args:
         query (str): La requête de recherche de l'utilisateur.
         n_results (int, optional): Nombre de résultats à retourner. Defaults to 8.
         workspace (str, optional): Filtre par espace de travail. Defaults to None.
+        profil (str, optional): Profil de recherche ("fast", "balanced", "accurate"). Defaults to None.
         
     Returns:
         list: Liste de tuples (document, métadonnées) des documents les plus pertinents.
     """
-    # 🔄 Charger corpus et BM25 dynamiquement
-    docs_raw = collection.get(include=["documents", "metadatas"])
-    corpus = docs_raw["documents"]
-    metadatas = docs_raw["metadatas"]
-
-    bm25 = None
-    if corpus:
-        tokenized_corpus = [preprocess(doc) for doc in corpus]
-        bm25 = BM25Okapi(tokenized_corpus)
-
-    query_embedding = embedding_fn([query])
-
-    # 🔍 Recherche vectorielle
-    vector_results = collection.query(
-        query_embeddings=query_embedding,
-        n_results=n_results,
-        where={"workspace": workspace} if workspace else None
-    )
-
-    vector_chunks = []
-    if vector_results.get("documents"):
-        for doc, meta in zip(vector_results["documents"][0], vector_results["metadatas"][0]):
-            vector_chunks.append((doc, meta))
-
-    # 🔍 Recherche mots-clés avec BM25
-    keyword_matches = []
-    if bm25:
-        tokenized_query = preprocess(query)
-        scores = bm25.get_scores(tokenized_query)
-        top_bm25_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:n_results]
-        keyword_matches = [(corpus[i], metadatas[i]) for i in top_bm25_indices if scores[i] > 0]
-
-    # 🔗 Fusionner sans doublons
-    combined_chunks = vector_chunks + keyword_matches
-    combined_chunks = list({doc: meta for doc, meta in combined_chunks}.items())
-    combined_chunks = combined_chunks[:50]
-
-    # 🔁 Reranking
-    rerank_inputs = [[query, doc] for doc, _ in combined_chunks]
-    if rerank_inputs:
-        rerank_scores = reranker.predict(rerank_inputs)
-        sorted_combined = sorted(zip(rerank_scores, combined_chunks), reverse=True)
-        top_chunks = [(doc, meta) for score, (doc, meta) in sorted_combined[:4]]
-    else:
-        top_chunks = []
+    if settings.RETRIEVAL_SERVICE_URL:
+        try:
+            return remote_retrieve(
+                settings.RETRIEVAL_SERVICE_URL, query, n_results=n_results,
+                workspace=workspace, profil=profil, timeout=settings.RETRIEVAL_SERVICE_TIMEOUT,
+            )
+        # HTTPException : réponse tronquée ou connexion coupée par le service (IncompleteRead, ...)
+        except (OSError, http.client.HTTPException, RuntimeError, ValueError) as e:
+            print(f"⚠️ Service de recherche indisponible : {e!r}")
+            if not settings.RETRIEVAL_SERVICE_FALLBACK:
+                return []
 
-    return top_chunks
+    # Import local : les modèles et le client ChromaDB ne sont chargés qu'en mode local
+    from src.recherche import hybrid_retrieve as recherche_locale
+    return recherche_locale(query, n_results=n_results, workspace=workspace, profil=profil)
 
 
 
@@ -289,12 +217,10 @@ def prompt(request):
             user.save()
 
         # ─── pipeline RAG + LLM ─────────────────────────────────────────
-        query_embeddings = embedding_fn([user_input])  # liste de 1 seul élément
-
-
         # Filtrer les contextes par workspace si sélectionné
 # TEEEEEEEEST
-        results = hybrid_retrieve(user_input, n_results=8, workspace=workspace_selected)
+        results = hybrid_retrieve(user_input, n_results=8, workspace=workspace_selected,
+                                  profil=request.POST.get("profil"))
 
 
 
@@ -1,4 +1,17 @@
-import chromadb
-client = chromadb.PersistentClient(path="./chroma_db")
-client.delete_collection("asadi_collection")
-print("✅ base ChromaDB vidée.")
\ No newline at end of file
+import os
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ASADI.settings')
+django.setup()
+
+from django.conf import settings
+from src.baseVectorielle import bump_index_version, get_client
+
+client = get_client()
+client.delete_collection(settings.CHROMA_COLLECTION_NAME)
+try:
+    client.delete_collection(settings.CHROMA_SOURCES_COLLECTION_NAME)
+except Exception:
+    pass  # index de documents jamais créé
+bump_index_version()
+print("✅ base ChromaDB vidée.")
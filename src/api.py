@@ -1,7 +1,10 @@
-from typing import Any
+from typing import Any, List, Optional
 from pydantic import Field
 from decouple import config
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time, requests
+from langchain.text_splitter import RecursiveCharacterTextSplitter
 from llama_index.core.llms import (
     CustomLLM,
     CompletionResponse,
@@ -202,12 +205,6 @@ def reponseAssistant(results, query, history_messages=None):
 
 
 def resumeDocument(document):
-    url = "https://pleiade.mi.parisdescartes.fr/api/chat/completions"
-    headers = {
-        "Authorization": f"Bearer sk-{config('API_KEY')}",
-        "Content-Type": "application/json"
-    }
-
     system_prompt = """
     Tu es un assistant expert en analyse de documents administratifs.
 
@@ -228,19 +225,31 @@ Rédige un paragraphe unique, informatif, fluide et compact, prêt à être int
     """
   
 
-    # On construit la liste des messages
-    messages = [
-        {"role": "system", "content": system_prompt},
-    ]
- 
-    messages.append({
-        "role": "user",
-        "content": f"Document  : {document}"
-    })
+    return _requetePleiade(system_prompt, f"Document  : {document}")
+
 
+def _requetePleiade(system_prompt: str, contenu: str) -> Optional[str]:
+    """
+    Envoie une requête (consigne système + message utilisateur) à Pleiade.
+    
+    Args:
+        system_prompt (str): Consigne système.
+        contenu (str): Message de l'utilisateur.
+        
+    Returns:
+        Optional[str]: Le texte généré, ou None en cas d'erreur.
+    """
+    url = "https://pleiade.mi.parisdescartes.fr/api/chat/completions"
+    headers = {
+        "Authorization": f"Bearer sk-{config('API_KEY')}",
+        "Content-Type": "application/json"
+    }
     payload = {
         "model": "llama3.3:latest",
-        "messages": messages,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": contenu},
+        ],
         "temperature": 0.3
     }
 
@@ -270,6 +279,139 @@ Rédige un paragraphe unique, informatif, fluide et compact, prêt à être int
 
 
 
+# Nombre maximum d'appels de résumé simultanés vers Pleiade (tous documents confondus)
+LLM_MAX_CONCURRENT = config('LLM_MAX_CONCURRENT', default=4, cast=int)
+_limite_resumes = threading.BoundedSemaphore(LLM_MAX_CONCURRENT)
+
+# Approximation du nombre de caractères par token pour du texte français
+CARACTERES_PAR_TOKEN = 3.5
+
+
+def budget_resume() -> int:
+    """
+    Calcule la taille maximale (en caractères) d'un texte envoyé en une requête de résumé.
+    
+    Le budget est dérivé de la fenêtre de contexte de PleiadeLLM, dont on retire
+    les tokens réservés à la réponse et une marge pour le prompt système.
+    
+    Returns:
+        int: Nombre de caractères maximum par requête.
+    """
+    champs = PleiadeLLM.model_fields
+    tokens = champs["context_window"].default - champs["num_output"].default - 600
+    return int(tokens * CARACTERES_PAR_TOKEN)
+
+
+def _requeteResume(system_prompt: str, contenu: str) -> Optional[str]:
+    """
+    Envoie une requête de résumé à Pleiade en respectant la limite d'appels simultanés.
+    
+    Args:
+        system_prompt (str): Consigne système.
+        contenu (str): Texte à résumer.
+        
+    Returns:
+        Optional[str]: Le texte généré, ou None en cas d'erreur.
+    """
+    with _limite_resumes:
+        return _requetePleiade(system_prompt, contenu)
+
+
+def resumeSection(section: str) -> Optional[str]:
+    """
+    Résume une section d'un document trop long pour être résumé en une seule requête (étape « map »).
+    
+    Args:
+        section (str): Texte de la section.
+        
+    Returns:
+        Optional[str]: Résumé de la section, ou None en cas d'erreur.
+    """
+    system_prompt = """
+    Tu es un assistant expert en analyse de documents administratifs.
+    On te donne un extrait d'un document plus long. Résume fidèlement cet extrait en 5 à 10 phrases :
+    objectifs, bénéficiaires, conditions ou critères, démarches et dates clés qui y figurent.
+    N'ajoute rien qui ne soit pas dans l'extrait et ne fais pas d'introduction.
+    """
+    return _requeteResume(system_prompt, f"Extrait : {section}")
+
+
+def fusionResumes(resumes: List[str]) -> Optional[str]:
+    """
+    Fusionne les résumés partiels d'un document en un résumé final (étape « reduce »).
+    
+    Args:
+        resumes (List[str]): Résumés des sections, dans l'ordre du document.
+        
+    Returns:
+        Optional[str]: Résumé final du document, ou None en cas d'erreur.
+    """
+    system_prompt = """
+    Tu es un assistant expert en analyse de documents administratifs.
+    On te donne, dans l'ordre, les résumés des parties successives d'un même document administratif.
+    Rédige à partir d'eux un **unique paragraphe de 80 à 150 mots**, clair et compréhensible par une personne
+    non spécialiste : objectifs du document, bénéficiaires concernés, conditions ou critères, démarches à suivre
+    et dates clés. Reste fidèle aux résumés, sans interprétation ni ajout, et utilise une formule directe et
+    factuelle (ne commence pas par « Ce document explique… »).
+    """
+    parties = "\n\n".join(f"Partie {i + 1} : {r}" for i, r in enumerate(resumes))
+    return _requeteResume(system_prompt, f"Résumés des parties : {parties}")
+
+
+def resumeDocumentLong(document: str, budget: Optional[int] = None) -> Optional[str]:
+    """
+    Résume un document de taille quelconque par map-reduce.
+    
+    Un document qui tient dans le budget de contexte est résumé en une requête
+    (`resumeDocument`). Sinon il est découpé en sections qui tiennent dans le budget,
+    résumées en parallèle, puis les résumés partiels sont fusionnés ; si leur
+    concaténation dépasse encore le budget, l'opération est répétée sur ces résumés.
+    Le nombre d'appels croît linéairement avec la taille du document. Si une seule
+    section ne peut être résumée, le résumé échoue (pas de résumé partiel).
+    
+    Args:
+        document (str): Texte complet du document.
+        budget (Optional[int], optional): Taille maximale d'une requête en caractères. Defaults to budget_resume().
+        
+    Returns:
+        Optional[str]: Résumé du document, ou None si une section n'a pas pu être résumée.
+    """
+    budget = budget or budget_resume()
+    if len(document) <= budget:
+        with _limite_resumes:
+            return resumeDocument(document)
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=budget, chunk_overlap=0, length_function=len)
+    sections = splitter.split_text(document)
+    # Au plus autant de threads que d'appels simultanés autorisés par _limite_resumes
+    with ThreadPoolExecutor(max_workers=min(len(sections), LLM_MAX_CONCURRENT)) as pool:
+        resumes = list(pool.map(resumeSection, sections))
+    if not all(resumes):
+        print(f"⚠️ Résumé abandonné : {sum(not r for r in resumes)} section(s) sur {len(sections)} en erreur")
+        return None
+
+    while len("\n\n".join(resumes)) > budget:
+        groupes, courant = [], []
+        for r in resumes:
+            if courant and len("\n\n".join(courant + [r])) > budget:
+                groupes.append(courant)
+                courant = []
+            courant.append(r)
+        groupes.append(courant)
+        if len(groupes) == 1:
+            break
+        with ThreadPoolExecutor(max_workers=min(len(groupes), LLM_MAX_CONCURRENT)) as pool:
+            resumes = list(pool.map(fusionResumes, groupes))
+        if not all(resumes):
+            return None
+
+    return fusionResumes(resumes)
+
+
+
+
+
+
 def generate_prompt_title(first_question: str) -> str:
     """
     Génère un titre court pour une conversation basé sur la première question.
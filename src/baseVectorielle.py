@@ -0,0 +1,194 @@
+import os
+import threading
+from typing import List, Optional
+
+import chromadb
+from chromadb.config import Settings
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+"""
+Accès partagé à la base vectorielle ChromaDB.
+
+Deux modes, choisis par settings.CHROMA_MODE :
+    - "persistent" : base embarquée (PersistentClient) sur settings.CHROMA_DB_DIR ;
+    - "server"     : serveur Chroma lancé à part (commande `chroma_server`), interrogé par
+      un client HTTP.
+
+En mode serveur, seules les collections passent par Chroma : la version de l'index, le
+manifeste, l'index BM25 et les autres fichiers de settings.CHROMA_DB_DIR restent locaux et
+doivent être partagés par tous les processus (voir le commentaire de settings.CHROMA_MODE).
+
+Dans les deux cas, un seul client est ouvert par processus et partagé par tous les
+modules ; en mode serveur, ses connexions HTTP (keep-alive) sont réutilisées d'une
+requête à l'autre dans la limite de settings.CHROMA_HTTP_POOL_SIZE. Le client est
+ouvert à la première utilisation (et rouvert après un fork), jamais à l'import.
+
+La version de l'index (fichier settings.INDEX_VERSION_PATH) est incrémentée par toute
+écriture dans la collection (ingestion, résumé, déplacement, suppression) ; elle entre
+dans les clés des caches de recherche, qui ne servent ainsi jamais de chunks périmés.
+"""
+
+_clients = {}
+_verrou = threading.Lock()
+
+
+def creer_client(mode: str, path: Optional[str] = None, host: Optional[str] = None,
+                 port: Optional[int] = None, pool_size: Optional[int] = None):
+    """
+    Ouvre un client ChromaDB.
+
+    Args:
+        mode (str): "persistent" ou "server".
+        path (Optional[str], optional): Dossier de la base embarquée (mode "persistent").
+        host (Optional[str], optional): Hôte du serveur Chroma (mode "server").
+        port (Optional[int], optional): Port du serveur Chroma (mode "server").
+        pool_size (Optional[int], optional): Connexions HTTP maximum (mode "server").
+
+    Returns:
+        chromadb.ClientAPI: Le client ouvert.
+
+    Raises:
+        ValueError: Si le mode est inconnu.
+    """
+    if mode == "persistent":
+        return chromadb.PersistentClient(path=str(path))
+    if mode == "server":
+        options = {"anonymized_telemetry": False}
+        if pool_size and "chroma_http_max_connections" in Settings.__fields__:
+            options["chroma_http_max_connections"] = pool_size
+            options["chroma_http_max_keepalive_connections"] = pool_size
+        return chromadb.HttpClient(host=host, port=port, settings=Settings(**options))
+    raise ValueError(f"Mode ChromaDB inconnu : {mode}")
+
+
+def get_client():
+    """
+    Client ChromaDB partagé par le processus, selon settings.CHROMA_MODE.
+
+    Returns:
+        chromadb.ClientAPI: Le client du processus courant.
+    """
+    pid = os.getpid()
+    client = _clients.get(pid)
+    if client is None:
+        with _verrou:
+            client = _clients.get(pid)
+            if client is None:
+                client = creer_client(
+                    settings.CHROMA_MODE,
+                    path=settings.CHROMA_DB_DIR,
+                    host=settings.CHROMA_SERVER_HOST,
+                    port=settings.CHROMA_SERVER_PORT,
+                    pool_size=settings.CHROMA_HTTP_POOL_SIZE,
+                )
+                # Un client hérité d'un fork (connexions, verrous) n'est pas réutilisé
+                _clients.clear()
+                _clients[pid] = client
+    return client
+
+
+def get_collection(nom: Optional[str] = None, metadata: Optional[dict] = None):
+    """
+    Collection ChromaDB `nom`, créée si besoin.
+
+    Args:
+        nom (Optional[str], optional): Nom de la collection. Defaults to settings.CHROMA_COLLECTION_NAME (chunks).
+        metadata (Optional[dict], optional): Métadonnées de création (ex: {"hnsw:space": "cosine"}). Defaults to None.
+
+    Returns:
+        chromadb.Collection: La collection.
+    """
+    return get_client().get_or_create_collection(nom or settings.CHROMA_COLLECTION_NAME, metadata=metadata)
+
+
+def filtre_metadonnees(workspaces: Optional[List[str]] = None, sources: Optional[List[str]] = None) -> Optional[dict]:
+    """
+    Filtre ChromaDB (`where`) limitant une recherche à des workspaces et/ou à des sources.
+
+    Args:
+        workspaces (Optional[List[str]], optional): Workspaces autorisés (None : tous). Defaults to None.
+        sources (Optional[List[str]], optional): Sources autorisées (None : toutes). Defaults to None.
+
+    Returns:
+        Optional[dict]: Le filtre, ou None si la recherche n'est pas restreinte.
+    """
+    conditions = []
+    for champ, valeurs in (("workspace", workspaces), ("source", sources)):
+        if valeurs is None:
+            continue
+        valeurs = list(valeurs)
+        conditions.append({champ: valeurs[0]} if len(valeurs) == 1 else {champ: {"$in": valeurs}})
+    if len(conditions) > 1:
+        return {"$and": conditions}
+    return conditions[0] if conditions else None
+
+
+class _CollectionPartagee:
+    """
+    Collection résolue à la première utilisation, pour pouvoir être importée
+    par les modules (`from src.baseVectorielle import collection`) sans ouvrir de client.
+    """
+
+    def __init__(self, setting_nom: str = "CHROMA_COLLECTION_NAME", metadata: Optional[dict] = None):
+        # Le nom est lu dans les settings à la première utilisation, pas à l'import
+        self._setting_nom = setting_nom
+        self._metadata = metadata
+        self._collections = {}
+
+    def __getattr__(self, nom):
+        pid = os.getpid()
+        collection = self._collections.get(pid)
+        if collection is None:
+            collection = get_collection(getattr(settings, self._setting_nom), self._metadata)
+            self._collections = {pid: collection}
+        return getattr(collection, nom)
+
+
+collection = _CollectionPartagee()
+# Index de niveau document : un centroïde (moyenne des embeddings des chunks) par source
+collection_sources = _CollectionPartagee("CHROMA_SOURCES_COLLECTION_NAME", {"hnsw:space": "cosine"})
+
+
+def index_version() -> int:
+    """
+    Version courante de l'index (contenu de la collection).
+
+    Returns:
+        int: Numéro de version (0 si l'index n'a jamais été modifié).
+    """
+    try:
+        with open(settings.INDEX_VERSION_PATH, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def bump_index_version() -> int:
+    """
+    Incrémente la version de l'index, après une écriture dans la collection.
+
+    Le fichier est remplacé atomiquement, sous un verrou inter-processus.
+
+    Returns:
+        int: Nouvelle version.
+    """
+    chemin = str(settings.INDEX_VERSION_PATH)
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    with open(f"{chemin}.lock", "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            version = index_version() + 1
+            tmp = f"{chemin}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(str(version))
+            os.replace(tmp, chemin)
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    return version
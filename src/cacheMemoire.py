@@ -0,0 +1,86 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+"""
+Cache LRU en mémoire avec durée de vie (TTL).
+
+Utilisé pour les requêtes répétées du chat (mêmes questions administratives posées
+plusieurs fois) : embeddings des requêtes et résultats de la recherche hybride.
+Le cache est propre au processus ; les entrées expirent après `ttl` secondes et les
+moins récemment utilisées sont évincées au-delà de `max_entries`.
+"""
+
+_ABSENT = object()
+
+
+def normaliser_requete(query: str) -> str:
+    """
+    Forme normalisée d'une requête utilisée comme clé de cache.
+
+    Args:
+        query (str): La requête.
+
+    Returns:
+        str: La requête en minuscules, Unicode NFC, espaces réduits.
+    """
+    return " ".join(unicodedata.normalize("NFC", query).lower().split())
+
+
+class CacheTTL:
+    """
+    Cache LRU thread-safe dont les entrées expirent.
+
+    Attributes:
+        max_entries (int): Nombre maximum d'entrées conservées.
+        ttl (float): Durée de vie d'une entrée, en secondes.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def get(self, cle: Hashable, defaut=None):
+        """
+        Renvoie la valeur associée à `cle` si elle est présente et non expirée.
+
+        Args:
+            cle (Hashable): Clé recherchée.
+            defaut (optional): Valeur renvoyée en cas d'absence. Defaults to None.
+        """
+        with self._verrou:
+            entree = self._entrees.get(cle, _ABSENT)
+            if entree is _ABSENT:
+                return defaut
+            expiration, valeur = entree
+            if expiration < time.monotonic():
+                del self._entrees[cle]
+                return defaut
+            self._entrees.move_to_end(cle)
+            return valeur
+
+    def set(self, cle: Hashable, valeur, ttl: Optional[float] = None) -> None:
+        """
+        Enregistre une valeur, puis évince les entrées les plus anciennes si nécessaire.
+
+        Args:
+            cle (Hashable): Clé.
+            valeur: Valeur à conserver.
+            ttl (Optional[float], optional): Durée de vie de l'entrée. Defaults to self.ttl.
+        """
+        with self._verrou:
+            self._entrees[cle] = (time.monotonic() + (self.ttl if ttl is None else ttl), valeur)
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.max_entries:
+                self._entrees.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Vide le cache.
+        """
+        with self._verrou:
+            self._entrees.clear()
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+"""
+Cache clé/valeur persistant sur disque à taille bornée.
+
+Ce module fournit un petit cache stocké dans un fichier SQLite, partagé entre les
+processus (serveur web, commandes d'ingestion) et borné en nombre d'entrées :
+lorsque la limite est dépassée, les entrées les moins récemment utilisées sont évincées.
+"""
+
+
+def cle_hash(*parts: str) -> str:
+    """
+    Construit une clé de cache à partir de plusieurs éléments (modèle, texte, ...).
+
+    Args:
+        *parts (str): Éléments composant la clé.
+
+    Returns:
+        str: Empreinte SHA-256 hexadécimale des éléments.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class CachePersistant:
+    """
+    Cache LRU persistant stocké dans une base SQLite.
+
+    Attributes:
+        path (str): Chemin du fichier SQLite.
+        max_entries (int): Nombre maximum d'entrées conservées.
+    """
+
+    def __init__(self, path, max_entries: int):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "cle TEXT PRIMARY KEY, valeur BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache(last_used)")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """
+        Récupère les valeurs présentes en cache pour une liste de clés.
+
+        Args:
+            keys (Iterable[str]): Clés recherchées.
+
+        Returns:
+            dict: Valeurs trouvées, indexées par clé (les clés absentes sont omises).
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        conn = self._conn()
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            rows = conn.execute(
+                f"SELECT cle, valeur FROM cache WHERE cle IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            found.update(rows)
+        if found:
+            now = time.time()
+            with conn:
+                conn.executemany("UPDATE cache SET last_used = ? WHERE cle = ?", [(now, k) for k in found])
+        return found
+
+    def set_many(self, items: List[Tuple[str, bytes]]) -> None:
+        """
+        Ajoute ou remplace des entrées, puis évince les plus anciennes si la limite est dépassée.
+
+        Args:
+            items (List[Tuple[str, bytes]]): Couples (clé, valeur) à enregistrer.
+        """
+        if not items:
+            return
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (cle, valeur, last_used) VALUES (?, ?, ?)",
+                [(k, v, now) for k, v in items],
+            )
+            count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_entries:
+                # On libère 10 % de marge pour ne pas évincer à chaque insertion
+                surplus = count - int(self.max_entries * 0.9)
+                conn.execute(
+                    "DELETE FROM cache WHERE cle IN (SELECT cle FROM cache ORDER BY last_used LIMIT ?)",
+                    (surplus,),
+                )
@@ -0,0 +1,411 @@
+import os
+import sqlite3
+import threading
+import uuid
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csc_matrix
+
+from .outils import ANALYSEUR_VERSION, analyser
+
+"""
+Index inversé BM25 persistant et incrémental.
+
+La recherche par mots-clés reconstruisait un `BM25Okapi` sur tout le corpus à chaque
+question (lecture de toute la collection ChromaDB et tokenisation de tous les chunks).
+Cet index stocke les listes de postings (terme -> chunks, fréquence) et les statistiques
+du corpus dans un fichier SQLite. Il est mis à jour à chaque écriture dans la collection
+(ingestion, résumé, déplacement, suppression) et une requête ne lit que les postings de
+ses propres termes.
+
+Les postings et les statistiques (nombre de chunks, longueur totale) sont partitionnés
+par workspace : une recherche limitée à un workspace ne parcourt que sa partition, avec
+les statistiques de cette partition, comme la branche vectorielle filtrée sur le même
+workspace. Une recherche peut aussi être restreinte à quelques sources du workspace.
+
+Pour le calcul des scores, les postings d'une partition sont chargés une fois en une
+matrice creuse chunks x termes (CSC) contenant directement les poids BM25 ; une requête
+additionne les colonnes de ses termes et sélectionne le top-k avec `argpartition`.
+Cette matrice est gardée en mémoire tant que la version de la partition (incrémentée
+à chaque écriture) ne change pas. Après une écriture, la matrice périmée continue de
+servir les requêtes pendant qu'un thread d'arrière-plan recharge la partition puis la
+remplace : seul le tout premier chargement d'une partition a lieu pendant une requête. Les textes sont analysés par `src.outils.analyser`
+(mots vides et racinisation du français).
+
+Le remplissage complet de l'index à partir de ChromaDB (`rebuild`) a lieu hors des requêtes :
+commande `index_bm25` ou démarrage du worker d'ingestion. Il est enregistré dans la table
+`meta` (`is_complete`), vidée avec l'index lors d'un changement de schéma ou d'analyseur.
+"""
+
+# Change à chaque modification du schéma ou de l'analyseur : l'index est alors vidé
+# puis reconstruit à partir de ChromaDB
+INDEX_VERSION = f"3.{ANALYSEUR_VERSION}"
+
+K1 = 1.5
+B = 0.75
+
+
+class _Partition(NamedTuple):
+    """
+    Matrice de scores BM25 d'une partition, chargée en mémoire.
+    """
+    version: int
+    ids: List[str]
+    sources: np.ndarray
+    vocabulaire: Dict[str, int]
+    matrice: csc_matrix
+
+
+class IndexBM25:
+    """
+    Index inversé BM25 stocké dans une base SQLite.
+
+    Attributes:
+        path (str): Chemin du fichier SQLite.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        self._partitions: Dict[Optional[str], _Partition] = {}
+        self._verrou = threading.Lock()
+        # Partitions en cours de rechargement en arrière-plan : {"pid": ..., "workspaces": set()}
+        self._rechargements = {"pid": None, "workspaces": set()}
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (cle TEXT PRIMARY KEY, valeur TEXT NOT NULL)")
+                version = conn.execute("SELECT valeur FROM meta WHERE cle = 'version'").fetchone()
+                if version is None or version[0] != INDEX_VERSION:
+                    # Schéma ou tokenisation différents : l'index sera reconstruit depuis ChromaDB
+                    for table in ("postings", "chunks", "stats"):
+                        conn.execute(f"DROP TABLE IF EXISTS {table}")
+                    conn.execute("DELETE FROM meta")
+                    conn.execute("INSERT INTO meta (cle, valeur) VALUES ('version', ?)", (INDEX_VERSION,))
+                # Identifiant de cette instance de l'index : les versions des workspaces repartent
+                # de zéro lorsqu'il est recréé
+                conn.execute("INSERT OR IGNORE INTO meta (cle, valeur) VALUES ('instance', ?)", (uuid.uuid4().hex,))
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS chunks ("
+                    "num INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE NOT NULL, workspace TEXT NOT NULL, "
+                    "source TEXT NOT NULL, longueur INTEGER NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS postings ("
+                    "workspace TEXT NOT NULL, terme TEXT NOT NULL, source TEXT NOT NULL, "
+                    "num INTEGER NOT NULL, tf INTEGER NOT NULL, "
+                    "PRIMARY KEY (workspace, terme, source, num)) WITHOUT ROWID"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS postings_terme ON postings(terme)")
+                conn.execute("CREATE INDEX IF NOT EXISTS postings_num ON postings(num)")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS stats ("
+                    "workspace TEXT PRIMARY KEY, n_docs INTEGER NOT NULL, longueur_totale INTEGER NOT NULL, "
+                    "version INTEGER NOT NULL DEFAULT 0)"
+                )
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _vider(conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM postings")
+        conn.execute("DELETE FROM chunks")
+        # Les versions continuent de croître pour invalider les matrices en mémoire
+        conn.execute("UPDATE stats SET n_docs = 0, longueur_totale = 0, version = version + 1")
+
+    @staticmethod
+    def _ajuster_stats(conn: sqlite3.Connection, workspace: str, n_docs: int, longueur: int) -> None:
+        conn.execute(
+            "INSERT INTO stats (workspace, n_docs, longueur_totale, version) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT(workspace) DO UPDATE SET "
+            "n_docs = n_docs + excluded.n_docs, longueur_totale = longueur_totale + excluded.longueur_totale, "
+            "version = version + 1",
+            (workspace, n_docs, longueur),
+        )
+
+    @staticmethod
+    def _supprimer(conn: sqlite3.Connection, ids: List[str]) -> int:
+        supprimes = 0
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT num, workspace, longueur FROM chunks WHERE chunk_id IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            if not rows:
+                continue
+            nums = [num for num, _, _ in rows]
+            marques = ','.join('?' * len(nums))
+            conn.execute(f"DELETE FROM postings WHERE num IN ({marques})", nums)
+            conn.execute(f"DELETE FROM chunks WHERE num IN ({marques})", nums)
+            par_workspace = {}
+            for _, workspace, longueur in rows:
+                n, total = par_workspace.get(workspace, (0, 0))
+                par_workspace[workspace] = (n + 1, total + longueur)
+            for workspace, (n, total) in par_workspace.items():
+                IndexBM25._ajuster_stats(conn, workspace, -n, -total)
+            supprimes += len(rows)
+        return supprimes
+
+    def add(self, ids: List[str], documents: List[str], metadatas: Optional[List[dict]] = None) -> None:
+        """
+        Indexe des chunks (les chunks déjà présents avec le même identifiant sont remplacés).
+
+        Args:
+            ids (List[str]): Identifiants ChromaDB des chunks.
+            documents (List[str]): Textes des chunks.
+            metadatas (Optional[List[dict]], optional): Métadonnées des chunks (`workspace` et
+                `source` déterminent leur partition). Defaults to None.
+        """
+        if not ids:
+            return
+        metadatas = metadatas or [{} for _ in ids]
+        conn = self._conn()
+        with conn:
+            self._supprimer(conn, list(ids))
+            par_workspace = {}
+            for cid, texte, meta in zip(ids, documents, metadatas):
+                workspace = (meta or {}).get("workspace") or ""
+                source = (meta or {}).get("source") or ""
+                termes = Counter(analyser(texte or ""))
+                longueur = sum(termes.values())
+                num = conn.execute(
+                    "INSERT INTO chunks (chunk_id, workspace, source, longueur) VALUES (?, ?, ?, ?)",
+                    (cid, workspace, source, longueur),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO postings (workspace, terme, source, num, tf) VALUES (?, ?, ?, ?, ?)",
+                    [(workspace, terme, source, num, tf) for terme, tf in termes.items()],
+                )
+                n, total = par_workspace.get(workspace, (0, 0))
+                par_workspace[workspace] = (n + 1, total + longueur)
+            for workspace, (n, total) in par_workspace.items():
+                self._ajuster_stats(conn, workspace, n, total)
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """
+        Retire des chunks de l'index.
+
+        Args:
+            ids (Iterable[str]): Identifiants ChromaDB des chunks.
+
+        Returns:
+            int: Nombre de chunks retirés.
+        """
+        ids = list(ids)
+        if not ids:
+            return 0
+        conn = self._conn()
+        with conn:
+            return self._supprimer(conn, ids)
+
+    def is_empty(self) -> bool:
+        """
+        Indique si l'index ne contient aucun chunk.
+        """
+        return self._conn().execute("SELECT 1 FROM chunks LIMIT 1").fetchone() is None
+
+    def is_complete(self) -> bool:
+        """
+        Indique si l'index a été rempli en entier à partir de ChromaDB (`rebuild`) depuis sa création.
+
+        Sans cela, les chunks indexés avant l'index (ou avant un changement de schéma)
+        n'y figurent pas, même si des ingestions récentes l'ont alimenté.
+        """
+        return self._conn().execute("SELECT 1 FROM meta WHERE cle = 'complet'").fetchone() is not None
+
+    def version_workspace(self, workspace: str) -> Tuple[str, int]:
+        """
+        Version et taille d'un workspace, modifiées par toute écriture de ses chunks.
+
+        Sert aussi aux index dérivés de la collection par workspace (src.indexExact),
+        qui ne sont ainsi pas invalidés par les écritures dans d'autres workspaces.
+
+        Args:
+            workspace (str): Le workspace ("" : documents sans workspace).
+
+        Returns:
+            Tuple[str, int]: (version, nombre de chunks du workspace).
+        """
+        conn = self._conn()
+        instance = conn.execute("SELECT valeur FROM meta WHERE cle = 'instance'").fetchone()[0]
+        stats = conn.execute("SELECT version, n_docs FROM stats WHERE workspace = ?", (workspace,)).fetchone()
+        version, n_docs = stats if stats else (0, 0)
+        return f"{instance[:8]}-{version}", n_docs
+
+    def rebuild(self, collection, batch_size: int = 1000) -> int:
+        """
+        Reconstruit entièrement l'index à partir d'une collection ChromaDB, puis le marque complet.
+
+        Args:
+            collection: Collection ChromaDB source.
+            batch_size (int, optional): Nombre de chunks lus par page. Defaults to 1000.
+
+        Returns:
+            int: Nombre de chunks indexés.
+        """
+        conn = self._conn()
+        with conn:
+            self._vider(conn)
+        total = 0
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            if not page["ids"]:
+                break
+            self.add(page["ids"], page["documents"], page["metadatas"])
+            total += len(page["ids"])
+            offset += batch_size
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (cle, valeur) VALUES ('complet', ?)", (str(total),))
+        return total
+
+    def _version_partition(self, conn: sqlite3.Connection, workspace: Optional[str]) -> int:
+        if workspace is not None:
+            version = conn.execute("SELECT version FROM stats WHERE workspace = ?", (workspace,)).fetchone()
+        else:
+            version = conn.execute("SELECT SUM(version) FROM stats").fetchone()
+        return (version[0] or 0) if version else 0
+
+    def _partition(self, workspace: Optional[str]) -> _Partition:
+        """
+        Matrice de scores du workspace (de tout l'index si None).
+
+        Une partition jamais chargée l'est immédiatement ; une partition périmée est
+        renvoyée telle quelle et rechargée en arrière-plan.
+        """
+        version = self._version_partition(self._conn(), workspace)
+        partition = self._partitions.get(workspace)
+        if partition is not None:
+            if partition.version != version:
+                self._planifier_rechargement(workspace)
+            return partition
+        with self._verrou:
+            if workspace not in self._partitions:
+                self._partitions[workspace] = self._charger_partition(workspace)
+            return self._partitions[workspace]
+
+    def is_fresh(self, workspaces: Optional[List[str]] = None) -> bool:
+        """
+        Indique si les recherches dans ces workspaces liront des partitions à jour.
+
+        Faux si l'une d'elles est périmée et sera servie telle quelle pendant son
+        rechargement ; une partition jamais chargée l'est à jour lors de la recherche.
+
+        Args:
+            workspaces (Optional[List[str]], optional): Workspaces (None : tout l'index). Defaults to None.
+        """
+        conn = self._conn()
+        for workspace in (workspaces if workspaces is not None else [None]):
+            partition = self._partitions.get(workspace)
+            if partition is not None and partition.version != self._version_partition(conn, workspace):
+                return False
+        return True
+
+    def _planifier_rechargement(self, workspace: Optional[str]) -> None:
+        """
+        Recharge une partition dans un thread d'arrière-plan (un seul à la fois par partition).
+        """
+        with self._verrou:
+            if self._rechargements["pid"] != os.getpid():
+                # Les threads d'un processus parent ne survivent pas au fork
+                self._rechargements.update(pid=os.getpid(), workspaces=set())
+            if workspace in self._rechargements["workspaces"]:
+                return
+            self._rechargements["workspaces"].add(workspace)
+
+        def recharger():
+            try:
+                partition = self._charger_partition(workspace)
+                with self._verrou:
+                    self._partitions[workspace] = partition
+            except Exception as e:
+                print(f"⚠️ Erreur lors du rechargement de la partition BM25 {workspace!r} : {e}")
+            finally:
+                with self._verrou:
+                    self._rechargements["workspaces"].discard(workspace)
+
+        threading.Thread(target=recharger, name="bm25-partition", daemon=True).start()
+
+    def _charger_partition(self, workspace: Optional[str]) -> _Partition:
+        """
+        Charge les postings d'une partition en une matrice de scores BM25.
+        """
+        conn = self._conn()
+        filtre, parametres = ("WHERE workspace = ?", [workspace]) if workspace is not None else ("", [])
+        # Lecture cohérente des chunks, des postings et de la version
+        conn.execute("BEGIN")
+        try:
+            version = self._version_partition(conn, workspace)
+            chunks = conn.execute(
+                f"SELECT num, chunk_id, source, longueur FROM chunks {filtre} ORDER BY num", parametres
+            ).fetchall()
+            postings = conn.execute(f"SELECT terme, num, tf FROM postings {filtre}", parametres).fetchall()
+        finally:
+            conn.commit()
+        if not chunks:
+            return _Partition(version, [], np.array([], dtype=object), {}, csc_matrix((0, 0), dtype=np.float32))
+
+        nums = np.fromiter((c[0] for c in chunks), dtype=np.int64, count=len(chunks))
+        longueurs = np.fromiter((c[3] for c in chunks), dtype=np.float32, count=len(chunks))
+        vocabulaire = {}
+        colonnes = np.fromiter(
+            (vocabulaire.setdefault(p[0], len(vocabulaire)) for p in postings), dtype=np.int64, count=len(postings)
+        )
+        lignes = np.searchsorted(nums, np.fromiter((p[1] for p in postings), dtype=np.int64, count=len(postings)))
+        tf = np.fromiter((p[2] for p in postings), dtype=np.float32, count=len(postings))
+
+        n_docs = len(chunks)
+        longueur_moyenne = max(float(longueurs.mean()), 1e-9)
+        df = np.bincount(colonnes, minlength=len(vocabulaire))
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        poids = idf[colonnes] * tf * (K1 + 1) / (tf + K1 * (1 - B + B * longueurs[lignes] / longueur_moyenne))
+
+        return _Partition(
+            version=version,
+            ids=[c[1] for c in chunks],
+            sources=np.array([c[2] for c in chunks], dtype=object),
+            vocabulaire=vocabulaire,
+            matrice=csc_matrix((poids, (lignes, colonnes)), shape=(n_docs, len(vocabulaire))),
+        )
+
+    def search(self, query: str, n_results: int = 8, workspace: Optional[str] = None,
+               sources: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Recherche les chunks les plus pertinents au sens de BM25.
+
+        Seules les colonnes des termes de la requête sont lues dans la matrice de la
+        partition du workspace demandé (de tout l'index si aucun workspace n'est donné).
+
+        Args:
+            query (str): La requête.
+            n_results (int, optional): Nombre de résultats. Defaults to 8.
+            workspace (Optional[str], optional): Limite la recherche à ce workspace ("" : documents
+                sans workspace, None : tout l'index). Defaults to None.
+            sources (Optional[List[str]], optional): Limite la recherche à ces sources. Defaults to None.
+
+        Returns:
+            List[Tuple[str, float]]: Couples (identifiant du chunk, score), par score décroissant.
+        """
+        termes = set(analyser(query))
+        if not termes or n_results <= 0:
+            return []
+        partition = self._partition(workspace)
+        colonnes = [partition.vocabulaire[t] for t in termes if t in partition.vocabulaire]
+        if not colonnes:
+            return []
+
+        scores = np.asarray(partition.matrice[:, colonnes].sum(axis=1)).ravel()
+        if sources:
+            scores = np.where(np.isin(partition.sources, list(sources)), scores, 0)
+        candidats = np.flatnonzero(scores > 0)
+        if len(candidats) > n_results:
+            candidats = candidats[np.argpartition(-scores[candidats], n_results - 1)[:n_results]]
+        candidats = candidats[np.argsort(-scores[candidats], kind="stable")]
+        return [(partition.ids[i], float(scores[i])) for i in candidats]
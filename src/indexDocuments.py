@@ -0,0 +1,182 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from . import manifeste
+from .baseVectorielle import bump_index_version, collection, collection_sources, filtre_metadonnees
+
+"""
+Index de niveau document pour la recherche hiérarchique.
+
+Chaque source indexée y est représentée par un seul vecteur : le centroïde (moyenne
+normalisée) des embeddings de ses chunks, stocké dans une petite collection ChromaDB
+(settings.CHROMA_SOURCES_COLLECTION_NAME) avec sa source, son workspace et son nombre
+de chunks. Contrairement au chunk de résumé, produit plus tard par l'étage de résumé,
+le centroïde est disponible dès l'indexation des chunks.
+
+La recherche hiérarchique interroge d'abord cet index pour retenir les documents les
+plus proches de la requête, puis ne cherche les chunks que dans ces documents.
+
+L'index est construit en entier une première fois à partir des chunks, hors des requêtes
+(commande `index_documents` ou démarrage du worker d'ingestion), ce qu'enregistre le fichier
+settings.DOCUMENT_INDEX_MARKER_PATH ; le centroïde d'une source est ensuite mis à jour une
+fois, à la fin de son ingestion. Sans ce fichier, les documents indexés avant la création
+de l'index n'auraient jamais de centroïde.
+"""
+
+# Index de documents complet (None : pas encore vérifié dans ce processus)
+_etat_index = None
+
+
+def _normaliser(vecteur: np.ndarray) -> List[float]:
+    norme = float(np.linalg.norm(vecteur))
+    return (vecteur / norme if norme else vecteur).astype(np.float32).tolist()
+
+
+def update_source(source: str, workspace: Optional[str], somme: np.ndarray, n_chunks: int) -> None:
+    """
+    Enregistre (ou remplace) le centroïde d'une source.
+
+    Args:
+        source (str): Source du document.
+        workspace (Optional[str]): Espace de travail du document.
+        somme (np.ndarray): Somme des embeddings des chunks de la source.
+        n_chunks (int): Nombre de chunks de la source.
+    """
+    if not n_chunks:
+        return
+    collection_sources.upsert(
+        ids=[source],
+        embeddings=[_normaliser(np.asarray(somme, dtype=np.float64) / n_chunks)],
+        metadatas=[{"source": source, "workspace": workspace or "", "n_chunks": n_chunks}],
+    )
+
+
+def delete_sources(where: dict) -> None:
+    """
+    Supprime les centroïdes correspondant à un filtre ({"source": ...} ou {"workspace": ...}).
+    """
+    ids = collection_sources.get(where=where, include=[])["ids"]
+    if ids:
+        collection_sources.delete(ids=ids)
+
+
+def move_source(old_source: str, new_source: str, workspace: Optional[str] = None) -> None:
+    """
+    Renomme le centroïde d'une source déplacée (sans le recalculer).
+    """
+    data = collection_sources.get(ids=[old_source], include=["embeddings", "metadatas"])
+    if not data["ids"]:
+        return
+    meta = dict(data["metadatas"][0])
+    meta["source"] = new_source
+    meta["workspace"] = workspace or ""
+    collection_sources.upsert(ids=[new_source], embeddings=[data["embeddings"][0]], metadatas=[meta])
+    if new_source != old_source:
+        collection_sources.delete(ids=[old_source])
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    """
+    Reconstruit les centroïdes de toutes les sources à partir des chunks de ChromaDB.
+
+    Seule la génération en service de chaque source (pointeur du manifeste, à défaut la
+    plus récente) est prise en compte ; les chunks de résumé sont ignorés. Les centroïdes
+    existants sont remplacés sur place, sans que l'index soit vidé entre-temps.
+
+    Args:
+        batch_size (int, optional): Nombre de chunks lus par page. Defaults to 1000.
+
+    Returns:
+        int: Nombre de sources indexées.
+    """
+    pointeurs = manifeste.generations()
+    sommes: Dict[str, list] = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            break
+        for embedding, meta in zip(page["embeddings"], page["metadatas"]):
+            if meta.get("is_summary"):
+                continue
+            source = meta.get("source", "")
+            generation = meta.get("generation", 0)
+            if source in pointeurs and generation != pointeurs[source]:
+                continue
+            entree = sommes.get(source)
+            if entree is None or generation > entree[0]:
+                sommes[source] = entree = [generation, meta.get("workspace", ""), np.zeros(len(embedding)), 0]
+            if generation == entree[0]:
+                entree[2] += np.asarray(embedding, dtype=np.float64)
+                entree[3] += 1
+        offset += batch_size
+
+    # Les centroïdes sont remplacés sur place puis ceux des sources disparues retirés :
+    # une recherche concurrente ne trouve jamais l'index vide
+    for source, (_, workspace, somme, n_chunks) in sommes.items():
+        update_source(source, workspace, somme, n_chunks)
+    obsoletes = [cid for cid in collection_sources.get(include=[])["ids"] if cid not in sommes]
+    if obsoletes:
+        collection_sources.delete(ids=obsoletes)
+
+    marqueur = str(settings.DOCUMENT_INDEX_MARKER_PATH)
+    os.makedirs(os.path.dirname(marqueur), exist_ok=True)
+    with open(marqueur, "w", encoding="utf-8") as f:
+        f.write(str(len(sommes)))
+    return len(sommes)
+
+
+def _index_pret() -> None:
+    """
+    Signale (une fois par processus) un index de documents jamais construit en entier.
+
+    La construction n'a jamais lieu pendant une requête : elle est faite par la commande
+    `index_documents` ou au démarrage du worker d'ingestion. En attendant, seules les
+    sources ingérées depuis la création de l'index ont un centroïde.
+    """
+    global _etat_index
+    if _etat_index is None:
+        _etat_index = os.path.exists(settings.DOCUMENT_INDEX_MARKER_PATH)
+        if not _etat_index:
+            print("⚠️ Index de documents incomplet : lancez `python manage.py index_documents`.")
+
+
+def top_sources(query_embedding: List[float], n: int, workspaces: Optional[List[str]] = None) -> List[str]:
+    """
+    Sources dont le centroïde est le plus proche de la requête.
+
+    Args:
+        query_embedding (List[float]): Embedding de la requête.
+        n (int): Nombre de sources à retenir.
+        workspaces (Optional[List[str]], optional): Limite la recherche à ces workspaces. Defaults to None.
+
+    Returns:
+        List[str]: Sources, de la plus à la moins proche (vide si l'index est vide).
+    """
+    _index_pret()
+    resultats = collection_sources.query(
+        query_embeddings=[query_embedding],
+        n_results=n,
+        where=filtre_metadonnees(workspaces),
+        include=["metadatas"],
+    )
+    if not resultats.get("ids"):
+        return []
+    return [meta["source"] for meta in resultats["metadatas"][0]]
+
+
+def centroids() -> Tuple[List[dict], np.ndarray]:
+    """
+    Centroïdes de toutes les sources de l'index.
+
+    Returns:
+        tuple: (métadonnées des sources, matrice des centroïdes, une ligne par source).
+    """
+    _index_pret()
+    data = collection_sources.get(include=["embeddings", "metadatas"])
+    if not data["ids"]:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    return list(data["metadatas"]), np.asarray(data["embeddings"], dtype=np.float32)
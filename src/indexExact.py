@@ -0,0 +1,270 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .baseVectorielle import collection
+from .ingererDonnee import index_bm25
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+"""
+Recherche vectorielle exacte sur des matrices par workspace, projetées en mémoire (mmap).
+
+Pour un petit workspace, l'index HNSW de ChromaDB filtré par `where` est à la fois plus
+lent et moins précis qu'un parcours exhaustif. Ce module garde sur disque, pour chaque
+workspace d'au plus settings.EXACT_SEARCH_MAX_CHUNKS chunks, la matrice de ses embeddings
+normalisés (fichier .npy en float32 ou float16, settings.EXACT_SEARCH_DTYPE) avec deux
+tableaux annexes : identifiants et sources des chunks, ligne à ligne. Une recherche est
+un produit matrice-vecteur suivi d'un `argpartition`.
+
+Les fichiers d'un workspace portent la version de ce workspace (compteur d'écritures de
+sa partition dans l'index BM25, `IndexBM25.version_workspace`) : une écriture dans un
+autre workspace ne les invalide pas. Ils sont écrits dans un dossier temporaire puis
+renommés atomiquement, et ouverts avec `np.load(mmap_mode="r")`, si bien que tous les
+workers partagent les mêmes pages du cache disque, sans copie.
+
+Les fichiers ne sont jamais construits pendant une requête : lorsqu'ils manquent ou sont
+périmés, la construction est confiée à un thread d'arrière-plan (un seul processus
+construit un workspace donné, sous verrou) et le workspace est servi par HNSW en attendant.
+"""
+
+MODE_EXACT = "exact"
+MODE_HNSW = "hnsw"
+
+
+class Matrice(NamedTuple):
+    """
+    Fichiers d'un workspace ouverts pour une version.
+    """
+    workspace: str
+    version: str
+    mode: str
+    embeddings: Optional[np.ndarray]
+    ids: Optional[np.ndarray]
+    sources: Optional[np.ndarray]
+
+
+_verrou = threading.Lock()
+_matrices: Dict[str, Matrice] = {}
+# Constructions en cours dans ce processus : {"pid": ..., "workspaces": set()}
+_constructions = {"pid": None, "workspaces": set()}
+
+
+def _racine() -> str:
+    return str(settings.EXACT_SEARCH_DIR)
+
+
+def _nom(workspace: str) -> str:
+    # Nom de fichier sûr quel que soit le nom du workspace
+    return hashlib.sha1(workspace.encode("utf-8")).hexdigest()[:16]
+
+
+def _dossier(workspace: str, version: str) -> str:
+    return os.path.join(_racine(), f"{_nom(workspace)}.v{version}")
+
+
+def _construire(workspace: str, version: str, batch_size: int = 1000) -> None:
+    """
+    Écrit les fichiers d'un workspace pour une version, depuis ChromaDB.
+
+    Le dossier est préparé sous un nom temporaire puis renommé : un lecteur voit soit
+    l'ancienne version, soit la nouvelle au complet. Les versions plus anciennes sont
+    supprimées ; les processus qui les ont encore projetées en mémoire les lisent
+    jusqu'à ce qu'ils les referment.
+    """
+    where = {"workspace": workspace}
+    debut = time.time()
+    tmp = f"{_dossier(workspace, version)}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    ids, sources, lignes = [], [], []
+    mode = MODE_EXACT
+    offset = 0
+    while True:
+        page = collection.get(where=where, include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        if len(ids) > settings.EXACT_SEARCH_MAX_CHUNKS:
+            mode = MODE_HNSW
+            break
+        sources.extend(m.get("source", "") for m in page["metadatas"])
+        lignes.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += batch_size
+
+    if mode == MODE_EXACT:
+        matrice = np.concatenate(lignes) if lignes else np.zeros((0, 0), dtype=np.float32)
+        matrice /= np.clip(np.linalg.norm(matrice, axis=1, keepdims=True), 1e-12, None)
+        np.save(os.path.join(tmp, "embeddings.npy"), matrice.astype(settings.EXACT_SEARCH_DTYPE))
+        np.save(os.path.join(tmp, "ids.npy"), np.array(ids, dtype=str))
+        np.save(os.path.join(tmp, "sources.npy"), np.array(sources, dtype=str))
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": version, "workspace": workspace, "n_chunks": len(ids), "mode": mode}, f)
+
+    dossier = _dossier(workspace, version)
+    try:
+        os.rename(tmp, dossier)
+    except OSError:
+        # Déjà construit par un autre processus
+        shutil.rmtree(tmp, ignore_errors=True)
+    prefixe = f"{_nom(workspace)}.v"
+    for nom in os.listdir(_racine()):
+        chemin = os.path.join(_racine(), nom)
+        if not nom.startswith(prefixe) or chemin == dossier or nom.endswith(".tmp"):
+            continue
+        try:
+            # Seules les versions écrites avant le début de cette construction sont supprimées
+            if os.path.getmtime(chemin) < debut:
+                shutil.rmtree(chemin, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def _construire_verrouille(workspace: str, version: str) -> None:
+    """
+    Construit les fichiers d'un workspace, sauf si un autre processus s'en charge déjà.
+    """
+    os.makedirs(_racine(), exist_ok=True)
+    with open(os.path.join(_racine(), f"{_nom(workspace)}.lock"), "a") as lock:
+        if fcntl:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+        try:
+            if not os.path.exists(os.path.join(_dossier(workspace, version), "meta.json")):
+                _construire(workspace, version)
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _planifier(workspace: str, version: str) -> None:
+    """
+    Lance en arrière-plan la construction des fichiers d'un workspace (une à la fois par workspace).
+    """
+    with _verrou:
+        if _constructions["pid"] != os.getpid():
+            # Les threads d'un processus parent ne survivent pas au fork
+            _constructions.update(pid=os.getpid(), workspaces=set())
+        if workspace in _constructions["workspaces"]:
+            return
+        _constructions["workspaces"].add(workspace)
+
+    def construire():
+        try:
+            _construire_verrouille(workspace, version)
+        except Exception as e:
+            print(f"⚠️ Erreur lors de la construction de l'index exact du workspace {workspace!r} : {e}")
+        finally:
+            with _verrou:
+                _constructions["workspaces"].discard(workspace)
+
+    threading.Thread(target=construire, name="index-exact", daemon=True).start()
+
+
+def _ouvrir(workspace: str, version: str) -> Matrice:
+    dossier = _dossier(workspace, version)
+    with open(os.path.join(dossier, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta["mode"] != MODE_EXACT:
+        return Matrice(workspace, version, meta["mode"], None, None, None)
+    return Matrice(
+        workspace,
+        version,
+        MODE_EXACT,
+        np.load(os.path.join(dossier, "embeddings.npy"), mmap_mode="r"),
+        np.load(os.path.join(dossier, "ids.npy"), mmap_mode="r"),
+        np.load(os.path.join(dossier, "sources.npy"), mmap_mode="r"),
+    )
+
+
+def _matrice(workspace: str) -> Optional[Matrice]:
+    """
+    Fichiers du workspace pour sa version courante, ou None s'il doit être servi par HNSW
+    (workspace trop grand, fichiers absents ou en cours de construction).
+    """
+    version, n_chunks = index_bm25.version_workspace(workspace)
+    if n_chunks > settings.EXACT_SEARCH_MAX_CHUNKS:
+        return None
+    matrice = _matrices.get(workspace)
+    if matrice is None or matrice.version != version:
+        try:
+            matrice = _ouvrir(workspace, version)
+        except FileNotFoundError:
+            # Absents, ou supprimés par un autre processus entre-temps : construits en arrière-plan
+            _planifier(workspace, version)
+            return None
+        _matrices[workspace] = matrice
+    return matrice if matrice.mode == MODE_EXACT else None
+
+
+def _similarites(embeddings: np.ndarray, requete: np.ndarray, bloc: int = 8192) -> np.ndarray:
+    """
+    Produit matrice-vecteur. Une matrice float16 est convertie par blocs de lignes :
+    NumPy n'a pas de produit float16 optimisé et la matrice entière n'est jamais copiée.
+    """
+    if embeddings.dtype == np.float32:
+        return embeddings @ requete
+    similarites = np.empty(len(embeddings), dtype=np.float32)
+    for debut in range(0, len(embeddings), bloc):
+        similarites[debut:debut + bloc] = embeddings[debut:debut + bloc].astype(np.float32) @ requete
+    return similarites
+
+
+def exact_workspaces(workspaces: List[str]) -> Tuple[List[Matrice], List[str]]:
+    """
+    Répartit des workspaces entre recherche exacte et HNSW.
+
+    Returns:
+        tuple: (matrices des workspaces servis par la recherche exacte, workspaces servis par HNSW).
+    """
+    matrices, hnsw = [], []
+    for workspace in workspaces:
+        matrice = _matrice(workspace)
+        if matrice is None:
+            hnsw.append(workspace)
+        else:
+            matrices.append(matrice)
+    return matrices, hnsw
+
+
+def search(query_embedding: List[float], n_results: int, matrices: List[Matrice],
+           sources: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+    """
+    Plus proches voisins exacts (similarité cosinus) dans les matrices de workspaces.
+
+    Args:
+        query_embedding (List[float]): Embedding de la requête.
+        n_results (int): Nombre de résultats.
+        matrices (List[Matrice]): Matrices des workspaces (voir `exact_workspaces`).
+        sources (Optional[List[str]], optional): Limite la recherche à ces sources. Defaults to None.
+
+    Returns:
+        List[Tuple[str, float]]: Couples (identifiant du chunk, similarité), de la plus forte à la plus faible.
+    """
+    requete = np.asarray(query_embedding, dtype=np.float32)
+    requete /= max(float(np.linalg.norm(requete)), 1e-12)
+    resultats = []
+    for matrice in matrices:
+        if not len(matrice.ids):
+            continue
+        similarites = _similarites(matrice.embeddings, requete)
+        if sources is not None:
+            similarites[~np.isin(matrice.sources, list(sources))] = -np.inf
+        n = min(n_results, len(similarites))
+        meilleurs = np.argpartition(-similarites, n - 1)[:n]
+        resultats.extend(
+            (str(matrice.ids[i]), float(similarites[i])) for i in meilleurs if np.isfinite(similarites[i])
+        )
+    resultats.sort(key=lambda r: r[1], reverse=True)
+    return resultats[:n_results]
@@ -1,18 +1,24 @@
 from striprtf.striprtf import rtf_to_text
-import chromadb
 from django.conf import settings
 from .chargeFichier import excelLoad, mdLoad, docxLoad, pdfScanneLoad, pdfNonScanneLoad, rtfLoad, htmlLoad, txtLoad, csvLoad, pptxLoad
-from .split import split_textMd, split_textExcel, split_csv, split_docx, split_html, split_pdf, split_rtf, split_txt, split_pptx
-from sentence_transformers import SentenceTransformer
+from .split import split_textMd, split_textExcel, split_csv, split_docx, split_html, split_pdf, split_rtf, split_txt, split_pptx, CHUNKING_VERSION
 from langchain.schema import Document
 
-from .api import resumeDocument
+from .api import resumeDocumentLong
 from .extractions import est_pdf_scanne
+from . import manifeste
+from .cachePersistant import CachePersistant, cle_hash
+from .indexBM25 import IndexBM25
+from . import indexDocuments
+from .modeles import get_embedding_model, embedding_model_id
+from .baseVectorielle import bump_index_version, collection
+import numpy as np
 import os
 from pathlib import Path
 from typing import List, Optional
 import subprocess
 import sys
+import time
 
 """
 Module d'ingestion de documents pour la base de données vectorielle.
@@ -25,13 +31,68 @@ Ce fichier python nous permet d'appeler la bonne fonction de chargeFichiers
 en fonction du type du document.
 """
 
-chroma_client = chromadb.PersistentClient(path=str(settings.CHROMA_DB_DIR))
-collection = chroma_client.get_or_create_collection("asadi_collection")  # ici une collection c'est plus ou moins une table en sql
+# La collection (plus ou moins une table en sql) est fournie par src.baseVectorielle,
+# en mode embarqué ou serveur selon settings.CHROMA_MODE
 
-model_embedding = SentenceTransformer("all-mpnet-base-v2")
+EMBEDDING_MODEL_NAME = settings.EMBEDDING_MODEL_NAME
 
 
-def chargeDocuments(cheminDocuments: List[str]):
+embedding_cache = CachePersistant(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_ENTRIES)
+
+# Index BM25 persistant, tenu à jour à chaque écriture dans la collection
+index_bm25 = IndexBM25(settings.BM25_INDEX_PATH)
+
+
+def encode_chunks(textes: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+    """
+    Calcule les embeddings d'une liste de textes en consultant d'abord le cache d'embeddings.
+    
+    Les textes déjà encodés avec le même modèle (clé : nom du modèle + empreinte du texte)
+    sont lus dans le cache ; seuls les textes manquants passent par le modèle, puis sont
+    ajoutés au cache.
+    
+    Args:
+        textes (List[str]): Textes à encoder.
+        batch_size (Optional[int], optional): Taille des lots pour le modèle. Defaults to settings.INGESTION_BATCH_SIZE.
+        
+    Returns:
+        List[List[float]]: Embeddings, dans l'ordre des textes.
+    """
+    batch_size = batch_size or settings.INGESTION_BATCH_SIZE
+    modele = embedding_model_id()
+    cles = [cle_hash(modele, texte) for texte in textes]
+    try:
+        trouves = embedding_cache.get_many(cles)
+    except Exception as e:
+        print(f"⚠️ Cache d'embeddings indisponible : {e}")
+        trouves = {}
+
+    manquants = [i for i, cle in enumerate(cles) if cle not in trouves]
+    if manquants:
+        vecteurs = get_embedding_model().encode([textes[i] for i in manquants], batch_size=batch_size)
+        nouveaux = [(cles[i], np.asarray(v, dtype=np.float32).tobytes()) for i, v in zip(manquants, vecteurs)]
+        trouves.update(nouveaux)
+        try:
+            embedding_cache.set_many(nouveaux)
+        except Exception as e:
+            print(f"⚠️ Écriture impossible dans le cache d'embeddings : {e}")
+
+    return [np.frombuffer(trouves[cle], dtype=np.float32).tolist() for cle in cles]
+
+
+def config_ingestion() -> dict:
+    """
+    Configuration de segmentation/embedding enregistrée dans le manifeste pour chaque source.
+    
+    Toute différence avec la configuration enregistrée entraîne la réingestion de la source.
+    
+    Returns:
+        dict: Modèle d'embedding et version des règles de découpage.
+    """
+    return {"embedding_model": EMBEDDING_MODEL_NAME, "chunking": CHUNKING_VERSION}
+
+
+def chargeDocuments(cheminDocuments: List[str], avec_resume: bool = True):
     """
     Charge et segmente des documents de différents formats.
     
@@ -40,6 +101,8 @@ def chargeDocuments(cheminDocuments: List[str]):
     
     Args:
         cheminDocuments (List[str]): Liste des chemins vers les documents à charger.
+        avec_resume (bool, optional): Génère le chunk de résumé de chaque document via le LLM.
+            Mettre à False lorsque le résumé est confié à l'étage de résumé (src.resumes). Defaults to True.
         
     Returns:
         tuple: Un tuple contenant (liste des chunks générés, liste des fichiers ignorés).
@@ -100,8 +163,8 @@ def chargeDocuments(cheminDocuments: List[str]):
                 continue
 
             # ➕ Résumé
-            if documentCourant:
-                documentResumee = resumeDocument(documentCourant.page_content)
+            if documentCourant and avec_resume:
+                documentResumee = resumeDocumentLong(documentCourant.page_content)
                 metadata = documentCourant.metadata.copy()
                 metadata["chunk_index"] = -1
                 metadata["is_summary"] = True
@@ -143,7 +206,8 @@ def convert_doc_to_docx(doc_path: str) -> str:
         raise FileNotFoundError(f"Conversion échouée pour {doc_path}")
     return docx_path
 
-def ingest_documents(file_paths: List[str], workspace: Optional[str] = None, record_progress=None):
+def ingest_documents(file_paths: List[str], workspace: Optional[str] = None, record_progress=None,
+                     avec_resume: bool = True):
     """
     Ingère des documents dans la base de données vectorielle.
     
@@ -154,6 +218,7 @@ def ingest_documents(file_paths: List[str], workspace: Optional[str] = None, rec
         file_paths (List[str]): Liste des chemins vers les fichiers à ingérer.
         workspace (Optional[str], optional): Espace de travail associé aux documents. Defaults to None.
         record_progress: Objet pour suivre la progression de l'ingération. Defaults to None.
+        avec_resume (bool, optional): Génère le résumé pendant l'ingestion. Defaults to True.
         
     Returns:
         tuple: Un tuple contenant (liste des chunks ingérés, liste des fichiers ignorés).
@@ -162,7 +227,7 @@ def ingest_documents(file_paths: List[str], workspace: Optional[str] = None, rec
     total_chunks = 0
     ignored_files = []
     for fp in file_paths:
-        chunks, ignored = chargeDocuments([fp])
+        chunks, ignored = chargeDocuments([fp], avec_resume=avec_resume)
         file_chunks_map[fp] = chunks
         total_chunks += len(chunks)
         ignored_files.extend(ignored)
@@ -171,40 +236,7 @@ def ingest_documents(file_paths: List[str], workspace: Optional[str] = None, rec
 
     done = 0
     for fp, chunks in file_chunks_map.items():
-        for i, chunk in enumerate(chunks):
-            meta = chunk.metadata.copy()
-            rel = os.path.relpath(fp, settings.MEDIA_ROOT).replace(os.sep, "/")
-            meta["source"] = rel
-            if "start_index" in meta:
-                metadata_raw = {
-                    "source": meta["source"],
-                    "chunk_index": i,
-                    "start_index": meta["start_index"],
-                    "workspace": workspace,
-                }
-            else:
-                meta["chunk_index"] = i
-                meta["workspace"] = workspace
-                metadata_raw = meta
-
-            metadata = {
-                k: (v if v is not None else "")
-                for k, v in metadata_raw.items()
-            }
-
-            embedding = model_embedding.encode(chunk.page_content).tolist()
-            chunk_id = f"{metadata.get('source', 'unknown')}_chunk_{i}"
-
-            collection.upsert(
-                ids=[chunk_id],
-                documents=[chunk.page_content],
-                metadatas=[metadata],
-                embeddings=[embedding],
-            )
-
-            done += 1
-            if record_progress:
-                record_progress.set_progress(done, total_chunks)
+        done = index_chunks(fp, chunks, workspace, record_progress, done, total_chunks)
 
     # After upserting all chunks
     all_chunks = []
@@ -213,12 +245,284 @@ def ingest_documents(file_paths: List[str], workspace: Optional[str] = None, rec
 
     return all_chunks, ignored_files
 
+def index_chunks(fp: str, chunks: List[Document], workspace: Optional[str] = None,
+                 record_progress=None, done: int = 0, total_chunks: Optional[int] = None,
+                 batch_size: Optional[int] = None) -> int:
+    """
+    Calcule les embeddings des chunks d'un fichier par lots et les insère en masse dans ChromaDB.
+    
+    Les chunks sont encodés par lots de `batch_size` (un seul passage du modèle par lot,
+    limité aux textes absents du cache d'embeddings) puis insérés avec un unique
+    `collection.upsert` par lot, ce qui évite le surcoût d'un appel par chunk.
+    
+    Les chunks forment une nouvelle génération de la source, invisible pour les recherches
+    tant que le pointeur du manifeste n'a pas basculé, une seule fois après le dernier lot ;
+    l'ancienne génération est purgée ensuite.
+    
+    Args:
+        fp (str): Chemin absolu du fichier dont proviennent les chunks.
+        chunks (List[Document]): Chunks du fichier, dans l'ordre.
+        workspace (Optional[str], optional): Espace de travail associé. Defaults to None.
+        record_progress: Objet de suivi de progression (méthode set_progress). Defaults to None.
+        done (int, optional): Nombre de chunks déjà traités avant cet appel. Defaults to 0.
+        total_chunks (Optional[int], optional): Nombre total de chunks à traiter. Defaults to len(chunks).
+        batch_size (Optional[int], optional): Taille des lots. Defaults to settings.INGESTION_BATCH_SIZE.
+        
+    Returns:
+        int: Nombre de chunks traités après cet appel (done + len(chunks)).
+    """
+    batch_size = batch_size or settings.INGESTION_BATCH_SIZE
+    if total_chunks is None:
+        total_chunks = done + len(chunks)
+    rel = os.path.relpath(fp, settings.MEDIA_ROOT).replace(os.sep, "/")
+    generation = new_generation()
+
+    ids, documents, metadatas = [], [], []
+    for i, chunk in enumerate(chunks):
+        meta = chunk.metadata.copy()
+        meta["source"] = rel
+        if "start_index" in meta:
+            metadata_raw = {
+                "source": meta["source"],
+                "chunk_index": i,
+                "start_index": meta["start_index"],
+                "workspace": workspace,
+            }
+        else:
+            meta["chunk_index"] = i
+            meta["workspace"] = workspace
+            metadata_raw = meta
+
+        metadata_raw["generation"] = generation
+
+        metadata = {
+            k: (v if v is not None else "")
+            for k, v in metadata_raw.items()
+        }
+        ids.append(chunk_id(metadata.get('source', 'unknown'), generation, i))
+        documents.append(chunk.page_content)
+        metadatas.append(metadata)
+
+    somme = None  # somme des embeddings, pour le centroïde de la source
+    for start in range(0, len(documents), batch_size):
+        end = start + batch_size
+        embeddings = encode_chunks(documents[start:end], batch_size=batch_size)
+        lot = np.asarray(embeddings, dtype=np.float64).sum(axis=0)
+        somme = lot if somme is None else somme + lot
+
+        collection.upsert(
+            ids=ids[start:end],
+            documents=documents[start:end],
+            metadatas=metadatas[start:end],
+            embeddings=embeddings,
+        )
+        index_bm25.add(ids[start:end], documents[start:end], metadatas[start:end])
+
+        done += len(embeddings)
+        if record_progress:
+            record_progress.set_progress(done, total_chunks)
+
+    # La nouvelle génération est complète : les lecteurs basculent dessus en une fois
+    try:
+        manifeste.record(rel, fp, config_ingestion(), workspace, generation=generation)
+    except OSError as e:
+        print(f"⚠️ Erreur mise à jour du manifeste pour {rel} : {e}")
+        # Le pointeur désigne toujours l'ancienne génération : on retire la nouvelle
+        for start in range(0, len(ids), 5000):
+            collection.delete(ids=ids[start:start + 5000])
+        index_bm25.delete(ids)
+        raise
+
+    purge_generations(rel, generation)
+    if somme is not None:
+        indexDocuments.update_source(rel, workspace, somme, len(documents))
+    # Une seule nouvelle version par source : bascule, purge et centroïde
+    bump_index_version()
+
+    return done
+
+def new_generation() -> int:
+    """
+    Numéro de génération pour une nouvelle indexation d'une source.
+    
+    Basé sur l'horloge (millisecondes), il croît d'une indexation à la suivante,
+    y compris entre processus différents.
+    
+    Returns:
+        int: Numéro de génération.
+    """
+    return time.time_ns() // 1_000_000
+
+def chunk_id(source: str, generation: int, index: int) -> str:
+    """
+    Identifiant ChromaDB d'un chunk pour une génération donnée de sa source.
+    
+    Args:
+        source (str): Source du chunk.
+        generation (int): Génération d'indexation de la source.
+        index (int): Position du chunk dans la source.
+        
+    Returns:
+        str: Identifiant du chunk.
+    """
+    return f"{source}_g{generation}_chunk_{index}"
+
+def summary_id(source: str) -> str:
+    """
+    Identifiant ChromaDB du chunk de résumé d'une source (indépendant de la génération).
+    
+    Args:
+        source (str): Source du document (chemin relatif à MEDIA_ROOT).
+        
+    Returns:
+        str: Identifiant du chunk de résumé.
+    """
+    return f"{source}_summary"
+
+def purge_generations(source: str, generation: int) -> int:
+    """
+    Supprime en masse les chunks d'une source qui n'appartiennent pas à la génération donnée.
+    
+    Les chunks d'anciennes générations (et ceux indexés avant l'introduction des générations)
+    sont retirés, ce qui élimine notamment les chunks de fin d'une ancienne version plus longue.
+    Le chunk de résumé produit par l'étage de résumé est conservé.
+    
+    Args:
+        source (str): Source à nettoyer.
+        generation (int): Génération à conserver.
+        
+    Returns:
+        int: Nombre de chunks supprimés.
+    """
+    data = collection.get(where={"source": source}, include=["metadatas"])
+    obsoletes = [
+        cid for cid, meta in zip(data["ids"], data["metadatas"])
+        if meta.get("generation") != generation and cid != summary_id(source)
+    ]
+    for start in range(0, len(obsoletes), 5000):
+        collection.delete(ids=obsoletes[start:start + 5000])
+    index_bm25.delete(obsoletes)
+    if obsoletes:
+        bump_index_version()
+    return len(obsoletes)
+
+def delete_chunks(where: dict) -> int:
+    """
+    Supprime les chunks correspondant à un filtre, dans ChromaDB, l'index BM25 et l'index de documents.
+    
+    Args:
+        where (dict): Filtre ChromaDB sur les métadonnées (ex: {"source": ...} ou {"workspace": ...}).
+        
+    Returns:
+        int: Nombre de chunks supprimés.
+    """
+    ids = collection.get(where=where, include=[])["ids"]
+    for start in range(0, len(ids), 5000):
+        collection.delete(ids=ids[start:start + 5000])
+    index_bm25.delete(ids)
+    indexDocuments.delete_sources(where)
+    if ids:
+        bump_index_version()
+    return len(ids)
+
+def live_generation_only(chunks: List[tuple]) -> List[tuple]:
+    """
+    Filtre des résultats de recherche pour ne garder que la génération en service de chaque source.
+    
+    Pendant la réindexation d'une source, l'ancienne et la nouvelle génération coexistent ;
+    les lecteurs suivent le pointeur du manifeste, basculé une seule fois après le dernier lot,
+    et ne voient donc jamais une génération partielle. Une source sans pointeur (indexée avant
+    les générations, ou en cours de première indexation) garde sa génération la plus récente.
+    
+    Args:
+        chunks (List[tuple]): Couples (document, métadonnées).
+        
+    Returns:
+        List[tuple]: Les couples dont la génération est en service pour leur source.
+    """
+    pointeurs = manifeste.generations()
+    derniere = {}
+    for _, meta in chunks:
+        src = meta.get("source")
+        if not meta.get("is_summary") and src not in pointeurs:
+            derniere[src] = max(derniere.get(src, 0), meta.get("generation", 0))
+    return [
+        (doc, meta) for doc, meta in chunks
+        if meta.get("is_summary")
+        or meta.get("generation", 0) == pointeurs.get(meta.get("source"), derniere.get(meta.get("source"), 0))
+    ]
+
+def move_source(old_source: str, new_source: str, workspace: Optional[str] = None,
+                batch_size: Optional[int] = None) -> int:
+    """
+    Déplace les chunks d'une source sans la réingérer.
+    
+    Seules les métadonnées `source` et `workspace` (et les identifiants, qui contiennent
+    la source) sont réécrites : les textes et embeddings existants sont recopiés tels quels,
+    sans extraction, résumé ni calcul d'embedding.
+    
+    Args:
+        old_source (str): Source actuelle des chunks (chemin relatif à MEDIA_ROOT).
+        new_source (str): Nouvelle source des chunks.
+        workspace (Optional[str], optional): Nouvel espace de travail. Defaults to None.
+        batch_size (Optional[int], optional): Taille des lots d'écriture. Defaults to settings.INGESTION_BATCH_SIZE.
+        
+    Returns:
+        int: Nombre de chunks déplacés (0 si la source n'était pas indexée).
+    """
+    batch_size = batch_size or settings.INGESTION_BATCH_SIZE
+    data = collection.get(where={"source": old_source}, include=["documents", "metadatas", "embeddings"])
+    old_ids = data["ids"]
+    if not old_ids:
+        return 0
+
+    new_ids, metadatas = [], []
+    for old_id, meta in zip(old_ids, data["metadatas"]):
+        meta = dict(meta)
+        meta["source"] = new_source
+        meta["workspace"] = workspace or ""
+        metadatas.append(meta)
+        if old_id.startswith(old_source):
+            new_ids.append(new_source + old_id[len(old_source):])
+        else:
+            new_ids.append(old_id)
+
+    for start in range(0, len(old_ids), batch_size):
+        end = start + batch_size
+        if new_ids[start:end] == old_ids[start:end]:
+            collection.update(ids=old_ids[start:end], metadatas=metadatas[start:end])
+        else:
+            collection.upsert(
+                ids=new_ids[start:end],
+                documents=data["documents"][start:end],
+                metadatas=metadatas[start:end],
+                embeddings=data["embeddings"][start:end],
+            )
+        # Le workspace change : les chunks passent dans une autre partition de l'index BM25
+        index_bm25.add(new_ids[start:end], data["documents"][start:end], metadatas[start:end])
+    conserves = set(new_ids)
+    obsoletes = [old_id for old_id in old_ids if old_id not in conserves]
+    if obsoletes:
+        collection.delete(ids=obsoletes)
+        index_bm25.delete(obsoletes)
+    indexDocuments.move_source(old_source, new_source, workspace)
+    bump_index_version()
+
+    try:
+        manifeste.rename(old_source, new_source, workspace)
+    except OSError as e:
+        print(f"⚠️ Erreur mise à jour du manifeste pour {new_source} : {e}")
+    return len(old_ids)
+
 def ingest_all_documents(base_dir: str) -> None:
     """
-    Parcourt tous les fichiers du dossier base_dir et les ingère.
+    Synchronise la base vectorielle avec les fichiers du dossier base_dir.
     
     Le nom du sous-dossier après base_dir est utilisé comme nom d'espace de travail
     pour l'organisation des documents dans la base de données vectorielle.
+    Seuls les fichiers nouveaux ou modifiés (empreinte, configuration ou workspace différents
+    de ceux du manifeste) sont ingérés ; les chunks des fichiers disparus sont purgés.
+    L'extraction et la segmentation sont parallélisées par le moteur d'ingestion.
     
     Args:
         base_dir (str): Répertoire de base contenant les documents à ingérer.
@@ -226,14 +530,45 @@ def ingest_all_documents(base_dir: str) -> None:
     Returns:
         None
     """
+    from .moteurIngestion import ingest_parallel
+
     p = Path(base_dir)
     files = [str(f) for f in p.rglob("*.*") if f.is_file()]
-    to_ingest = []  # on pourrait filtrer ici si besoin
+    entries = manifeste.load()
+    config = config_ingestion()
+    to_ingest = []
+    present = set()
 
     for f in files:
         rel_parts = Path(f).relative_to(p).parts
         ws = rel_parts[0] if len(rel_parts) > 1 else None
-        ingest_documents([f], ws)
+        source = os.path.relpath(f, settings.MEDIA_ROOT).replace(os.sep, "/")
+        present.add(source)
+        entry = entries.get(source)
+        if manifeste.is_up_to_date(entry, manifeste.file_hash(f), config, ws):
+            continue
+        # Source nouvelle ou modifiée : l'ancienne génération de chunks est purgée après réindexation
+        to_ingest.append((f, ws))
+
+    # Purge des sources supprimées du disque
+    prefix = os.path.relpath(base_dir, settings.MEDIA_ROOT).replace(os.sep, "/").rstrip("/") + "/"
+    if prefix.startswith("./"):
+        prefix = prefix[2:]
+    for source in entries:
+        if source not in present and source.startswith(prefix):
+            delete_chunks({"source": source})
+            manifeste.forget(source)
+
+    print(f"{len(to_ingest)} fichier(s) à ingérer sur {len(files)}.")
+    if to_ingest:
+        from .resumes import summarize_sources
+
+        results = ingest_parallel(to_ingest)
+        # Les chunks sont déjà consultables : on génère ensuite les résumés
+        summarize_sources(
+            os.path.relpath(fp, settings.MEDIA_ROOT).replace(os.sep, "/")
+            for fp, (chunks, _) in results.items() if chunks
+        )
 
 if __name__ == "__main__":
     basedir = os.path.dirname(__file__)
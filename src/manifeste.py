@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+"""
+Manifeste d'ingestion.
+
+Ce module conserve, pour chaque source indexée dans ChromaDB (chemin relatif à MEDIA_ROOT),
+l'empreinte SHA-256 du fichier et la configuration de segmentation/embedding utilisée.
+Il permet à l'ingestion de ne retraiter que les fichiers nouveaux ou modifiés et de
+purger les chunks des fichiers supprimés.
+
+L'entrée d'une source porte aussi sa génération en service (`generation`) : c'est le
+pointeur que suivent les lecteurs. Il n'est basculé qu'une fois tous les lots de la
+nouvelle génération insérés, par le remplacement atomique du fichier.
+"""
+
+# Pointeurs de génération, relus seulement quand le fichier du manifeste change
+_generations = (None, {})
+
+
+def file_hash(path: str) -> str:
+    """
+    Calcule l'empreinte SHA-256 du contenu d'un fichier.
+
+    Args:
+        path (str): Chemin vers le fichier.
+
+    Returns:
+        str: Empreinte hexadécimale du fichier.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloc in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloc)
+    return h.hexdigest()
+
+
+@contextmanager
+def _verrou():
+    """
+    Verrou exclusif inter-processus autour des lectures/écritures du manifeste.
+    """
+    chemin = f"{settings.INGESTION_MANIFEST_PATH}.lock"
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    with open(chemin, "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _lire() -> Dict[str, dict]:
+    try:
+        with open(settings.INGESTION_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _ecrire(entries: Dict[str, dict]) -> None:
+    chemin = str(settings.INGESTION_MANIFEST_PATH)
+    tmp = f"{chemin}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, chemin)
+
+
+def load() -> Dict[str, dict]:
+    """
+    Charge le manifeste complet.
+
+    Returns:
+        dict: Entrées du manifeste indexées par source ({"hash", "config", "workspace"}).
+    """
+    with _verrou():
+        return _lire()
+
+
+def record(source: str, path: str, config: dict, workspace: Optional[str] = None,
+           digest: Optional[str] = None, **extra) -> None:
+    """
+    Enregistre (ou met à jour) l'entrée d'une source après son indexation.
+
+    Args:
+        source (str): Source telle que stockée dans les métadonnées ChromaDB.
+        path (str): Chemin absolu du fichier, utilisé pour calculer son empreinte.
+        config (dict): Configuration de segmentation/embedding utilisée.
+        workspace (Optional[str], optional): Espace de travail de la source. Defaults to None.
+        digest (Optional[str], optional): Empreinte déjà calculée du fichier. Defaults to None.
+        **extra: Informations supplémentaires à conserver dans l'entrée.
+    """
+    entry = {"hash": digest or file_hash(path), "config": config, "workspace": workspace or ""}
+    entry.update(extra)
+    with _verrou():
+        entries = _lire()
+        entries[source] = entry
+        _ecrire(entries)
+
+
+def generations() -> Dict[str, int]:
+    """
+    Génération en service de chaque source, lue sans verrou (le fichier est remplacé atomiquement).
+
+    Returns:
+        dict: Génération par source (les sources indexées sans génération sont absentes).
+    """
+    global _generations
+    try:
+        st = os.stat(settings.INGESTION_MANIFEST_PATH)
+    except OSError:
+        return {}
+    cle = (str(settings.INGESTION_MANIFEST_PATH), st.st_ino, st.st_mtime_ns, st.st_size)
+    if _generations[0] != cle:
+        valeurs = {s: e["generation"] for s, e in _lire().items() if "generation" in e}
+        _generations = (cle, valeurs)
+    return _generations[1]
+
+
+def forget(source: str) -> None:
+    """
+    Supprime l'entrée d'une source du manifeste.
+
+    Args:
+        source (str): Source à oublier.
+    """
+    with _verrou():
+        entries = _lire()
+        if entries.pop(source, None) is not None:
+            _ecrire(entries)
+
+
+def rename(old_source: str, new_source: str, workspace: Optional[str] = None) -> None:
+    """
+    Reporte l'entrée d'une source déplacée sous son nouveau chemin.
+
+    Args:
+        old_source (str): Ancienne source.
+        new_source (str): Nouvelle source.
+        workspace (Optional[str], optional): Nouvel espace de travail. Defaults to None.
+    """
+    with _verrou():
+        entries = _lire()
+        entry = entries.pop(old_source, None)
+        if entry is not None:
+            entry["workspace"] = workspace or ""
+            entries[new_source] = entry
+            _ecrire(entries)
+
+
+def forget_workspace(workspace: str) -> None:
+    """
+    Supprime du manifeste toutes les sources d'un espace de travail.
+
+    Args:
+        workspace (str): Nom de l'espace de travail.
+    """
+    with _verrou():
+        entries = _lire()
+        restantes = {s: e for s, e in entries.items() if e.get("workspace") != workspace}
+        if len(restantes) != len(entries):
+            _ecrire(restantes)
+
+
+def is_up_to_date(entry: Optional[dict], digest: str, config: dict, workspace: Optional[str] = None) -> bool:
+    """
+    Indique si une source déjà indexée correspond encore au fichier sur disque.
+
+    Args:
+        entry (Optional[dict]): Entrée du manifeste pour la source (None si absente).
+        digest (str): Empreinte actuelle du fichier.
+        config (dict): Configuration de segmentation/embedding courante.
+        workspace (Optional[str], optional): Espace de travail courant. Defaults to None.
+
+    Returns:
+        bool: True si la source n'a pas besoin d'être réingérée.
+    """
+    return (
+        entry is not None
+        and entry.get("hash") == digest
+        and entry.get("config") == config
+        and entry.get("workspace", "") == (workspace or "")
+    )
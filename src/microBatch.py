@@ -0,0 +1,94 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+"""
+Regroupement dynamique des appels d'inférence (micro-batching).
+
+Lorsque plusieurs requêtes de chat arrivent en même temps, chacune encodait sa question
+et lançait le reranker séparément, ce qui multiplie les passes avant du modèle.
+Un `MicroBatcher` collecte les demandes concurrentes pendant une courte fenêtre (ou
+jusqu'à une taille maximale), exécute une seule passe sur le lot, puis redistribue
+les résultats à chaque appelant.
+"""
+
+
+class MicroBatcher:
+    """
+    Regroupe les appels concurrents à une fonction de lot dans un thread dédié.
+
+    Attributes:
+        fonction (Callable[[list], list]): Fonction appliquée au lot (un résultat par élément).
+        max_items (int): Nombre maximum d'éléments par lot.
+        fenetre (float): Durée maximale d'attente (en secondes) pour compléter un lot.
+        nom (str): Nom du thread de traitement.
+    """
+
+    def __init__(self, fonction: Callable[[list], list], max_items: int = 64,
+                 fenetre_ms: float = 5.0, nom: str = "micro-batch"):
+        self.fonction = fonction
+        self.max_items = max_items
+        self.fenetre = fenetre_ms / 1000
+        self.nom = nom
+        self._verrou = threading.Lock()
+        self._pid = None
+        self._file = None
+
+    def _demarrer(self) -> None:
+        # Le thread est (re)créé dans chaque processus, y compris après un fork
+        with self._verrou:
+            if self._pid != os.getpid():
+                self._file = queue.Queue()
+                threading.Thread(target=self._boucle, args=(self._file,), name=self.nom, daemon=True).start()
+                self._pid = os.getpid()
+
+    def submit(self, items: list) -> list:
+        """
+        Soumet des éléments et attend leurs résultats, calculés dans un lot partagé.
+
+        Args:
+            items (list): Éléments à traiter.
+
+        Returns:
+            list: Résultats, dans l'ordre des éléments.
+        """
+        if not items:
+            return []
+        if self._pid != os.getpid():
+            self._demarrer()
+        future = Future()
+        self._file.put((list(items), future))
+        return future.result()
+
+    def _boucle(self, file: queue.Queue) -> None:
+        while True:
+            lot = [file.get()]
+            taille = len(lot[0][0])
+            limite = time.monotonic() + self.fenetre
+            while taille < self.max_items:
+                reste = limite - time.monotonic()
+                if reste <= 0:
+                    break
+                try:
+                    demande = file.get(timeout=reste)
+                except queue.Empty:
+                    break
+                lot.append(demande)
+                taille += len(demande[0])
+            self._traiter(lot)
+
+    def _traiter(self, lot: List[tuple]) -> None:
+        elements = [item for items, _ in lot for item in items]
+        try:
+            resultats = list(self.fonction(elements))
+        except Exception as e:
+            for _, future in lot:
+                future.set_exception(e)
+            return
+        debut = 0
+        for items, future in lot:
+            future.set_result(resultats[debut:debut + len(items)])
+            debut += len(items)
@@ -0,0 +1,237 @@
+import threading
+from typing import Callable, Dict
+
+from django.conf import settings
+
+"""
+Registre des modèles partagé par tout le processus.
+
+Les modèles (embedding SentenceTransformer, reranker CrossEncoder) ne sont plus chargés
+à l'import des modules : ils le sont à la première utilisation, une seule fois par
+processus, puis partagés par tous les modules (ingestion, recherche, vues).
+Les commandes qui n'en ont pas besoin (migrate, shell, ...) ne paient donc plus leur
+temps de chargement. `warm_up()` permet de les charger explicitement au démarrage
+d'un serveur (par exemple avant le fork des workers gunicorn avec --preload).
+"""
+
+_modeles: Dict[str, object] = {}
+_verrou = threading.Lock()
+
+
+def _get(nom: str, charger: Callable[[], object]):
+    """
+    Renvoie le modèle `nom`, en le chargeant une seule fois (thread-safe).
+
+    Args:
+        nom (str): Nom du modèle dans le registre.
+        charger (Callable[[], object]): Fonction de chargement du modèle.
+
+    Returns:
+        object: L'instance du modèle.
+    """
+    modele = _modeles.get(nom)
+    if modele is None:
+        with _verrou:
+            modele = _modeles.get(nom)
+            if modele is None:
+                print(f"Chargement du modèle {nom}...")
+                modele = charger()
+                _modeles[nom] = modele
+    return modele
+
+
+def get_embedding_model():
+    """
+    Modèle d'embedding partagé.
+
+    Selon settings.INFERENCE_BACKEND, il s'agit du SentenceTransformer PyTorch ("torch")
+    ou de sa version ONNX Runtime, quantifiée int8 si settings.ONNX_QUANTIZE ("onnx").
+
+    Returns:
+        SentenceTransformer | OnnxEmbedder: Le modèle settings.EMBEDDING_MODEL_NAME.
+    """
+    def charger():
+        if settings.INFERENCE_BACKEND == "onnx":
+            from .onnxBackend import OnnxEmbedder
+            return OnnxEmbedder(settings.EMBEDDING_MODEL_NAME, settings.ONNX_QUANTIZE)
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(settings.EMBEDDING_MODEL_NAME)
+    return _get("embedding", charger)
+
+
+def get_reranker():
+    """
+    Modèle de reranking partagé.
+
+    Selon settings.INFERENCE_BACKEND, il s'agit du CrossEncoder PyTorch ("torch")
+    ou de sa version ONNX Runtime, quantifiée int8 si settings.ONNX_QUANTIZE ("onnx").
+
+    Returns:
+        CrossEncoder | OnnxCrossEncoder: Le modèle settings.RERANKER_MODEL_NAME.
+    """
+    def charger():
+        if settings.INFERENCE_BACKEND == "onnx":
+            from .onnxBackend import OnnxCrossEncoder
+            return OnnxCrossEncoder(settings.RERANKER_MODEL_NAME, settings.ONNX_QUANTIZE)
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(settings.RERANKER_MODEL_NAME)
+    return _get("reranker", charger)
+
+
+def embedding_model_id() -> str:
+    """
+    Identifiant du modèle d'embedding effectivement utilisé (nom + backend).
+
+    Sert de clé aux caches d'embeddings : les vecteurs ONNX/int8 diffèrent légèrement
+    des vecteurs PyTorch et ne doivent pas être mélangés.
+
+    Returns:
+        str: Identifiant du modèle.
+    """
+    if settings.INFERENCE_BACKEND == "onnx":
+        return f"{settings.EMBEDDING_MODEL_NAME}@onnx{'-int8' if settings.ONNX_QUANTIZE else ''}"
+    return settings.EMBEDDING_MODEL_NAME
+
+
+def reranker_model_id() -> str:
+    """
+    Identifiant du reranker effectivement utilisé (nom + backend).
+
+    Sert de clé au cache des scores de reranking.
+
+    Returns:
+        str: Identifiant du modèle.
+    """
+    if settings.INFERENCE_BACKEND == "onnx":
+        return f"{settings.RERANKER_MODEL_NAME}@onnx{'-int8' if settings.ONNX_QUANTIZE else ''}"
+    return settings.RERANKER_MODEL_NAME
+
+
+def warm_up() -> None:
+    """
+    Charge immédiatement tous les modèles du registre.
+    """
+    get_embedding_model()
+    get_reranker()
+
+
+def _encode_lot(textes):
+    return get_embedding_model().encode(list(textes)).tolist()
+
+
+def _rerank_lot(paires):
+    return [float(score) for score in get_reranker().predict(list(paires))]
+
+
+_batchers = {}
+_micro_batching_force = False
+
+
+def activer_micro_batching() -> None:
+    """
+    Active le micro-batching dans ce processus, quel que soit settings.MICRO_BATCHING.
+
+    Utilisé par le service de recherche, qui traite les requêtes dans plusieurs threads.
+    """
+    global _micro_batching_force
+    _micro_batching_force = True
+
+
+def micro_batching_actif() -> bool:
+    """
+    Indique si les appels d'inférence du processus sont regroupés.
+    """
+    return _micro_batching_force or settings.MICRO_BATCHING
+
+
+def _batcher(nom: str, fonction):
+    """
+    Renvoie le regroupeur d'appels (micro-batching) associé à `nom`, créé à la demande.
+    """
+    batcher = _batchers.get(nom)
+    if batcher is None:
+        with _verrou:
+            batcher = _batchers.get(nom)
+            if batcher is None:
+                from .microBatch import MicroBatcher
+                batcher = MicroBatcher(
+                    fonction,
+                    max_items=settings.MICRO_BATCH_MAX_ITEMS,
+                    fenetre_ms=settings.MICRO_BATCH_WINDOW_MS,
+                    nom=f"micro-batch-{nom}",
+                )
+                _batchers[nom] = batcher
+    return batcher
+
+
+_cache_requetes = None
+
+
+def _cache_embeddings_requetes():
+    global _cache_requetes
+    if _cache_requetes is None:
+        from .cacheMemoire import CacheTTL
+        # Les embeddings ne dépendent que du modèle : pas d'expiration
+        _cache_requetes = CacheTTL(settings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES, ttl=float("inf"))
+    return _cache_requetes
+
+
+def encode_queries(textes):
+    """
+    Calcule les embeddings de requêtes avec le modèle partagé.
+
+    Les requêtes déjà encodées (même modèle, même requête normalisée) sont lues dans un
+    cache en mémoire. Si le micro-batching est actif (`micro_batching_actif`), les requêtes
+    concurrentes du processus sont regroupées en une seule passe du modèle.
+
+    Args:
+        textes (List[str]): Requêtes à encoder.
+
+    Returns:
+        List[List[float]]: Embeddings des requêtes.
+    """
+    from .cacheMemoire import normaliser_requete
+
+    textes = list(textes)
+    cache = _cache_embeddings_requetes()
+    modele = embedding_model_id()
+    cles = [(modele, normaliser_requete(texte)) for texte in textes]
+    embeddings = [cache.get(cle) for cle in cles]
+    manquants = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if manquants:
+        a_encoder = [textes[i] for i in manquants]
+        if micro_batching_actif():
+            calcules = _batcher("embedding", _encode_lot).submit(a_encoder)
+        else:
+            calcules = _encode_lot(a_encoder)
+        for i, embedding in zip(manquants, calcules):
+            embeddings[i] = embedding
+            cache.set(cles[i], embedding)
+    return embeddings
+
+
+def rerank(paires):
+    """
+    Calcule les scores de pertinence de couples (requête, document) avec le reranker partagé.
+
+    Si le micro-batching est actif (`micro_batching_actif`), les couples des requêtes
+    concurrentes du processus sont évalués dans un même lot.
+
+    Args:
+        paires (List[List[str]]): Couples [requête, document].
+
+    Returns:
+        List[float]: Scores de pertinence, dans l'ordre des couples.
+    """
+    if micro_batching_actif():
+        return _batcher("reranker", _rerank_lot).submit(list(paires))
+    return _rerank_lot(paires)
+
+
+class RegistryEmbeddingFunction:
+    """
+    Fonction d'embedding compatible ChromaDB s'appuyant sur le modèle du registre.
+    """
+
+    def __call__(self, input):
+        return encode_queries(input)
@@ -0,0 +1,139 @@
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from langchain.schema import Document
+
+from .ingererDonnee import chargeDocuments, index_chunks
+
+"""
+Moteur d'ingestion parallèle de documents.
+
+L'extraction et la segmentation (`chargeDocuments` : OCR, parsing, découpage)
+sont exécutées dans un pool de processus, tandis que le calcul des embeddings et
+l'écriture dans ChromaDB sont réalisés par un unique étage qui détient le modèle.
+Les deux étages communiquent par une file bornée : quand l'étage d'embedding prend
+du retard, les workers ne reçoivent plus de nouveaux fichiers. Les résumés ne sont
+pas générés ici mais par l'étage de résumé (src.resumes), une fois les chunks indexés.
+
+Les processus du pool sont lancés par settings.INGESTION_START_METHOD ("spawn" par
+défaut) : un fork d'un processus où PyTorch/OpenMP ont déjà démarré leurs threads peut
+se bloquer. Le pool est créé avant le thread d'embedding et après la fermeture des
+connexions à la base de données, que les processus ne doivent pas partager.
+"""
+
+_FIN = object()
+
+
+def _charger(cheminDocument: str) -> Tuple[str, List[Document], List[str]]:
+    """
+    Charge et segmente un document dans un processus du pool.
+
+    Args:
+        cheminDocument (str): Chemin vers le document à charger.
+
+    Returns:
+        tuple: (chemin du document, liste des chunks, liste des fichiers ignorés).
+    """
+    chunks, ignored = chargeDocuments([cheminDocument], avec_resume=False)
+    return cheminDocument, chunks, ignored
+
+
+def _initialiser_worker() -> None:
+    """
+    Prépare Django dans un processus du pool (nécessaire avec "spawn" et "forkserver").
+    """
+    if not apps.ready:
+        django.setup()
+
+
+def ingest_parallel(items: Iterable[Tuple[str, Optional[str]]], workers: Optional[int] = None,
+                    queue_size: Optional[int] = None, record_progress=None,
+                    total: Optional[int] = None) -> Dict[str, Tuple[List[Document], List[str]]]:
+    """
+    Ingère plusieurs fichiers en parallélisant l'extraction et la segmentation.
+
+    Les fichiers sont soumis au pool au fur et à mesure que `items` est parcouru
+    (un générateur est accepté), avec au plus deux fichiers en attente par worker.
+    Les chunks produits sont transmis par une file bornée au thread d'embedding,
+    qui les encode par lots et les insère dans ChromaDB.
+
+    Args:
+        items (Iterable[Tuple[str, Optional[str]]]): Couples (chemin du fichier, nom du workspace).
+        workers (Optional[int], optional): Nombre de processus d'extraction. Defaults to settings.INGESTION_WORKERS.
+        queue_size (Optional[int], optional): Taille de la file vers l'étage d'embedding. Defaults to settings.INGESTION_QUEUE_SIZE.
+        record_progress: Objet de suivi de progression (méthode set_progress), mis à jour par fichier. Defaults to None.
+        total (Optional[int], optional): Nombre de fichiers attendus lorsque `items` est un générateur. Defaults to len(items).
+
+    Returns:
+        dict: Pour chaque chemin, un tuple (liste des chunks ingérés, liste des fichiers ignorés).
+    """
+    workers = workers or settings.INGESTION_WORKERS
+    file_attente = queue.Queue(maxsize=queue_size or settings.INGESTION_QUEUE_SIZE)
+    results = {}
+    if total is None:
+        total = len(items) if hasattr(items, "__len__") else 0
+
+    def etage_embedding():
+        try:
+            while True:
+                item = file_attente.get()
+                if item is _FIN:
+                    break
+                fp, workspace, chunks, ignored = item
+                try:
+                    if chunks:
+                        index_chunks(fp, chunks, workspace)
+                except Exception as e:
+                    print(f"⚠️ Erreur lors de l'indexation de {fp} : {e}")
+                    chunks, ignored = [], ignored + [os.path.basename(fp)]
+                results[fp] = (chunks, ignored)
+                if record_progress:
+                    record_progress.set_progress(len(results), max(total, len(results)))
+        finally:
+            # Connexion ouverte par set_progress dans ce thread
+            connections.close_all()
+
+    def transmettre(futures):
+        for future in futures:
+            fp, workspace = pending.pop(future)
+            try:
+                _, chunks, ignored = future.result()
+            except Exception as e:
+                print(f"⚠️ Erreur lors du traitement de {fp} : {e}")
+                chunks, ignored = [], [os.path.basename(fp)]
+            file_attente.put((fp, workspace, chunks, ignored))
+
+    # Les connexions ouvertes ne doivent pas être héritées par les processus du pool
+    connections.close_all()
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(settings.INGESTION_START_METHOD),
+        initializer=_initialiser_worker,
+    )
+    thread = threading.Thread(target=etage_embedding, name="ingestion-embedding", daemon=True)
+    thread.start()
+
+    pending = {}
+    try:
+        with pool:
+            for fp, workspace in items:
+                if len(pending) >= 2 * workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    transmettre(done)
+                pending[pool.submit(_charger, fp)] = (fp, workspace)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                transmettre(done)
+    finally:
+        file_attente.put(_FIN)
+        thread.join()
+
+    return results
@@ -0,0 +1,295 @@
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+from django.conf import settings
+
+"""
+Backend d'inférence CPU via ONNX Runtime.
+
+Ce module exporte le modèle d'embedding (SentenceTransformer) et le reranker (CrossEncoder)
+au format ONNX, avec une quantification dynamique int8 optionnelle, puis les exécute avec
+ONNX Runtime sans charger PyTorch. Les classes exposent la même interface que les modèles
+d'origine (`encode` et `predict`) pour être servies par le registre de modèles.
+La fonction `verifier_parite` compare leurs sorties à celles des modèles PyTorch ; un
+modèle exporté n'est servi qu'une fois sa parité vérifiée (commande `onnx_export`).
+"""
+
+
+def _dossier(model_name: str) -> str:
+    return os.path.join(str(settings.ONNX_MODELS_DIR), model_name.replace("/", "__"))
+
+
+def _chemin_onnx(model_name: str, quantize: bool) -> str:
+    return os.path.join(_dossier(model_name), "model_int8.onnx" if quantize else "model.onnx")
+
+
+def _variante(quantize: bool) -> str:
+    return "int8" if quantize else "fp32"
+
+
+def _exporter(auto_model, sortie, tokenizer, dossier: str, config: dict, paire: bool) -> None:
+    """
+    Exporte un modèle Hugging Face (PyTorch) en ONNX avec des axes dynamiques.
+
+    Args:
+        auto_model (torch.nn.Module): Modèle Hugging Face.
+        sortie (Callable): Extrait le tenseur exporté de la sortie du modèle.
+        tokenizer: Tokenizer du modèle.
+        dossier (str): Dossier d'export.
+        config (dict): Configuration enregistrée avec le modèle (asadi_onnx.json).
+        paire (bool): Le modèle prend des couples de textes (reranker).
+    """
+    import torch
+
+    os.makedirs(dossier, exist_ok=True)
+    exemple = ("requête", "document") if paire else ("texte",)
+    entrees = tokenizer(*[[e] for e in exemple], return_tensors="pt")
+    noms = list(entrees.keys())
+
+    class _EntreesNommees(torch.nn.Module):
+        """
+        Passe les entrées au modèle par nom : l'ordre du tokenizer (input_ids, token_type_ids,
+        attention_mask) n'est pas celui des arguments de BertModel.forward (input_ids,
+        attention_mask, token_type_ids).
+        """
+
+        def __init__(self):
+            super().__init__()
+            self.modele = auto_model
+
+        def forward(self, *args):
+            return sortie(self.modele(**dict(zip(noms, args))))
+
+    auto_model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            _EntreesNommees(),
+            tuple(entrees[n] for n in noms),
+            os.path.join(dossier, "model.onnx"),
+            input_names=noms,
+            output_names=["sortie"],
+            dynamic_axes={**{n: {0: "batch", 1: "sequence"} for n in noms}, "sortie": {0: "batch"}},
+            opset_version=17,
+            # Exporteur par traçage : `dynamic_axes` n'est pas pris en charge par l'exporteur dynamo
+            dynamo=False,
+        )
+    tokenizer.save_pretrained(dossier)
+    config["input_names"] = noms
+    # Aucune variante n'est servie avant la vérification de sa parité (`marquer_parite`)
+    config["parite"] = {}
+    with open(os.path.join(dossier, "asadi_onnx.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f)
+
+
+def _quantifier(dossier: str) -> None:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(
+        os.path.join(dossier, "model.onnx"),
+        os.path.join(dossier, "model_int8.onnx"),
+        weight_type=QuantType.QInt8,
+    )
+
+
+def export_embedding_model(model_name: str, quantize: bool = True) -> str:
+    """
+    Exporte le modèle d'embedding en ONNX (et sa version int8 si demandé).
+
+    Args:
+        model_name (str): Nom du modèle SentenceTransformer.
+        quantize (bool, optional): Produit aussi la version quantifiée int8. Defaults to True.
+
+    Returns:
+        str: Chemin du modèle ONNX à utiliser.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    config = {
+        "max_length": st.max_seq_length,
+        "normalize": any(type(m).__name__ == "Normalize" for m in st),
+    }
+    dossier = _dossier(model_name)
+    # Sortie : le dernier état caché (le pooling est refait côté ONNX Runtime)
+    _exporter(st[0].auto_model, lambda s: s[0], st.tokenizer, dossier, config, paire=False)
+    if quantize:
+        _quantifier(dossier)
+    return _chemin_onnx(model_name, quantize)
+
+
+def export_reranker(model_name: str, quantize: bool = True) -> str:
+    """
+    Exporte le reranker (CrossEncoder) en ONNX (et sa version int8 si demandé).
+
+    Args:
+        model_name (str): Nom du modèle CrossEncoder.
+        quantize (bool, optional): Produit aussi la version quantifiée int8. Defaults to True.
+
+    Returns:
+        str: Chemin du modèle ONNX à utiliser.
+    """
+    from sentence_transformers import CrossEncoder
+
+    ce = CrossEncoder(model_name, device="cpu")
+    config = {"max_length": ce.max_length or 512, "num_labels": ce.config.num_labels}
+
+    dossier = _dossier(model_name)
+    _exporter(ce.model, lambda s: s.logits, ce.tokenizer, dossier, config, paire=True)
+    if quantize:
+        _quantifier(dossier)
+    return _chemin_onnx(model_name, quantize)
+
+
+def _lire_config(model_name: str) -> dict:
+    with open(os.path.join(_dossier(model_name), "asadi_onnx.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def marquer_parite(model_name: str, quantize: bool) -> None:
+    """
+    Enregistre que la parité de la variante exportée a été vérifiée : elle peut être servie.
+    """
+    config = _lire_config(model_name)
+    config.setdefault("parite", {})[_variante(quantize)] = True
+    chemin = os.path.join(_dossier(model_name), "asadi_onnx.json")
+    with open(f"{chemin}.tmp", "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    os.replace(f"{chemin}.tmp", chemin)
+
+
+class _ModeleOnnx:
+    """
+    Base commune : tokenizer Hugging Face + session ONNX Runtime.
+
+    Le modèle n'est jamais exporté à la volée : il doit l'avoir été par la commande
+    `onnx_export`, qui vérifie sa parité avec PyTorch avant de l'autoriser.
+    """
+
+    def __init__(self, model_name: str, quantize: bool, exiger_parite: bool = True):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        chemin = _chemin_onnx(model_name, quantize)
+        if not os.path.exists(chemin):
+            raise RuntimeError(
+                f"Modèle ONNX absent pour {model_name} : lancer `python manage.py onnx_export`."
+            )
+        dossier = _dossier(model_name)
+        self.config = _lire_config(model_name)
+        if exiger_parite and not self.config.get("parite", {}).get(_variante(quantize)):
+            raise RuntimeError(
+                f"Parité ONNX / PyTorch non vérifiée pour {model_name} ({_variante(quantize)}) : "
+                "lancer `python manage.py onnx_export`."
+            )
+        self.tokenizer = AutoTokenizer.from_pretrained(dossier)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if settings.ONNX_THREADS:
+            options.intra_op_num_threads = settings.ONNX_THREADS
+        self.session = ort.InferenceSession(chemin, options, providers=["CPUExecutionProvider"])
+
+    def _run(self, *textes):
+        entrees = self.tokenizer(
+            *textes, padding=True, truncation=True,
+            max_length=self.config["max_length"], return_tensors="np",
+        )
+        feed = {n: entrees[n].astype(np.int64) for n in self.config["input_names"]}
+        return self.session.run(None, feed)[0], entrees["attention_mask"]
+
+
+class OnnxEmbedder(_ModeleOnnx):
+    """
+    Modèle d'embedding exécuté par ONNX Runtime (pooling moyen + normalisation).
+    """
+
+    def __init__(self, model_name: str, quantize: bool = True, exiger_parite: bool = True):
+        super().__init__(model_name, quantize, exiger_parite)
+
+    def encode(self, textes, batch_size: int = 32, **kwargs) -> np.ndarray:
+        """
+        Calcule les embeddings de textes (interface de SentenceTransformer.encode).
+
+        Args:
+            textes (str | List[str]): Texte ou liste de textes.
+            batch_size (int, optional): Taille des lots. Defaults to 32.
+
+        Returns:
+            np.ndarray: Embeddings (un vecteur si un seul texte est fourni).
+        """
+        seul = isinstance(textes, str)
+        textes = [textes] if seul else list(textes)
+        vecteurs = []
+        for start in range(0, len(textes), batch_size):
+            etats, masque = self._run(textes[start:start + batch_size])
+            masque = masque[..., None].astype(np.float32)
+            moyenne = (etats * masque).sum(axis=1) / np.clip(masque.sum(axis=1), 1e-9, None)
+            if self.config["normalize"]:
+                moyenne /= np.clip(np.linalg.norm(moyenne, axis=1, keepdims=True), 1e-12, None)
+            vecteurs.append(moyenne.astype(np.float32))
+        resultat = np.concatenate(vecteurs) if vecteurs else np.zeros((0, 0), dtype=np.float32)
+        return resultat[0] if seul else resultat
+
+
+class OnnxCrossEncoder(_ModeleOnnx):
+    """
+    Reranker exécuté par ONNX Runtime (même activation que CrossEncoder.predict).
+    """
+
+    def __init__(self, model_name: str, quantize: bool = True, exiger_parite: bool = True):
+        super().__init__(model_name, quantize, exiger_parite)
+
+    def predict(self, paires, batch_size: int = 32, **kwargs) -> np.ndarray:
+        """
+        Calcule les scores de couples (requête, document) (interface de CrossEncoder.predict).
+
+        Args:
+            paires (List[List[str]]): Couples [requête, document].
+            batch_size (int, optional): Taille des lots. Defaults to 32.
+
+        Returns:
+            np.ndarray: Scores de pertinence.
+        """
+        paires = list(paires)
+        scores = []
+        for start in range(0, len(paires), batch_size):
+            lot = paires[start:start + batch_size]
+            logits, _ = self._run([p[0] for p in lot], [p[1] for p in lot])
+            if self.config["num_labels"] == 1:
+                scores.append(1 / (1 + np.exp(-logits[:, 0])))
+            else:
+                scores.append(logits)
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+
+def verifier_parite(textes: List[str], paires: List[List[str]], quantize: Optional[bool] = None) -> dict:
+    """
+    Compare les sorties ONNX aux sorties PyTorch des mêmes modèles.
+
+    Args:
+        textes (List[str]): Textes de test pour le modèle d'embedding.
+        paires (List[List[str]]): Couples [requête, document] de test pour le reranker.
+        quantize (Optional[bool], optional): Version ONNX à tester. Defaults to settings.ONNX_QUANTIZE.
+
+    Returns:
+        dict: Similarité cosinus minimale des embeddings, écart absolu maximal des scores
+        de reranking, et indication que l'ordre des scores est identique.
+    """
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+
+    quantize = settings.ONNX_QUANTIZE if quantize is None else quantize
+
+    ref = SentenceTransformer(settings.EMBEDDING_MODEL_NAME, device="cpu").encode(textes, normalize_embeddings=True)
+    onnx = OnnxEmbedder(settings.EMBEDDING_MODEL_NAME, quantize, exiger_parite=False).encode(textes)
+    onnx = onnx / np.linalg.norm(onnx, axis=1, keepdims=True)
+    cosinus = (ref * onnx).sum(axis=1)
+
+    ref_scores = np.asarray(CrossEncoder(settings.RERANKER_MODEL_NAME, device="cpu").predict(paires))
+    onnx_scores = OnnxCrossEncoder(settings.RERANKER_MODEL_NAME, quantize, exiger_parite=False).predict(paires)
+
+    return {
+        "embedding_cosinus_min": float(cosinus.min()),
+        "rerank_ecart_max": float(np.abs(ref_scores - onnx_scores).max()),
+        "rerank_meme_ordre": bool((np.argsort(-ref_scores) == np.argsort(-onnx_scores)).all()),
+    }
@@ -1,4 +1,5 @@
 from typing import List
+from functools import lru_cache
 import os
 import re
 from llama_index.core.schema import Document as LlamaDocument
@@ -53,6 +54,51 @@ def preprocess(text):
     return re.findall(r'\w+', text.lower())
 
 
+# Version de l'analyseur français : toute modification (mots vides, racinisation)
+# doit l'incrémenter pour que l'index BM25 soit reconstruit
+ANALYSEUR_VERSION = 1
+
+MOTS_VIDES_FR = frozenset("""
+a à afin ai aie aient aies ait alors as au aucun aucune aupres auprès aussi autre autres aux avaient avais
+avait avant avec avez aviez avions avoir avons ayant c ça ce ceci cela celle celles celui ces cet cette ceux
+chaque chez ci comme comment d dans de des dès doit donc dont du elle elles en encore entre es est et
+étaient étais était étant été êtes être eu eux fait faire fois font hors il ils j je jusqu jusque l la là
+le les leur leurs lors lui m ma mais me même mêmes mes moi mon n ne ni nos notre nous on ont ou où par parce
+pas peu peut plus pour pourquoi qu quand que quel quelle quelles quels qui quoi s sa sans se selon ses si
+sien soi soit son sont sous suis sur t ta te tes toi ton tous tout toute toutes très tu un une vos votre
+vous y
+""".split())
+
+
+@lru_cache(maxsize=1)
+def _stemmer():
+    from nltk.stem.snowball import SnowballStemmer
+    return SnowballStemmer("french")
+
+
+@lru_cache(maxsize=100_000)
+def _racine(mot: str) -> str:
+    return _stemmer().stem(mot)
+
+
+def analyser(text):
+    """
+    Analyse un texte français pour la recherche par mots-clés.
+    
+    Les mots sont extraits en minuscules (comme `preprocess`), les mots vides
+    sont retirés, puis chaque mot est réduit à sa racine (Snowball français),
+    ce qui raccourcit les listes de postings et rapproche les formes fléchies
+    (« congés » / « congé »).
+    
+    Args:
+        text (str): Le texte à analyser.
+        
+    Returns:
+        List[str]: Liste des termes (racines) du texte.
+    """
+    return [_racine(mot) for mot in preprocess(text) if mot not in MOTS_VIDES_FR]
+
+
 def convert_langchain_to_llama(doc: LangchainDocument) -> LlamaDocument:
     """
     Convertit un document Langchain en document LlamaIndex.
@@ -0,0 +1,130 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+"""
+Profils de recherche et budgets de latence.
+
+Un profil (settings.RETRIEVAL_PROFILES) indique les étapes de la recherche hybride à
+exécuter et le budget de latence d'une requête :
+    - "fast"     : branche vectorielle seule ;
+    - "balanced" : branches vectorielle et BM25 fusionnées par RRF, sans cross-encoder ;
+    - "accurate" : fusion RRF puis reranking par le cross-encoder.
+
+Le coût de chaque étape est suivi par une moyenne mobile exponentielle (EMA). Avant
+une étape optionnelle, si le temps déjà écoulé plus son coût estimé dépasse le budget,
+l'étape est sautée : la requête se dégrade d'elle-même de "accurate" vers "balanced"
+puis "fast" lorsque le serveur est chargé.
+
+Une étape sautée n'est plus mesurée : son coût estimé décroît donc avec le temps écoulé
+depuis sa dernière mesure (demi-vie settings.RETRIEVAL_COST_HALF_LIFE), pour qu'elle
+soit retentée une fois la charge retombée. Les premières exécutions de chaque étape
+dans un processus (chargement des modèles, des matrices BM25) ne sont pas comptées.
+"""
+
+BRANCHE_VECTORIELLE = "vector"
+BRANCHE_MOTS_CLES = "bm25"
+ETAPE_RERANK = "rerank"
+
+
+class CoutsEtapes:
+    """
+    Coûts moyens des étapes de recherche (moyenne mobile exponentielle, en secondes).
+
+    Attributes:
+        alpha (float): Poids de la dernière mesure dans la moyenne.
+        demi_vie (float): Durée (en secondes) au bout de laquelle une estimation qui n'a
+            pas été remesurée est divisée par deux.
+        echauffement (int): Nombre de premières mesures de chaque étape ignorées (démarrage à froid).
+    """
+
+    def __init__(self, alpha: float = 0.2, demi_vie: float = 30.0, echauffement: int = 1):
+        self.alpha = alpha
+        self.demi_vie = demi_vie
+        self.echauffement = echauffement
+        # Par étape : (coût moyen, instant de la dernière mesure)
+        self._couts: Dict[str, Tuple[float, float]] = {}
+        self._ignorees: Dict[str, int] = {}
+        self._verrou = threading.Lock()
+
+    def observer(self, etape: str, duree: float) -> None:
+        """
+        Ajoute la durée mesurée d'une étape à sa moyenne.
+        """
+        with self._verrou:
+            if self._ignorees.get(etape, 0) < self.echauffement:
+                self._ignorees[etape] = self._ignorees.get(etape, 0) + 1
+                return
+            precedent = self._estimation(etape)
+            moyenne = duree if etape not in self._couts else precedent + self.alpha * (duree - precedent)
+            self._couts[etape] = (moyenne, time.monotonic())
+
+    def _estimation(self, etape: str) -> float:
+        cout, instant = self._couts.get(etape, (0.0, 0.0))
+        if not cout or self.demi_vie <= 0:
+            return cout
+        return cout * 0.5 ** ((time.monotonic() - instant) / self.demi_vie)
+
+    def estimation(self, etape: str) -> float:
+        """
+        Coût estimé d'une étape (0 tant qu'elle n'a jamais été mesurée), décroissant depuis sa dernière mesure.
+        """
+        return self._estimation(etape)
+
+
+couts = CoutsEtapes(demi_vie=settings.RETRIEVAL_COST_HALF_LIFE)
+
+
+def get_profil(nom: Optional[str] = None) -> dict:
+    """
+    Profil de recherche `nom` (settings.RETRIEVAL_DEFAULT_PROFILE si None ou inconnu).
+
+    Returns:
+        dict: {"nom", "branches", "rerank", "budget_ms"}.
+    """
+    profils = settings.RETRIEVAL_PROFILES
+    if nom not in profils:
+        if nom:
+            print(f"⚠️ Profil de recherche inconnu : {nom}")
+        nom = settings.RETRIEVAL_DEFAULT_PROFILE
+    return {"nom": nom, **profils[nom]}
+
+
+class Budget:
+    """
+    Budget de latence d'une requête de recherche.
+
+    Attributes:
+        limite (float): Budget total, en secondes.
+        debut (float): Instant de début de la requête (time.monotonic).
+        degradee (bool): Vrai si au moins une étape du profil a été sautée.
+    """
+
+    def __init__(self, budget_ms: float):
+        self.limite = budget_ms / 1000
+        self.debut = time.monotonic()
+        self.degradee = False
+
+    def restant(self) -> float:
+        """
+        Temps restant avant l'épuisement du budget, en secondes.
+        """
+        return self.limite - (time.monotonic() - self.debut)
+
+    def autorise(self, etape: str) -> bool:
+        """
+        Indique si l'étape optionnelle `etape` tient dans le budget restant (sinon la requête est dégradée).
+        """
+        if couts.estimation(etape) <= self.restant():
+            return True
+        print(f"⏱️ Recherche dégradée : étape {etape} sautée (budget de {self.limite * 1000:.0f} ms)")
+        self.degradee = True
+        return False
+
+    def mesurer(self, etape: str, debut: float) -> None:
+        """
+        Enregistre la durée d'une étape commencée à l'instant `debut`.
+        """
+        couts.observer(etape, time.monotonic() - debut)
@@ -0,0 +1,345 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+
+from .baseVectorielle import collection, filtre_metadonnees, index_version
+from .cacheMemoire import CacheTTL, normaliser_requete
+from .ingererDonnee import index_bm25, live_generation_only
+from .modeles import encode_queries
+from . import indexDocuments, indexExact, routageWorkspaces
+from .profilsRecherche import BRANCHE_MOTS_CLES, BRANCHE_VECTORIELLE, ETAPE_RERANK, Budget, get_profil
+from .reranking import Candidat, rerank_candidats
+
+"""
+Recherche hybride (vectorielle + BM25) dans les documents indexés.
+
+Ce module contient le pipeline de recherche utilisé par le chat. Il est exécuté soit
+directement dans le processus Django, soit par le service de recherche autonome
+(src.serviceRecherche), qui détient seul les modèles et le client ChromaDB.
+La branche mots-clés interroge l'index BM25 persistant (src.indexBM25).
+Les deux branches s'exécutent en parallèle dans un pool de threads : la latence de la
+première étape est celle de la branche la plus lente, bornée par son délai maximal.
+En mode hiérarchique (settings.RETRIEVAL_HIERARCHICAL), les branches ne cherchent que
+dans les documents retenus au préalable par l'index de documents (src.indexDocuments).
+Une question posée sans workspace est routée vers les workspaces les plus proches
+(src.routageWorkspaces) si settings.WORKSPACE_ROUTING est actif. Dans les petits
+workspaces, la branche vectorielle fait une recherche exacte (src.indexExact) plutôt
+qu'une recherche HNSW filtrée (settings.EXACT_SEARCH).
+"""
+
+# Résultat d'une branche : (identifiant du chunk, document, métadonnées)
+Resultat = Tuple[str, str, dict]
+
+# Index BM25 complet (None : pas encore vérifié dans ce processus)
+_etat_index_bm25 = None
+
+# Résultats des recherches récentes, par (requête normalisée, workspace, n_results, profil, version de l'index)
+_cache_resultats = CacheTTL(settings.RETRIEVAL_CACHE_MAX_ENTRIES, settings.RETRIEVAL_CACHE_TTL)
+
+
+_pool_branches = {}
+_verrou_pool = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    """
+    Pool de threads des branches de recherche, (re)créé dans chaque processus.
+    """
+    pid = os.getpid()
+    pool = _pool_branches.get(pid)
+    if pool is None:
+        with _verrou_pool:
+            pool = _pool_branches.get(pid)
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=settings.RETRIEVAL_BRANCH_WORKERS,
+                                          thread_name_prefix="recherche")
+                _pool_branches.clear()
+                _pool_branches[pid] = pool
+    return pool
+
+
+def _index_bm25_pret() -> None:
+    """
+    Signale (une fois par processus) un index BM25 jamais rempli en entier à partir de ChromaDB.
+
+    La reconstruction n'a jamais lieu pendant une requête : elle est faite par la commande
+    `index_bm25` ou au démarrage du worker d'ingestion. En attendant, la branche mots-clés
+    ne voit que les chunks indexés depuis la création de l'index.
+    """
+    global _etat_index_bm25
+    if _etat_index_bm25 is None:
+        _etat_index_bm25 = index_bm25.is_complete()
+        if not _etat_index_bm25:
+            print("⚠️ Index BM25 incomplet : lancez `python manage.py index_bm25`.")
+
+
+def recherche_vectorielle(query: str, n_results: int, workspaces: Optional[List[str]] = None,
+                          sources: Optional[List[str]] = None) -> List[Resultat]:
+    """
+    Branche vectorielle : plus proches voisins de l'embedding de la requête dans ChromaDB.
+
+    Returns:
+        List[Resultat]: Triplets (identifiant, document, métadonnées), du plus au moins proche.
+    """
+    query_embedding = encode_queries([query])
+    exacts, hnsw = [], workspaces
+    if settings.EXACT_SEARCH and workspaces is not None:
+        exacts, hnsw = indexExact.exact_workspaces(workspaces)
+    if not exacts:
+        vector_results = collection.query(
+            query_embeddings=query_embedding,
+            n_results=n_results,
+            where=filtre_metadonnees(workspaces, sources)
+        )
+        if not vector_results.get("documents"):
+            return []
+        return list(zip(vector_results["ids"][0], vector_results["documents"][0], vector_results["metadatas"][0]))
+
+    # 🎯 Petits workspaces : recherche exacte ; les autres restent servis par HNSW
+    scores = dict(indexExact.search(query_embedding[0], n_results, exacts, sources))
+    if hnsw:
+        vector_results = collection.query(
+            query_embeddings=query_embedding,
+            n_results=n_results,
+            where=filtre_metadonnees(hnsw, sources),
+            include=["distances"]
+        )
+        if vector_results.get("ids"):
+            # Embeddings normalisés : distance L2 au carré = 2 - 2 x similarité cosinus
+            for cid, distance in zip(vector_results["ids"][0], vector_results["distances"][0]):
+                scores[cid] = 1 - distance / 2
+    top = sorted(scores, key=scores.get, reverse=True)[:n_results]
+    if not top:
+        return []
+    data = collection.get(ids=top, include=["documents", "metadatas"])
+    par_id = {cid: (cid, doc, meta) for cid, doc, meta in zip(data["ids"], data["documents"], data["metadatas"])}
+    return [par_id[cid] for cid in top if cid in par_id]
+
+
+def recherche_mots_cles(query: str, n_results: int, workspaces: Optional[List[str]] = None,
+                        sources: Optional[List[str]] = None) -> List[Resultat]:
+    """
+    Branche mots-clés : meilleurs chunks au sens de BM25 dans les partitions des workspaces.
+
+    Returns:
+        List[Resultat]: Triplets (identifiant, document, métadonnées), du meilleur au moins bon score.
+    """
+    _index_bm25_pret()
+    # Les scores BM25 de partitions différentes (IDF propres à chaque workspace) ne sont pas
+    # comparables : les partitions sont fusionnées par rang, à rang égal dans l'ordre des workspaces
+    resultats = []
+    for ordre, workspace in enumerate(workspaces if workspaces is not None else [None]):
+        resultats.extend(
+            (rang, ordre, cid)
+            for rang, (cid, score) in enumerate(index_bm25.search(query, n_results, workspace=workspace, sources=sources))
+            if score > 0
+        )
+    top_bm25 = [cid for _, _, cid in sorted(resultats)[:n_results]]
+    if not top_bm25:
+        return []
+    data = collection.get(ids=top_bm25, include=["documents", "metadatas"])
+    par_id = {cid: (cid, doc, meta) for cid, doc, meta in zip(data["ids"], data["documents"], data["metadatas"])}
+    return [par_id[cid] for cid in top_bm25 if cid in par_id]
+
+
+def fusion_rrf(branches: List[List[Resultat]], k: Optional[int] = None) -> List[Candidat]:
+    """
+    Fusionne les classements des branches par reciprocal rank fusion (RRF).
+
+    Chaque chunk reçoit la somme de 1 / (k + rang) sur les branches qui le renvoient.
+    Seule la génération la plus récente de chaque source est conservée, et les chunks
+    de même texte ne sont comptés qu'une fois.
+
+    Args:
+        branches (List[List[Resultat]]): Résultats de chaque branche, du meilleur au moins bon.
+        k (Optional[int], optional): Constante de lissage des rangs. Defaults to settings.RRF_K.
+
+    Returns:
+        List[Candidat]: Candidats (identifiant, document, métadonnées, score) par score décroissant.
+    """
+    k = k or settings.RRF_K
+    tous = [resultat for branche in branches for resultat in branche]
+    # 🔗 Ne garder que la dernière génération de chaque source
+    gardes = {cid for cid, _ in live_generation_only([(cid, meta) for cid, _, meta in tous])}
+
+    scores, chunks, par_texte = {}, {}, {}
+    for branche in branches:
+        for rang, (cid, doc, meta) in enumerate(branche, start=1):
+            if cid not in gardes:
+                continue
+            cid = par_texte.setdefault(doc, cid)
+            chunks.setdefault(cid, (doc, meta))
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rang)
+
+    ordre = sorted(scores, key=scores.get, reverse=True)
+    return [(cid, chunks[cid][0], chunks[cid][1], scores[cid]) for cid in ordre]
+
+
+def documents_candidats(query: str, workspaces: Optional[List[str]] = None) -> Optional[List[str]]:
+    """
+    Première étape de la recherche hiérarchique : documents les plus proches de la requête.
+
+    Args:
+        query (str): La requête.
+        workspaces (Optional[List[str]], optional): Limite la recherche à ces workspaces. Defaults to None.
+
+    Returns:
+        Optional[List[str]]: Sources retenues, ou None pour une recherche à plat
+        (index de documents vide ou indisponible).
+    """
+    try:
+        sources = indexDocuments.top_sources(
+            encode_queries([query])[0], settings.HIERARCHICAL_TOP_DOCUMENTS, workspaces
+        )
+    except Exception as e:
+        print(f"⚠️ Index de documents indisponible, recherche à plat : {e}")
+        return None
+    return sources or None
+
+
+def workspaces_cibles(query: str, workspace: Optional[str] = None) -> Optional[List[str]]:
+    """
+    Workspaces dans lesquels chercher : celui choisi par l'utilisateur, sinon ceux
+    retenus par le routage (settings.WORKSPACE_ROUTING), sinon tous (None).
+    """
+    if workspace:
+        return [workspace]
+    if not settings.WORKSPACE_ROUTING:
+        return None
+    try:
+        return routageWorkspaces.route(encode_queries([query])[0])
+    except Exception as e:
+        print(f"⚠️ Routage des workspaces indisponible, recherche globale : {e}")
+        return None
+
+
+def executer_branches(fonctions: dict, query: str, n_results: int, workspaces: Optional[List[str]],
+                      budget: Budget, sources: Optional[List[str]] = None) -> List[List[Resultat]]:
+    """
+    Exécute les branches de recherche en parallèle et attend leurs résultats.
+
+    Chaque branche dispose de son délai (settings.RETRIEVAL_BRANCH_TIMEOUTS_MS, compté depuis
+    le début de son exécution, et non depuis sa soumission : l'attente dans la file du pool
+    ne la pénalise pas) ; une branche trop lente ou en erreur est abandonnée et la requête
+    est alors marquée comme dégradée. L'attente dans la file est elle-même bornée par le
+    délai de la branche, sauf pour la branche vectorielle, indispensable, qui n'est jamais
+    abandonnée avant d'avoir démarré. La durée d'une branche abandonnée n'entre pas dans
+    les coûts moyens des étapes.
+
+    Args:
+        fonctions (dict): Fonctions de recherche, par nom de branche.
+        query (str): La requête.
+        n_results (int): Nombre de résultats par branche.
+        workspaces (Optional[List[str]]): Workspaces dans lesquels chercher (None : tous).
+        budget (Budget): Budget de latence de la requête.
+        sources (Optional[List[str]], optional): Limite la recherche à ces sources. Defaults to None.
+
+    Returns:
+        List[List[Resultat]]: Résultats des branches terminées à temps.
+    """
+    debuts = {nom: [threading.Event(), None] for nom in fonctions}
+    abandonnees = set()
+    verrou = threading.Lock()
+
+    def executer(nom, fonction):
+        debut = time.monotonic()
+        debuts[nom][1] = debut
+        debuts[nom][0].set()
+        resultat = fonction(query, n_results, workspaces, sources)
+        with verrou:
+            if nom not in abandonnees:
+                budget.mesurer(nom, debut)
+        return resultat
+
+    futures = {nom: _pool().submit(executer, nom, fonction) for nom, fonction in fonctions.items()}
+    branches = []
+    for nom, future in futures.items():
+        delai = settings.RETRIEVAL_BRANCH_TIMEOUTS_MS.get(nom)
+        try:
+            if delai is None:
+                branches.append(future.result())
+                continue
+            # Attente dans la file du pool bornée par le délai de la branche (sans limite
+            # pour la branche vectorielle) ; une branche qui démarre entre-temps n'est plus
+            # annulable et dispose alors de tout son délai
+            attente = None if nom == BRANCHE_VECTORIELLE else delai / 1000
+            if not debuts[nom][0].wait(timeout=attente) and future.cancel():
+                raise FuturesTimeoutError()
+            debuts[nom][0].wait()
+            restant = max(0.0, debuts[nom][1] + delai / 1000 - time.monotonic())
+            branches.append(future.result(timeout=restant))
+        except FuturesTimeoutError:
+            with verrou:
+                abandonnees.add(nom)
+            print(f"⏱️ Branche de recherche {nom} abandonnée (délai de {delai} ms dépassé)")
+            budget.degradee = True
+        except Exception as e:
+            print(f"⚠️ Erreur dans la branche de recherche {nom} : {e}")
+            budget.degradee = True
+    return branches
+
+
+def hybrid_retrieve(query, n_results=8, workspace=None, profil=None):
+    """
+    Effectue une recherche hybride (vectorielle et par mots-clés) sur les documents indexés.
+
+    Cette fonction combine une recherche vectorielle (sémantique) et une recherche par mots-clés (BM25),
+    fusionnées par RRF, pour trouver les documents les plus pertinents par rapport à la requête.
+    Les meilleurs candidats sont ensuite réordonnés par un modèle de reranking (src.reranking).
+    Les étapes exécutées dépendent du profil de recherche et de son budget de latence
+    (src.profilsRecherche).
+
+    Args:
+        query (str): La requête de recherche de l'utilisateur.
+        n_results (int, optional): Nombre de résultats à retourner. Defaults to 8.
+        workspace (str, optional): Filtre par espace de travail. Defaults to None.
+        profil (str, optional): "fast", "balanced" ou "accurate". Defaults to settings.RETRIEVAL_DEFAULT_PROFILE.
+
+    Returns:
+        list: Liste de tuples (document, métadonnées) des documents les plus pertinents.
+    """
+    profil = get_profil(profil)
+    # Toute écriture dans l'index change sa version : une entrée du cache n'est jamais périmée
+    cle = (normaliser_requete(query), workspace or None, n_results, profil["nom"], index_version())
+    if settings.RETRIEVAL_CACHE_TTL > 0:
+        resultats = _cache_resultats.get(cle)
+        if resultats is not None:
+            return list(resultats)
+
+    budget = Budget(profil["budget_ms"])
+
+    # 🧭 Workspace choisi, ou workspaces les plus proches d'une question posée sans workspace
+    workspaces = workspaces_cibles(query, workspace)
+
+    # 📚 Recherche hiérarchique : documents les plus proches, puis chunks de ces documents
+    sources = documents_candidats(query, workspaces) if settings.RETRIEVAL_HIERARCHICAL else None
+
+    # 🔍 Recherche vectorielle (toujours exécutée) et mots-clés (si le profil la prévoit
+    # et que le budget le permet), en parallèle
+    fonctions = {BRANCHE_VECTORIELLE: recherche_vectorielle}
+    if BRANCHE_MOTS_CLES in profil["branches"] and budget.autorise(BRANCHE_MOTS_CLES):
+        fonctions[BRANCHE_MOTS_CLES] = recherche_mots_cles
+        # Partition BM25 périmée servie pendant son rechargement : le résultat ne correspond
+        # pas encore à la version de l'index de la clé et n'est pas mis en cache
+        if not index_bm25.is_fresh(workspaces):
+            budget.degradee = True
+    branches = executer_branches(fonctions, query, n_results, workspaces, budget, sources)
+
+    # 🔗 Fusion RRF
+    candidats = fusion_rrf(branches)
+
+    # 🔁 Reranking (candidats bornés, scores en cache, sauté si la sélection est déjà nette)
+    if profil["rerank"] and candidats and budget.autorise(ETAPE_RERANK):
+        debut = time.monotonic()
+        candidats = rerank_candidats(query, candidats)
+        budget.mesurer(ETAPE_RERANK, debut)
+    top_chunks = [(doc, meta) for _, doc, meta, _ in candidats[:settings.RETRIEVAL_TOP_K]]
+
+    # Un résultat dégradé (serveur chargé, partition BM25 périmée) n'est pas mis en cache
+    if settings.RETRIEVAL_CACHE_TTL > 0 and not budget.degradee:
+        _cache_resultats.set(cle, top_chunks)
+    return list(top_chunks)
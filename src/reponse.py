@@ -1,14 +1,20 @@
-import chromadb
+from decouple import config
 from api import reponseAssistant, pimp
 from sentence_transformers import SentenceTransformer
+from baseVectorielle import creer_client
 
 """
 Ce document python permet de poser une question. Prendre cette question et la donner à la base de donnée pour trouver les chunks associés.
 Pour construire la réponse on donne au LLM la question et les chunks.
 """
 
-# On se connecte à la bdd vectorielle 
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
+# On se connecte à la bdd vectorielle (base embarquée ou serveur Chroma, comme le site)
+chroma_client = creer_client(
+    config("CHROMA_MODE", default="persistent"),
+    path="./chroma_db",
+    host=config("CHROMA_SERVER_HOST", default="127.0.0.1"),
+    port=config("CHROMA_SERVER_PORT", default=8001, cast=int),
+)
 collection = chroma_client.get_collection("asadi_collection") # ici une collection c'est plus ou moins une table en sql 
 
 # Chargement du modèle d'embedding pour la recherche sémantique
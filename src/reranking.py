@@ -0,0 +1,136 @@
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .baseVectorielle import collection
+from .cacheMemoire import normaliser_requete
+from .cachePersistant import CachePersistant, cle_hash
+from .modeles import encode_queries, rerank, reranker_model_id
+
+"""
+Étage de reranking (cross-encoder) de la recherche hybride.
+
+Le cross-encoder est le coût CPU principal d'une question. Cet étage :
+    - ne reclasse que les `max_candidats` meilleurs candidats de la première étape
+      (ordonnés par score fusionné) ;
+    - réutilise les scores déjà calculés, conservés dans un cache persistant indexé par
+      (modèle, requête normalisée, identifiant et texte du chunk) ;
+    - saute le cross-encoder lorsque les `top_k` premiers candidats se détachent déjà
+      nettement des suivants par leur similarité cosinus avec la requête. Les scores RRF,
+      trop resserrés (1 / (k + rang)), ne le permettent pas ; la similarité est calculée
+      pour tous les candidats, y compris ceux venus de la seule branche mots-clés, à partir
+      des embeddings déjà stockés dans ChromaDB.
+
+Un candidat est un tuple (identifiant du chunk, document, métadonnées, score fusionné).
+"""
+
+Candidat = Tuple[str, str, dict, float]
+
+rerank_cache = CachePersistant(settings.RERANK_CACHE_PATH, settings.RERANK_CACHE_MAX_ENTRIES)
+
+
+def separation_nette(similarites: Sequence[float], top_k: int, marge: float) -> bool:
+    """
+    Indique si les `top_k` premiers candidats se détachent nettement des suivants.
+
+    La séparation est nette lorsque le moins proche des `top_k` premiers dépasse d'au
+    moins `marge` le plus proche des suivants. Avec `top_k` candidats ou moins, le
+    reranking ne change pas la sélection mais son ordre : il n'est pas sauté.
+
+    Args:
+        similarites (Sequence[float]): Similarités cosinus des candidats avec la requête, dans l'ordre de la première étape.
+        top_k (int): Nombre de résultats conservés.
+        marge (float): Écart minimal de similarité (0 désactive le test).
+
+    Returns:
+        bool: True si le reranking ne changerait pas les `top_k` résultats retenus.
+    """
+    if marge <= 0 or len(similarites) <= top_k:
+        return False
+    return min(similarites[:top_k]) - max(similarites[top_k:]) >= marge
+
+
+def _similarites(query: str, candidats: List[Candidat]) -> List[float]:
+    """
+    Similarités cosinus entre la requête et les candidats (embeddings lus dans ChromaDB).
+    """
+    requete = np.asarray(encode_queries([query])[0], dtype=np.float32)
+    requete /= max(float(np.linalg.norm(requete)), 1e-12)
+    data = collection.get(ids=[c[0] for c in candidats], include=["embeddings"])
+    par_id = dict(zip(data["ids"], data["embeddings"]))
+    similarites = []
+    for cid, _, _, _ in candidats:
+        embedding = par_id.get(cid)
+        if embedding is None:
+            # Chunk supprimé entre-temps : le plus éloigné possible
+            similarites.append(-1.0)
+            continue
+        embedding = np.asarray(embedding, dtype=np.float32)
+        similarites.append(float(embedding @ requete) / max(float(np.linalg.norm(embedding)), 1e-12))
+    return similarites
+
+
+def _scores_cross_encoder(query: str, candidats: List[Candidat]) -> List[float]:
+    """
+    Scores du cross-encoder pour les candidats, lus dans le cache lorsque c'est possible.
+    """
+    modele = reranker_model_id()
+    requete = normaliser_requete(query)
+    cles = [cle_hash(modele, requete, cid, doc) for cid, doc, _, _ in candidats]
+    try:
+        trouves = rerank_cache.get_many(cles)
+    except Exception as e:
+        print(f"⚠️ Cache de reranking indisponible : {e}")
+        trouves = {}
+
+    scores: Dict[str, float] = {cle: struct.unpack("<d", valeur)[0] for cle, valeur in trouves.items()}
+    manquants = [i for i, cle in enumerate(cles) if cle not in scores]
+    if manquants:
+        calcules = rerank([[query, candidats[i][1]] for i in manquants])
+        nouveaux = []
+        for i, score in zip(manquants, calcules):
+            scores[cles[i]] = float(score)
+            nouveaux.append((cles[i], struct.pack("<d", float(score))))
+        try:
+            rerank_cache.set_many(nouveaux)
+        except Exception as e:
+            print(f"⚠️ Erreur mise à jour du cache de reranking : {e}")
+    return [scores[cle] for cle in cles]
+
+
+def rerank_candidats(query: str, candidats: List[Candidat], top_k: Optional[int] = None,
+                     max_candidats: Optional[int] = None, marge: Optional[float] = None) -> List[Candidat]:
+    """
+    Reclasse les candidats de la première étape avec le cross-encoder.
+
+    Args:
+        query (str): La requête.
+        candidats (List[Candidat]): Candidats triés par score fusionné décroissant.
+        top_k (Optional[int], optional): Nombre de résultats renvoyés. Defaults to settings.RETRIEVAL_TOP_K.
+        max_candidats (Optional[int], optional): Nombre maximum de candidats reclassés. Defaults to settings.RERANK_MAX_CANDIDATES.
+        marge (Optional[float], optional): Écart de similarité cosinus au-delà duquel le
+            cross-encoder est sauté (0 : jamais). Defaults to settings.RERANK_SKIP_MARGIN.
+
+    Returns:
+        List[Candidat]: Les `top_k` meilleurs candidats, du plus au moins pertinent.
+    """
+    top_k = top_k or settings.RETRIEVAL_TOP_K
+    max_candidats = max_candidats or settings.RERANK_MAX_CANDIDATES
+    marge = settings.RERANK_SKIP_MARGIN if marge is None else marge
+    if not candidats:
+        return []
+
+    candidats = candidats[:max_candidats]
+    if marge > 0 and len(candidats) > top_k:
+        try:
+            if separation_nette(_similarites(query, candidats), top_k, marge):
+                return candidats[:top_k]
+        except Exception as e:
+            print(f"⚠️ Similarités indisponibles, reranking complet : {e}")
+
+    scores = _scores_cross_encoder(query, candidats)
+    # Tri stable : à score égal, l'ordre de la première étape est conservé
+    ordre = sorted(range(len(candidats)), key=lambda i: scores[i], reverse=True)
+    return [candidats[i] for i in ordre[:top_k]]
@@ -0,0 +1,111 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+
+from .api import resumeDocumentLong
+from .baseVectorielle import bump_index_version
+from .ingererDonnee import collection, encode_chunks, index_bm25, summary_id
+
+"""
+Étage de résumé des documents.
+
+Les résumés ne sont plus générés pendant l'ingestion : les chunks d'un document sont
+indexés (et donc consultables) immédiatement, puis le chunk de résumé
+(`is_summary=True`, `chunk_index=-1`) est produit ensuite par cet étage, à partir
+du texte déjà stocké dans ChromaDB. Un résumé en échec peut ainsi être relancé
+sans réingérer le document.
+"""
+
+
+def texte_source(source: str) -> Tuple[str, str]:
+    """
+    Reconstitue le texte d'un document à partir de ses chunks indexés.
+
+    Les chunks sont remis dans l'ordre ; lorsque leur position (`start_index`) est connue,
+    le chevauchement entre chunks consécutifs est retiré.
+
+    Args:
+        source (str): Source du document.
+
+    Returns:
+        tuple: (texte du document, nom du workspace stocké dans les métadonnées).
+    """
+    data = collection.get(where={"source": source}, include=["documents", "metadatas"])
+    chunks = [
+        (meta, doc) for doc, meta in zip(data["documents"], data["metadatas"])
+        if not meta.get("is_summary")
+    ]
+    chunks.sort(key=lambda c: (c[0].get("start_index", -1), c[0].get("chunk_index", 0)))
+
+    morceaux = []
+    fin = 0
+    for meta, doc in chunks:
+        start = meta.get("start_index")
+        if isinstance(start, int) and start >= 0:
+            if start + len(doc) <= fin:
+                continue
+            morceaux.append(doc[max(0, fin - start):])
+            fin = start + len(doc)
+        else:
+            morceaux.append(doc)
+    workspace = chunks[0][0].get("workspace", "") if chunks else ""
+    return "\n".join(morceaux), workspace
+
+
+def summarize_source(source: str) -> None:
+    """
+    Génère et indexe le chunk de résumé d'une source déjà ingérée.
+
+    Args:
+        source (str): Source du document.
+
+    Raises:
+        ValueError: Si la source n'a aucun chunk indexé.
+        RuntimeError: Si le LLM n'a pas renvoyé de résumé.
+    """
+    texte, workspace = texte_source(source)
+    if not texte.strip():
+        raise ValueError(f"Aucun chunk indexé pour {source}")
+
+    resume = resumeDocumentLong(texte)
+    if not resume:
+        raise RuntimeError(f"Résumé indisponible pour {source}")
+
+    metadata = {"source": source, "workspace": workspace, "chunk_index": -1, "is_summary": True}
+    collection.upsert(
+        ids=[summary_id(source)],
+        documents=[resume],
+        metadatas=[metadata],
+        embeddings=encode_chunks([resume]),
+    )
+    index_bm25.add([summary_id(source)], [resume], [metadata])
+    bump_index_version()
+
+
+def summarize_sources(sources: Iterable[str], max_workers: Optional[int] = None) -> Dict[str, Optional[str]]:
+    """
+    Génère les résumés de plusieurs sources avec un nombre borné d'appels LLM simultanés.
+
+    Args:
+        sources (Iterable[str]): Sources à résumer.
+        max_workers (Optional[int], optional): Appels LLM simultanés. Defaults to settings.SUMMARY_MAX_CONCURRENT.
+
+    Returns:
+        dict: Pour chaque source, None en cas de succès ou le message d'erreur.
+    """
+    sources = list(sources)
+    resultats = {}
+
+    def traiter(source):
+        try:
+            summarize_source(source)
+            return source, None
+        except Exception as e:
+            print(f"⚠️ Erreur lors du résumé de {source} : {e}")
+            return source, str(e) or e.__class__.__name__
+
+    with ThreadPoolExecutor(max_workers=max_workers or settings.SUMMARY_MAX_CONCURRENT) as pool:
+        for source, erreur in pool.map(traiter, sources):
+            resultats[source] = erreur
+    return resultats
@@ -0,0 +1,78 @@
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from . import indexDocuments
+from .baseVectorielle import index_version
+
+"""
+Routage des questions sans workspace vers les workspaces les plus pertinents.
+
+Chaque workspace est représenté par un centroïde : la moyenne des centroïdes de ses
+documents (src.indexDocuments), pondérée par leur nombre de chunks. Une question posée
+sans workspace est comparée (produit scalaire) à ces centroïdes et la recherche hybride
+n'est exécutée que sur les workspaces retenus, au lieu de toute la collection.
+Les centroïdes sont recalculés lorsque la version de l'index change, soit une fois par
+source ingérée (le centroïde d'une source est mis à jour à la fin de son ingestion).
+"""
+
+_verrou = threading.Lock()
+_centroides = {"version": None, "noms": [], "matrice": None}
+
+
+def centroides_workspaces() -> Tuple[List[str], Optional[np.ndarray]]:
+    """
+    Centroïdes normalisés des workspaces (les documents sans workspace forment le workspace "").
+
+    Returns:
+        tuple: (noms des workspaces, matrice des centroïdes, une ligne par workspace).
+    """
+    version = index_version()
+    if _centroides["version"] == version:
+        return _centroides["noms"], _centroides["matrice"]
+    with _verrou:
+        if _centroides["version"] != version:
+            metadatas, vecteurs = indexDocuments.centroids()
+            noms, matrice = [], None
+            if len(metadatas):
+                poids = np.array([meta.get("n_chunks", 1) for meta in metadatas], dtype=np.float32)
+                noms = sorted({meta.get("workspace", "") for meta in metadatas})
+                position = {nom: i for i, nom in enumerate(noms)}
+                lignes = np.array([position[meta.get("workspace", "")] for meta in metadatas])
+                matrice = np.zeros((len(noms), vecteurs.shape[1]), dtype=np.float32)
+                np.add.at(matrice, lignes, vecteurs * poids[:, None])
+                matrice /= np.clip(np.linalg.norm(matrice, axis=1, keepdims=True), 1e-12, None)
+            _centroides.update(version=version, noms=noms, matrice=matrice)
+        return _centroides["noms"], _centroides["matrice"]
+
+
+def route(query_embedding: List[float], n: Optional[int] = None,
+          marge: Optional[float] = None) -> Optional[List[str]]:
+    """
+    Workspaces vers lesquels router une question posée sans workspace.
+
+    Args:
+        query_embedding (List[float]): Embedding de la requête.
+        n (Optional[int], optional): Nombre maximum de workspaces. Defaults to settings.WORKSPACE_ROUTING_TOP.
+        marge (Optional[float], optional): Écart de similarité maximal avec le meilleur workspace
+            pour être retenu. Defaults to settings.WORKSPACE_ROUTING_MARGIN.
+
+    Returns:
+        Optional[List[str]]: Workspaces retenus, du plus au moins proche, ou None s'il n'y a
+        pas lieu de router (pas plus de workspaces que `n`, index vide).
+    """
+    n = n or settings.WORKSPACE_ROUTING_TOP
+    marge = settings.WORKSPACE_ROUTING_MARGIN if marge is None else marge
+    noms, matrice = centroides_workspaces()
+    if matrice is None or len(noms) <= n:
+        return None
+
+    requete = np.asarray(query_embedding, dtype=np.float32)
+    requete /= max(float(np.linalg.norm(requete)), 1e-12)
+    similarites = matrice @ requete
+    meilleurs = np.argpartition(-similarites, n - 1)[:n]
+    meilleurs = meilleurs[np.argsort(-similarites[meilleurs])]
+    seuil = similarites[meilleurs[0]] - marge
+    return [noms[i] for i in meilleurs if similarites[i] >= seuil]
@@ -0,0 +1,172 @@
+import http.client
+import json
+import os
+import socket
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+
+"""
+Service de recherche autonome.
+
+Chaque worker gunicorn qui importait le pipeline de recherche chargeait ses propres
+modèles (embedding, reranker) et ouvrait son propre client ChromaDB sur les mêmes
+fichiers. Ce module permet de faire tourner la recherche dans un processus unique
+(commande `service_recherche`), exposé en HTTP local sur un port TCP ou sur une
+socket Unix, et fournit le client léger utilisé par les vues.
+
+Protocole :
+    POST /retrieve  {"query": ..., "n_results": 8, "workspace": null, "profil": null}
+                    -> {"chunks": [[document, métadonnées], ...]}
+    GET  /health    -> {"status": "ok"}
+
+Adresses acceptées (settings.RETRIEVAL_SERVICE_URL) :
+    "http://127.0.0.1:8765" ou "unix:///chemin/vers/recherche.sock"
+"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Sur une socket Unix, client_address est une chaîne vide
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def _repondre(self, code: int, contenu: dict) -> None:
+        corps = json.dumps(contenu, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._repondre(200, {"status": "ok"})
+        else:
+            self._repondre(404, {"error": "Ressource inconnue"})
+
+    def do_POST(self):
+        if self.path != "/retrieve":
+            self._repondre(404, {"error": "Ressource inconnue"})
+            return
+        try:
+            longueur = int(self.headers.get("Content-Length", 0))
+            demande = json.loads(self.rfile.read(longueur) or b"{}")
+            query = demande["query"]
+        except (ValueError, KeyError) as e:
+            self._repondre(400, {"error": f"Requête invalide : {e}"})
+            return
+        try:
+            from .recherche import hybrid_retrieve
+            chunks = hybrid_retrieve(
+                query,
+                n_results=int(demande.get("n_results", 8)),
+                workspace=demande.get("workspace"),
+                profil=demande.get("profil"),
+            )
+        except Exception as e:
+            print(f"⚠️ Erreur lors de la recherche : {e}")
+            self._repondre(500, {"error": str(e)})
+            return
+        self._repondre(200, {"chunks": [[doc, meta] for doc, meta in chunks]})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+        os.chmod(self.server_address, 0o660)
+
+
+def _adresse(url: str) -> Tuple[str, object]:
+    """
+    Décode l'adresse du service.
+
+    Args:
+        url (str): "http://hôte:port" ou "unix:///chemin".
+
+    Returns:
+        tuple: ("unix", chemin) ou ("tcp", (hôte, port)).
+    """
+    parties = urlsplit(url)
+    if parties.scheme == "unix":
+        return "unix", parties.path
+    if parties.scheme == "http":
+        return "tcp", (parties.hostname or "127.0.0.1", parties.port or 80)
+    raise ValueError(f"Adresse du service de recherche non supportée : {url}")
+
+
+def serve(url: str) -> None:
+    """
+    Démarre le service de recherche et traite les requêtes jusqu'à interruption.
+
+    Args:
+        url (str): Adresse d'écoute ("http://hôte:port" ou "unix:///chemin").
+    """
+    mode, adresse = _adresse(url)
+    serveur = _UnixHTTPServer(adresse, _Handler) if mode == "unix" else ThreadingHTTPServer(adresse, _Handler)
+    try:
+        serveur.serve_forever()
+    finally:
+        serveur.server_close()
+        if mode == "unix" and os.path.exists(adresse):
+            os.unlink(adresse)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, chemin: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.chemin = chemin
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.chemin)
+
+
+def remote_retrieve(url: str, query: str, n_results: int = 8, workspace: Optional[str] = None,
+                    profil: Optional[str] = None, timeout: Optional[float] = None) -> List[tuple]:
+    """
+    Interroge le service de recherche (client léger utilisé par les vues).
+
+    Args:
+        url (str): Adresse du service ("http://hôte:port" ou "unix:///chemin").
+        query (str): La requête de recherche.
+        n_results (int, optional): Nombre de résultats par branche. Defaults to 8.
+        workspace (Optional[str], optional): Filtre par espace de travail. Defaults to None.
+        profil (Optional[str], optional): Profil de recherche. Defaults to None (profil par défaut du service).
+        timeout (Optional[float], optional): Délai maximal (en secondes). Defaults to None.
+
+    Returns:
+        list: Liste de tuples (document, métadonnées), comme `hybrid_retrieve`.
+
+    Raises:
+        OSError: Si le service est injoignable.
+        http.client.HTTPException: Si le service coupe la connexion ou renvoie une réponse tronquée.
+        RuntimeError: Si le service renvoie une erreur.
+    """
+    mode, adresse = _adresse(url)
+    if mode == "unix":
+        connexion = _UnixHTTPConnection(adresse, timeout=timeout)
+    else:
+        connexion = http.client.HTTPConnection(*adresse, timeout=timeout)
+    corps = json.dumps({"query": query, "n_results": n_results, "workspace": workspace, "profil": profil})
+    try:
+        connexion.request("POST", "/retrieve", body=corps.encode("utf-8"),
+                          headers={"Content-Type": "application/json"})
+        reponse = connexion.getresponse()
+        contenu = json.loads(reponse.read() or b"{}")
+    finally:
+        connexion.close()
+    if reponse.status != 200:
+        raise RuntimeError(contenu.get("error") or f"HTTP {reponse.status}")
+    return [(doc, meta) for doc, meta in contenu["chunks"]]
@@ -7,6 +7,10 @@ import re
 Ce fichier python contient l'ensemble des fonctions qui permettent de séparer les chaines de caractères extraites des différents documents.
 """
 
+# Version des règles de découpage : à incrémenter à chaque modification des fonctions
+# ci-dessous (tailles, chevauchements, séparateurs) pour forcer la réingestion des sources.
+CHUNKING_VERSION = 1
+
 def split_base(doc):
     """
     Fonction de base pour découper un document en chunks.